@@ -0,0 +1,221 @@
+import numpy as np
+
+from cache import memoize
+from optional import require
+from spatial import pairs_within
+from structure import get_structure, hetero_records, structure_format, structure_key
+
+# ----------------------
+# Ligand & Active Site Analysis
+# ----------------------
+LIGAND_TYPES = ['ion', 'monodentate', 'polydentate']
+POLYDENTATE_ATOMS = ['OXT', 'ND1', 'NE2']
+CATALYTIC_RESIDUES = ['HIS', 'ASP', 'GLU', 'SER', 'CYS', 'LYS', 'TYR', 'ARG']
+
+def has_polydentate_properties(atoms):
+    """Simplified polydentate detection per residue (customize as needed)"""
+    return atoms.residue_has_atom(POLYDENTATE_ATOMS)
+
+def classify_ligand(atoms):
+    """Enhanced ligand classification from VTK logic and research, one label per residue"""
+    labels = np.full(atoms.n_residues, 'monodentate', dtype=object)
+    labels[has_polydentate_properties(atoms)] = 'polydentate'
+    labels[np.char.str_len(atoms.residue_names) <= 2] = 'ion'
+    return labels
+
+def ligands_from_atoms(atoms):
+    """Bucket every hetero residue of an AtomTable into ion/monodentate/polydentate"""
+    ligands = {ligand_type: [] for ligand_type in LIGAND_TYPES}
+    hetero = np.flatnonzero(atoms.residue_hetflags != b' ')
+    labels = classify_ligand(atoms)[hetero]
+    resnames = atoms.residue_names[hetero]
+    chains = atoms.residue_chains[hetero]
+    resnums = atoms.residue_numbers[hetero]
+    for ligand_type, resname, chain, resnum in zip(labels, resnames, chains, resnums):
+        if ligand_type == 'ion':
+            ligands['ion'].append(resname.decode())
+        else:
+            ligands[ligand_type].append({
+                'resname': resname.decode(),
+                'chain': chain.decode(),
+                'resnum': int(resnum),
+                'type': ligand_type
+            })
+    return ligands
+
+@memoize(key=structure_key)
+def extract_ligands(pdb_data):
+    """VTK-inspired ligand processing with classification
+
+    Streams HETATM records alone instead of parsing the whole file. Only hetero
+    residues can be ligands, so ATOM records (including C-terminal OXT
+    atoms, which belong to standard residues) never influence the result.
+    mmCIF, BinaryCIF and file structures are classified from their AtomTable.
+    """
+    if not isinstance(pdb_data, str) or structure_format(pdb_data) != 'pdb':
+        return ligands_from_atoms(get_structure(pdb_data).atoms)
+    residues = {}
+    for model, chain_rank, line in hetero_records(pdb_data):
+        resname = line[17:20].strip()
+        hetflag = 'W' if resname in ('HOH', 'WAT') else 'H'
+        key = (model, line[21:22], hetflag, int(line[22:26]), line[26:27])
+        residue = residues.get(key)
+        if residue is None:
+            residue = residues[key] = [(model, chain_rank, len(residues)), resname, False]
+        if not residue[2] and line[12:16].strip() in POLYDENTATE_ATOMS:
+            residue[2] = True
+
+    ligands = {ligand_type: [] for ligand_type in LIGAND_TYPES}
+    for key, (_, resname, polydentate) in sorted(residues.items(), key=lambda item: item[1][0]):
+        if len(resname) <= 2:
+            ligands['ion'].append(resname)
+            continue
+        ligand_type = 'polydentate' if polydentate else 'monodentate'
+        ligands[ligand_type].append({
+            'resname': resname,
+            'chain': key[1],
+            'resnum': key[3],
+            'type': ligand_type
+        })
+    return ligands
+
+def predict_active_sites(pdb_data, catalytic_residues=CATALYTIC_RESIDUES):
+    """Standard residues whose names match common catalytic residues"""
+    atoms = get_structure(pdb_data).atoms
+    selected = np.flatnonzero(atoms.residue_mask(catalytic_residues, hetero=False))
+    return [{
+        'resname': resname.decode(),
+        'chain': chain.decode(),
+        'resnum': int(resnum)
+    } for resname, chain, resnum in zip(atoms.residue_names[selected],
+                                        atoms.residue_chains[selected],
+                                        atoms.residue_numbers[selected])]
+
+def count_residues(pdb_data, resnames):
+    """Number of residues (standard or hetero) with one of the given names"""
+    return int(np.count_nonzero(get_structure(pdb_data).atoms.residue_mask(resnames)))
+
+def visualize_ligand_counts(ligands):
+    """Create a bar chart of ligand counts."""
+    go = require("plotly.graph_objects", "Ligand charts")
+    labels = list(ligands.keys())
+    counts = [len(ligands[ligand_type]) for ligand_type in labels]
+    
+    fig = go.Figure(data=[
+        go.Bar(name='Ligand Counts', x=labels, y=counts)
+    ])
+    
+    fig.update_layout(title='Ligand Type Counts',
+                      xaxis_title='Ligand Type',
+                      yaxis_title='Count')
+    
+    return fig
+
+# ----------------------
+# Backbone Dihedrals
+# ----------------------
+PEPTIDE_BOND_CUTOFF = 1.8  # Å between C(i-1) and N(i), as in Bio.PDB's PPBuilder
+
+def dihedral_angles(p0, p1, p2, p3):
+    """Dihedral angles in degrees for arrays of four (n, 3) point sets"""
+    b0 = p0 - p1
+    b1 = p2 - p1
+    b2 = p3 - p2
+    b1 = b1 / np.linalg.norm(b1, axis=1)[:, None]
+    v = b0 - np.einsum('ij,ij->i', b0, b1)[:, None] * b1
+    w = b2 - np.einsum('ij,ij->i', b2, b1)[:, None] * b1
+    x = np.einsum('ij,ij->i', v, w)
+    y = np.einsum('ij,ij->i', np.cross(b1, v), w)
+    return np.degrees(np.arctan2(y, x))
+
+def _backbone_coords(atoms, name):
+    """(n_residues, 3) coordinates of one backbone atom per residue, NaN where missing"""
+    coords = np.full((atoms.n_residues, 3), np.nan)
+    selected = np.flatnonzero(atoms.names == name)
+    coords[atoms.residue_index[selected]] = atoms.coords[selected]
+    return coords
+
+@memoize(key=structure_key)
+def backbone_dihedrals(pdb_data):
+    """phi/psi (degrees, NaN where undefined) of every standard residue in the first model
+
+    Residues are linked when consecutive in a chain with a C-N peptide bond, so
+    chain breaks and gaps leave the terminal angles undefined.
+    """
+    atoms = get_structure(pdb_data).atoms
+    if len(atoms):
+        atoms = atoms.take((atoms.models == atoms.models[0]) & (atoms.hetflags == b' '))
+    n, ca, c = (_backbone_coords(atoms, name) for name in (b'N', b'CA', b'C'))
+    chains = atoms.residue_chains
+    linked = np.zeros(max(atoms.n_residues - 1, 0), dtype=bool)
+    if atoms.n_residues > 1:
+        with np.errstate(invalid='ignore'):
+            linked = (chains[1:] == chains[:-1]) & (
+                np.linalg.norm(n[1:] - c[:-1], axis=1) <= PEPTIDE_BOND_CUTOFF)
+    phi = np.full(atoms.n_residues, np.nan)
+    psi = np.full(atoms.n_residues, np.nan)
+    if linked.any():
+        i = np.flatnonzero(linked)  # residue i bonded to residue i + 1
+        phi[i + 1] = dihedral_angles(c[i], n[i + 1], ca[i + 1], c[i + 1])
+        psi[i] = dihedral_angles(n[i], ca[i], c[i], n[i + 1])
+    return {
+        'phi': phi,
+        'psi': psi,
+        'chain': chains.astype(str),
+        'resnum': atoms.residue_numbers.astype(int),
+        'resname': atoms.residue_names.astype(str),
+    }
+
+def ramachandran_figure(dihedrals, title='Ramachandran Plot'):
+    """Interactive phi/psi scatter over a density contour of the same points"""
+    go = require("plotly.graph_objects", "The Ramachandran plot")
+    defined = ~(np.isnan(dihedrals['phi']) | np.isnan(dihedrals['psi']))
+    phi, psi = dihedrals['phi'][defined], dihedrals['psi'][defined]
+    labels = np.char.add(np.char.add(dihedrals['resname'][defined], ' '),
+                         np.char.add(dihedrals['chain'][defined], dihedrals['resnum'][defined].astype(str)))
+    fig = go.Figure()
+    fig.add_trace(go.Histogram2dContour(
+        x=phi, y=psi, xbins=dict(start=-180, end=180, size=10), ybins=dict(start=-180, end=180, size=10),
+        colorscale='Blues', showscale=False, contours=dict(coloring='fill', showlines=False),
+        hoverinfo='skip', name='density'))
+    fig.add_trace(go.Scattergl(
+        x=phi, y=psi, mode='markers', text=labels, name='residues',
+        marker=dict(size=4, color='black', opacity=0.6),
+        hovertemplate='%{text}<br>phi %{x:.1f}°, psi %{y:.1f}°<extra></extra>'))
+    fig.update_layout(title=title, xaxis_title='phi (°)', yaxis_title='psi (°)',
+                      xaxis=dict(range=[-180, 180], dtick=60), yaxis=dict(range=[-180, 180], dtick=60),
+                      showlegend=False, width=600, height=600)
+    return fig
+
+# ----------------------
+# Hydrogen Bond Analysis
+# ----------------------
+@memoize(key=structure_key)
+def analyze_hydrogen_bonds(pdb_data, donors_sel="name N", hydrogens_sel="name H",
+                           acceptors_sel="name O", d_a_cutoff=3.5, d_h_a_angle_cutoff=150,
+                           d_h_cutoff=1.2):
+    """Count hydrogen bonds per model with the HydrogenBondAnalysis criteria
+
+    Donor-hydrogen and donor-acceptor candidates come from a cell-list search
+    rather than all-pairs distances. Coordinates are treated as non-periodic.
+    Results are cached per structure hash and cutoff parameters.
+    """
+    structure = get_structure(pdb_data)
+    u = structure.universe
+    donors = u.select_atoms(donors_sel).indices
+    hydrogens = u.select_atoms(hydrogens_sel).indices
+    acceptors = u.select_atoms(acceptors_sel).indices
+
+    counts = []
+    for positions in structure.frames:
+        d_idx, h_idx, _ = pairs_within(positions[donors], positions[hydrogens], d_h_cutoff)
+        donor_xyz = positions[donors[d_idx]]
+        hydrogen_xyz = positions[hydrogens[h_idx]]
+        pair_idx, a_idx, _ = pairs_within(donor_xyz, positions[acceptors], d_a_cutoff, min_cutoff=1.0)
+        to_donor = donor_xyz[pair_idx] - hydrogen_xyz[pair_idx]
+        to_acceptor = positions[acceptors[a_idx]] - hydrogen_xyz[pair_idx]
+        cosine = np.einsum('ij,ij->i', to_donor, to_acceptor) / (
+            np.linalg.norm(to_donor, axis=1) * np.linalg.norm(to_acceptor, axis=1))
+        angles = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+        counts.append(int(np.count_nonzero(angles > d_h_a_angle_cutoff)))
+    return np.array(counts)
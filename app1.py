@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd   
 import py3Dmol
-import requests   
+import http_client
 from stmol import showmol
 
 st.title("Protein Structure Viewer")
@@ -26,7 +26,7 @@ pdb_url = fetch_pdb(pdb_id)
 
 def render_mol(pdb_url):
     view = py3Dmol.view(width=400, height=400)
-    pdb_data = requests.get(pdb_url).text
+    pdb_data = http_client.get(pdb_url).text
     view.addModel(pdb_data, "pdb")
     view.setStyle({'stick': {}})
     view.zoomTo()
@@ -0,0 +1,74 @@
+"""Batch analysis of many PDB IDs across a process pool.
+
+Workers are plain functions with no Streamlit dependency, so the same code
+serves the "Batch" mode of model.py and headless scripts.
+"""
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+PDB_ID_PATTERN = re.compile(r"^[0-9][A-Z0-9]{3}$")
+BATCH_COLUMNS = ['pdb_id', 'ions', 'monodentate', 'polydentate',
+                 'catalytic_residues', 'hbonds', 'seconds', 'error']
+
+def default_workers():
+    """Worker count sized to the cores this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def parse_pdb_ids(text):
+    """Unique, upper-cased PDB IDs from free text (commas, whitespace or one per line)"""
+    ids = []
+    for token in re.split(r"[\s,;]+", text.upper()):
+        if token and token not in ids:
+            ids.append(token)
+    valid = [pdb_id for pdb_id in ids if PDB_ID_PATTERN.match(pdb_id)]
+    invalid = [pdb_id for pdb_id in ids if not PDB_ID_PATTERN.match(pdb_id)]
+    return valid, invalid
+
+# ----------------------
+# Worker
+# ----------------------
+def analyze_structure(pdb_id, load):
+    """Summarize ligands, catalytic residues and H-bonds of the structure returned by load()"""
+    from analysis import analyze_hydrogen_bonds, extract_ligands, predict_active_sites
+
+    start = time.perf_counter()
+    row = {'pdb_id': pdb_id}
+    try:
+        pdb_data = load()
+        ligands = extract_ligands(pdb_data)
+        row.update({ligand_type: len(entries) for ligand_type, entries in ligands.items()})
+        row['catalytic_residues'] = len(predict_active_sites(pdb_data))
+        row['hbonds'] = int(np.sum(analyze_hydrogen_bonds(pdb_data)))
+        row['error'] = None
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    row['ions'] = row.pop('ion', None)
+    row['seconds'] = round(time.perf_counter() - start, 2)
+    return {column: row.get(column) for column in BATCH_COLUMNS}
+
+def analyze_pdb_id(pdb_id):
+    """Fetch one structure through the shared store and summarize it"""
+    from pdb_store import fetch_best
+    return analyze_structure(pdb_id, lambda: fetch_best(pdb_id))
+
+def run_batch(items, max_workers=None, worker=analyze_pdb_id):
+    """Yield worker(item) for every item (PDB IDs by default), in completion order"""
+    # spawn rather than fork: the Streamlit server process is multi-threaded
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=max_workers or default_workers(),
+                               mp_context=context)
+    try:
+        futures = [pool.submit(worker, item) for item in items]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # a Streamlit rerun abandons the generator; drop the work still queued
+        pool.shutdown(wait=False, cancel_futures=True)
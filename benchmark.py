@@ -0,0 +1,244 @@
+"""Latency and memory benchmarks for the structure analysis helpers.
+
+Usage:
+    python benchmark.py atom-table path/to/structure.pdb [...]
+    python benchmark.py ligands path/to/structure.pdb [...]
+    python benchmark.py sasa path/to/structure.pdb [...]
+    python benchmark.py formats path/to/1abc.pdb path/to/1abc.cif path/to/1abc.bcif
+    python benchmark.py imports [module ...]
+"""
+import argparse
+import gzip
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from io import StringIO
+
+import numpy as np
+from Bio.PDB import PDBParser
+from Bio.PDB.SASA import ShrakeRupley
+
+from analysis import CATALYTIC_RESIDUES, POLYDENTATE_ATOMS, extract_ligands, ligands_from_atoms
+from sasa import atom_radii, atom_sasa, shrake_rupley
+from structure import AtomTable, ParsedStructure, structure_format
+
+# ----------------------
+# Measurement
+# ----------------------
+def measure(fn, *args, repeat=3):
+    """Best wall time (s) over repeat runs and peak traced memory (bytes) of one run"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+def report(title, rows):
+    print(f"\n{title}")
+    print(f"{'path':<24}{'time (ms)':>12}{'peak (MB)':>12}")
+    for name, seconds, peak in rows:
+        print(f"{name:<24}{seconds * 1e3:>12.1f}{peak / 2**20:>12.1f}")
+
+# ----------------------
+# Bio.PDB Reference Path
+# ----------------------
+def bio_analyses(pdb_data):
+    """Ligand buckets and active sites computed by walking Bio.PDB objects"""
+    structure = PDBParser(QUIET=True).get_structure("bench", StringIO(pdb_data))
+    ligands = {'ion': [], 'monodentate': [], 'polydentate': []}
+    active_sites = []
+    for residue in structure.get_residues():
+        resname = residue.get_resname()
+        if residue.id[0] != ' ':
+            if len(resname.strip()) <= 2:
+                ligands['ion'].append(resname)
+                continue
+            polydentate = any(atom.name in POLYDENTATE_ATOMS for atom in residue)
+            ligand_type = 'polydentate' if polydentate else 'monodentate'
+            ligands[ligand_type].append({
+                'resname': resname,
+                'chain': residue.parent.id,
+                'resnum': residue.id[1],
+                'type': ligand_type
+            })
+        elif resname in CATALYTIC_RESIDUES:
+            active_sites.append({
+                'resname': resname,
+                'chain': residue.parent.id,
+                'resnum': residue.id[1]
+            })
+    return ligands, active_sites
+
+def table_analyses(pdb_data):
+    """Same analyses computed from an AtomTable with vectorized masks"""
+    atoms = AtomTable.from_pdb(pdb_data)
+    selected = atoms.residue_mask(CATALYTIC_RESIDUES, hetero=False)
+    active_sites = [{
+        'resname': resname.decode(),
+        'chain': chain.decode(),
+        'resnum': int(resnum)
+    } for resname, chain, resnum in zip(atoms.residue_names[selected],
+                                        atoms.residue_chains[selected],
+                                        atoms.residue_numbers[selected])]
+    return ligands_from_atoms(atoms), active_sites
+
+def bench_atom_table(paths):
+    for path in paths:
+        with open(path) as f:
+            pdb_data = f.read()
+        bio_result, bio_time, bio_peak = measure(bio_analyses, pdb_data)
+        table_result, table_time, table_peak = measure(table_analyses, pdb_data)
+        n_atoms = len(AtomTable.from_pdb(pdb_data))
+        report(f"{path} ({n_atoms} atoms)", [
+            ('Bio.PDB objects', bio_time, bio_peak),
+            ('AtomTable', table_time, table_peak),
+        ])
+        print("results match" if bio_result == table_result else "RESULTS DIFFER")
+
+def bio_ligands(pdb_data):
+    return bio_analyses(pdb_data)[0]
+
+def table_ligands(pdb_data):
+    return ligands_from_atoms(AtomTable.from_pdb(pdb_data))
+
+def bench_ligands(paths):
+    for path in paths:
+        with open(path) as f:
+            pdb_data = f.read()
+        results, rows = [], []
+        for name, fn in [('Bio.PDB objects', bio_ligands),
+                         ('AtomTable', table_ligands),
+                         ('HETATM stream', extract_ligands.__wrapped__)]:
+            result, seconds, peak = measure(fn, pdb_data)
+            results.append(result)
+            rows.append((name, seconds, peak))
+        report(f"{path} ({len(pdb_data) / 2**20:.1f} MB)", rows)
+        print("results match" if all(r == results[0] for r in results) else "RESULTS DIFFER")
+
+# ----------------------
+# Solvent Accessibility
+# ----------------------
+SASA_COPIES = [1, 2, 4, 8, 16]
+
+def bio_sasa(pdb_data):
+    """Total SASA of the first model without waters, from Bio.PDB.SASA"""
+    model = PDBParser(QUIET=True).get_structure("bench", StringIO(pdb_data))[0]
+    for chain in model:
+        for residue in [r for r in chain if r.id[0] == 'W']:
+            chain.detach_child(residue.id)
+    ShrakeRupley().compute(model, level='A')
+    return sum(atom.sasa for atom in model.get_atoms())
+
+def bench_sasa(paths):
+    """Shrake-Rupley time against atom count, on copies of each structure set side by side"""
+    for path in paths:
+        with open(path) as f:
+            pdb_data = f.read()
+        atoms, sasa = atom_sasa(pdb_data)
+        radii = atom_radii(atoms)
+        spacing = np.ptp(atoms.coords, axis=0)[0] + 20.0
+        rows = []
+        for copies in SASA_COPIES:
+            coords = np.concatenate([atoms.coords + [k * spacing, 0, 0] for k in range(copies)])
+            _, seconds, peak = measure(shrake_rupley, coords, np.tile(radii, copies))
+            rows.append((f"{len(coords)} atoms", seconds, peak))
+        bio_total, bio_time, bio_peak = measure(bio_sasa, pdb_data, repeat=1)
+        rows.append((f"Bio.PDB {len(atoms)} atoms", bio_time, bio_peak))
+        report(f"{path} (Shrake-Rupley, {len(SASA_COPIES)} sizes)", rows)
+        for (name, seconds, _), copies in zip(rows, SASA_COPIES):
+            print(f"{name:<24}{seconds * 1e6 / (copies * len(atoms)):>12.1f} us/atom")
+        print(f"total SASA {sasa.sum():.1f} Å² vs Bio.PDB {bio_total:.1f} Å²")
+
+# ----------------------
+# Structure Formats
+# ----------------------
+def read_structure_file(path):
+    """PDB/mmCIF text, or BinaryCIF bytes, from a possibly gzipped file"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        data = f.read()
+    return data if '.bcif' in os.path.basename(path) else data.decode()
+
+def table_atoms(data):
+    return ParsedStructure(data).atoms
+
+def bench_formats(paths):
+    """Download size and AtomTable parse cost of the same structure in several formats"""
+    rows, sizes = [], []
+    for path in paths:
+        data = read_structure_file(path)
+        raw = data if isinstance(data, bytes) else data.encode()
+        atoms, seconds, peak = measure(table_atoms, data)
+        rows.append((f"{structure_format(data)} {os.path.basename(path)}"[:23], seconds, peak))
+        sizes.append((len(raw), len(gzip.compress(raw)), len(atoms)))
+    report("AtomTable parse", rows)
+    print(f"\n{'file':<24}{'size (KB)':>12}{'gzip (KB)':>12}{'atoms':>10}")
+    for (name, _, _), (size, compressed, n_atoms) in zip(rows, sizes):
+        print(f"{name:<24}{size / 1024:>12.0f}{compressed / 1024:>12.0f}{n_atoms:>10}")
+
+# ----------------------
+# Import Time
+# ----------------------
+ENTRY_POINTS = ['model', 'modelling']
+DEFERRED_BACKENDS = ['py3Dmol', 'stmol', 'scipy.sparse.linalg', 'Bio.PDB', 'MDAnalysis',
+                     'plotly.graph_objects', 'joblib']
+
+def import_profile(module):
+    """(cold import seconds, [(seconds, package)] of its direct imports) via python -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    total, children = 0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if name.strip() == module and depth == 0:
+            total = int(cumulative) / 1e6
+        elif depth == 1:
+            children.append((int(cumulative) / 1e6, name.strip()))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    return total, sorted(children, reverse=True)
+
+def bench_imports(modules):
+    """Cold import time of the entry points, and what the deferred backends cost on first use"""
+    print(f"\n{'entry point':<24}{'import (ms)':>12}  heaviest imports")
+    for module in modules or ENTRY_POINTS:
+        total, children = import_profile(module)
+        heaviest = ', '.join(f"{name} {seconds * 1e3:.0f}" for seconds, name in children[:4])
+        print(f"{module:<24}{total * 1e3:>12.0f}  {heaviest}")
+    print(f"\n{'deferred backend':<24}{'import (ms)':>12}")
+    for module in DEFERRED_BACKENDS:
+        try:
+            total, _ = import_profile(module)
+            print(f"{module:<24}{total * 1e3:>12.0f}")
+        except RuntimeError:
+            print(f"{module:<24}{'missing':>12}")
+
+BENCHMARKS = {
+    'atom-table': bench_atom_table,
+    'formats': bench_formats,
+    'imports': bench_imports,
+    'ligands': bench_ligands,
+    'sasa': bench_sasa,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('paths', nargs='*', help="Structure files to benchmark (module names for imports)")
+    args = parser.parse_args()
+    if not args.paths and args.benchmark != 'imports':
+        parser.error(f"{args.benchmark} needs at least one structure file")
+    BENCHMARKS[args.benchmark](args.paths)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Request coalescing and the process-wide, memory-budgeted result caches.
+
+Every LRUCache belongs to a namespace and charges the bytes of its entries
+to one MemoryBudget shared by the whole process:
+
+    text        raw structure text and HTTP responses
+    structures  parsed structures (AtomTable, Bio.PDB hierarchy, Universe)
+    analysis    memoized analysis results
+    images      viewer models and other payloads rendered for the browser
+
+Storing past a namespace quota evicts that namespace's least recently used
+entries; storing past the global budget evicts the least recently used
+entries of any namespace. Entries also expire a namespace's TTL after they
+are stored. Hits, misses, evictions and expirations are counted per cache
+and summarized per namespace by MemoryBudget.stats().
+
+Configuration (environment variables):
+    CACHE_MAX_MB    global budget in MB (default: 1024)
+    CACHE_QUOTA_MB  per-namespace quotas in MB (default: text=256,structures=512,analysis=256,images=128)
+    CACHE_TTL       per-namespace TTLs in seconds, 0 for none (default: text=21600,images=3600)
+"""
+import functools
+import mmap
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# ----------------------
+# Request Coalescing
+# ----------------------
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its outcome"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+def single_flight(key=None):
+    """Decorator coalescing concurrent calls that share a key (default: the arguments)"""
+    def decorator(fn):
+        flight = SingleFlight()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return flight.do(call_key, fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# ----------------------
+# Memory Budget
+# ----------------------
+TEXT, STRUCTURES, ANALYSIS, IMAGES = 'text', 'structures', 'analysis', 'images'
+MB = 1 << 20
+
+def _namespace_settings(name, default):
+    """{namespace: number} from a 'namespace=value,...' environment variable over the defaults"""
+    settings = dict(default)
+    for item in os.environ.get(name, "").split(','):
+        if item.strip():
+            namespace, value = item.split('=')
+            settings[namespace.strip()] = float(value)
+    return settings
+
+CACHE_MAX_BYTES = int(float(os.environ.get("CACHE_MAX_MB", 1024)) * MB)
+CACHE_QUOTAS = {namespace: int(mb * MB) for namespace, mb in _namespace_settings(
+    "CACHE_QUOTA_MB", {TEXT: 256, STRUCTURES: 512, ANALYSIS: 256, IMAGES: 128}).items()}
+CACHE_TTLS = _namespace_settings("CACHE_TTL", {TEXT: 6 * 3600, IMAGES: 3600})
+
+def sizeof(value, _seen=None):
+    """Approximate bytes held by a cached value
+
+    Arrays and objects with an nbytes attribute report it; strings and bytes
+    their size; containers the sum of their items. Memory maps count as zero,
+    since their pages are file-backed and the OS can drop them.
+    """
+    if isinstance(value, mmap.mmap):
+        return 0
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes)
+    _seen = set() if _seen is None else _seen
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(k, _seen) + sizeof(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item, _seen) for item in value)
+    return size
+
+class MemoryBudget:
+    """Byte budget shared by LRUCaches: per-namespace quotas under one global limit
+
+    Entries of every cache are kept in one recency order, so eviction picks the
+    least recently used entry across caches rather than within one.
+    """
+
+    def __init__(self, max_bytes=None, quotas=None):
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.quotas = dict(CACHE_QUOTAS if quotas is None else quotas)
+        self.lock = threading.RLock()
+        self.caches = weakref.WeakSet()
+        self._order = OrderedDict()  # (cache, key) -> size, least recently used first
+        self._used = {}
+
+    def limit(self, namespace):
+        return min(self.max_bytes, self.quotas.get(namespace, self.max_bytes))
+
+    def used(self, namespace=None):
+        with self.lock:
+            return sum(self._used.values()) if namespace is None else self._used.get(namespace, 0)
+
+    def register(self, cache):
+        with self.lock:
+            self.caches.add(cache)
+
+    def add(self, cache, key, size):
+        """Charge a new entry, then sweep expired entries and evict down to the quota and budget"""
+        with self.lock:
+            self._order[(cache, key)] = size
+            self._used[cache.namespace] = self._used.get(cache.namespace, 0) + size
+            self._sweep()
+            self._evict(cache.namespace)
+
+    def resize(self, cache, key, size):
+        with self.lock:
+            old = self._order.get((cache, key))
+            if old is None or old == size:
+                return
+            self._order[(cache, key)] = size
+            self._used[cache.namespace] += size - old
+            self._evict(cache.namespace)
+
+    def touch(self, cache, key):
+        with self.lock:
+            if (cache, key) in self._order:
+                self._order.move_to_end((cache, key))
+
+    def remove(self, cache, key):
+        with self.lock:
+            size = self._order.pop((cache, key), None)
+            if size is not None:
+                self._used[cache.namespace] -= size
+
+    def _sweep(self):
+        now = time.monotonic()
+        for cache in list(self.caches):
+            cache._expire(now)
+
+    def _evict(self, namespace):
+        while self._used.get(namespace, 0) > self.limit(namespace):
+            cache, key = next(entry for entry in self._order if entry[0].namespace == namespace)
+            cache._evict(key)
+        while sum(self._used.values()) > self.max_bytes:
+            cache, key = next(iter(self._order))
+            cache._evict(key)
+
+    def stats(self):
+        """One row per namespace: entries, bytes, quota, hits, misses, hit rate, evictions, expirations"""
+        with self.lock:
+            rows = {namespace: {'namespace': namespace, 'entries': 0, 'bytes': 0, 'quota': self.limit(namespace),
+                                'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+                    for namespace in list(self.quotas) + [cache.namespace for cache in self.caches]}
+            for cache in self.caches:
+                row = rows[cache.namespace]
+                for field, value in cache.stats().items():
+                    if field not in ('name', 'namespace'):
+                        row[field] += value
+        for row in rows.values():
+            lookups = row['hits'] + row['misses']
+            row['hit_rate'] = row['hits'] / lookups if lookups else None
+        return list(rows.values())
+
+    def cache_stats(self):
+        """One row per cache, as in stats()"""
+        with self.lock:
+            return sorted((cache.stats() for cache in self.caches), key=lambda row: (row['namespace'], row['name']))
+
+BUDGET = MemoryBudget()
+
+# ----------------------
+# Process-wide Caches
+# ----------------------
+_NAMESPACE_TTL = object()
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires', 'grows')
+
+    def __init__(self, value, size, expires):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        # values whose nbytes is a property (a ParsedStructure building parts
+        # on demand) are re-measured whenever they are read
+        self.grows = isinstance(getattr(type(value), 'nbytes', None), property)
+
+class LRUCache:
+    """Thread-safe least-recently-used cache shared by every session
+
+    Entries are charged to a MemoryBudget (the process-wide BUDGET by default)
+    under the cache's namespace, and expire after ttl seconds (the namespace
+    TTL unless given; None never expires). max_entries still caps the count.
+    """
+
+    def __init__(self, max_entries=16, namespace=ANALYSIS, ttl=_NAMESPACE_TTL, name=None, sizeof=sizeof,
+                 budget=None):
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.ttl = CACHE_TTLS.get(namespace) if ttl is _NAMESPACE_TTL else ttl
+        self.name = name or namespace
+        self.sizeof = sizeof
+        self.budget = budget or BUDGET
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = self.budget.lock
+        self._flight = SingleFlight()
+        self.budget.register(self)
+
+    def _lookup(self, key, missing):
+        """Value for key (refreshing its recency and size), or missing when absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return missing
+            if entry.expires is not None and entry.expires <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                return missing
+            self._entries.move_to_end(key)
+            self.budget.touch(self, key)
+            if entry.grows:
+                entry.size = self.sizeof(entry.value)
+                self.budget.resize(self, key, entry.size)
+            return entry.value
+
+    def get(self, key, default=None):
+        missing = object()
+        value = self._lookup(key, missing)
+        with self._lock:
+            if value is missing:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value unless it alone exceeds the namespace quota or the budget"""
+        size = self.sizeof(value)
+        with self._lock:
+            self._drop(key)
+            if size > self.budget.limit(self.namespace):
+                return
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = _Entry(value, size, expires)
+            self.budget.add(self, key, size)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def get_or_create(self, key, factory):
+        """Return the cached value for key, building it with factory on a miss
+
+        Concurrent misses for the same key are coalesced into one factory call.
+        """
+        missing = object()
+        value = self._lookup(key, missing)
+        with self._lock:
+            if value is not missing:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        def create():
+            value = self._lookup(key, missing)
+            if value is missing:
+                value = factory()
+                self.put(key, value)
+            return value
+        return self._flight.do(key, create)
+
+    def _drop(self, key):
+        if self._entries.pop(key, None) is not None:
+            self.budget.remove(self, key)
+
+    def _evict(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                self.evictions += 1
+
+    def _expire(self, now):
+        with self._lock:
+            expired = [key for key, entry in self._entries.items()
+                       if entry.expires is not None and entry.expires <= now]
+            for key in expired:
+                self._drop(key)
+            self.expirations += len(expired)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {'name': self.name, 'namespace': self.namespace, 'entries': len(self._entries),
+                    'bytes': sum(entry.size for entry in self._entries.values()), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+def memoize(key=None, max_entries=32, namespace=ANALYSIS, ttl=_NAMESPACE_TTL):
+    """Decorator caching results per key in a process-wide LRUCache of the given namespace
+
+    Concurrent misses for the same key are coalesced into a single call.
+    """
+    def decorator(fn):
+        cache = LRUCache(max_entries=max_entries, namespace=namespace, ttl=ttl,
+                         name=f"{fn.__module__}.{fn.__qualname__}")
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return cache.get_or_create(call_key, lambda: fn(*args, **kwargs))
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,264 @@
+"""mmCIF and BinaryCIF readers (and a minimal mmCIF writer) for _atom_site.
+
+Large assemblies have no legacy PDB file, so structures can also arrive as
+mmCIF text or BinaryCIF bytes. Both readers go straight from the _atom_site
+category to NumPy columns, without building per-atom objects or a dictionary
+of every category:
+
+    mmCIF      the _atom_site loop is tokenized in chunks of lines, each chunk
+               becoming one (rows, fields) byte matrix; files are read line by
+               line, so only one chunk of text is held at a time
+    BinaryCIF  each column is decoded with vectorized NumPy versions of the
+               BinaryCIF encodings (ByteArray, FixedPoint, IntervalQuantization,
+               RunLength, Delta, IntegerPacking, StringArray)
+
+Author (auth_*) identifiers are preferred over label_* ones, as in the PDB
+format. AtomTable.from_atom_site turns the columns into the table every
+analysis uses.
+"""
+import gzip
+import itertools
+import re
+
+import numpy as np
+
+from optional import require
+
+# column -> _atom_site items, preferred item first
+ATOM_SITE_ITEMS = {
+    'group': ('group_PDB',),
+    'name': ('auth_atom_id', 'label_atom_id'),
+    'resname': ('auth_comp_id', 'label_comp_id'),
+    'chain': ('auth_asym_id', 'label_asym_id'),
+    'resnum': ('auth_seq_id', 'label_seq_id'),
+    'icode': ('pdbx_PDB_ins_code',),
+    'x': ('Cartn_x',),
+    'y': ('Cartn_y',),
+    'z': ('Cartn_z',),
+    'occupancy': ('occupancy',),
+    'bfactor': ('B_iso_or_equiv',),
+    'element': ('type_symbol',),
+    'model': ('pdbx_PDB_model_num',),
+}
+NUMERIC_COLUMNS = ('resnum', 'x', 'y', 'z', 'occupancy', 'bfactor', 'model')
+MISSING_VALUES = (b'?', b'.')
+CHUNK_LINES = 20000
+
+def _normalize(raw, n_rows):
+    """Columns from raw item arrays (bytes, or numbers for BinaryCIF); missing values blank"""
+    columns = {}
+    for column, items in ATOM_SITE_ITEMS.items():
+        values = next((raw[item] for item in items if item in raw), None)
+        if column in NUMERIC_COLUMNS:
+            if values is None:
+                values = np.zeros(n_rows)
+            elif values.dtype.kind == 'S':
+                values = np.where(np.isin(values, MISSING_VALUES + (b'',)), b'0', values)
+            columns[column] = values.astype(np.int64 if column in ('resnum', 'model') else np.float64)
+        else:
+            if values is None:
+                values = np.full(n_rows, b'', dtype='S1')
+            columns[column] = np.where(np.isin(values, MISSING_VALUES), b'', values)
+    columns['element'] = np.char.upper(columns['element'])
+    columns['icode'] = np.where(columns['icode'] == b'', b' ', columns['icode']).astype('S1')
+    # models are numbered from 0 in order of appearance, as in the PDB reader
+    _, first, inverse = np.unique(columns['model'], return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int32)
+    rank[np.argsort(first)] = np.arange(len(first))
+    columns['model'] = rank[inverse.ravel()]
+    columns['coords'] = np.column_stack([columns.pop(axis) for axis in 'xyz']).astype(np.float32)
+    return columns
+
+# ----------------------
+# mmCIF Text
+# ----------------------
+_TOKEN = re.compile(rb"'[^']*'|\"[^\"]*\"|\S+")
+_LOOP_END = re.compile(rb'^(?:#|loop_|_|data_)', re.M)
+
+def _tokens(block):
+    """Whitespace-separated values of a loop block, with CIF quotes removed"""
+    if b'"' not in block and b"'" not in block:
+        return block.split()
+    return [token[1:-1] if token[:1] in (b'"', b"'") else token for token in _TOKEN.findall(block)]
+
+def _loop_matrix(blocks, n_fields):
+    """(rows, fields) byte matrix of a loop given as blocks of whole lines"""
+    chunks, pending = [], []
+    for block in blocks:
+        tokens = pending + _tokens(block)
+        complete = len(tokens) - len(tokens) % n_fields
+        pending = tokens[complete:]
+        if complete:
+            chunks.append(np.array(tokens[:complete], dtype='S').reshape(-1, n_fields))
+    if pending:
+        raise ValueError("truncated _atom_site loop in mmCIF data")
+    return np.concatenate(chunks) if chunks else np.zeros((0, n_fields), dtype='S1')
+
+def _stream_loop(handle):
+    """(items, blocks of data lines) of the _atom_site loop in a binary file, read line by line"""
+    lines = iter(handle)
+    items, previous, line = [], b'', b''
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith(b'_atom_site.') and (items or previous == b'loop_'):
+            items.append(stripped[len(b'_atom_site.'):].decode())
+        elif items:
+            break
+        previous = stripped
+    else:
+        line = b''
+    if not items:
+        raise ValueError("no _atom_site loop in mmCIF data")
+
+    def blocks():
+        chunk = []
+        for data_line in itertools.chain([line], lines):
+            if _LOOP_END.match(data_line):
+                break
+            chunk.append(data_line)
+            if len(chunk) == CHUNK_LINES:
+                yield b''.join(chunk)
+                chunk = []
+        if chunk:
+            yield b''.join(chunk)
+    return items, blocks()
+
+def read_mmcif(source):
+    """_atom_site columns from mmCIF text, bytes or a binary file, the loop tokenized chunk by chunk
+
+    Files are read line by line, so only one chunk of the loop is held as text.
+    """
+    if hasattr(source, 'read'):
+        items, blocks = _stream_loop(source)
+    else:
+        data = source.encode() if isinstance(source, str) else source
+        header = re.search(rb'^loop_[ \t]*\r?\n((?:_atom_site\.\S+[ \t]*\r?\n)+)', data, re.M)
+        if header is None:
+            raise ValueError("no _atom_site loop in mmCIF data")
+        items = [line.strip()[len(b'_atom_site.'):].decode() for line in header.group(1).splitlines() if line.strip()]
+        end = _LOOP_END.search(data, header.end())
+        lines = data[header.end():end.start() if end else len(data)].splitlines()
+        blocks = (b'\n'.join(lines[start:start + CHUNK_LINES]) for start in range(0, len(lines), CHUNK_LINES))
+    matrix = _loop_matrix(blocks, len(items))
+    return _normalize({item: matrix[:, k] for k, item in enumerate(items)}, len(matrix))
+
+# ----------------------
+# BinaryCIF
+# ----------------------
+_DTYPES = {
+    1: np.dtype('<i1'), 2: np.dtype('<i2'), 3: np.dtype('<i4'),
+    4: np.dtype('<u1'), 5: np.dtype('<u2'), 6: np.dtype('<u4'),
+    32: np.dtype('<f4'), 33: np.dtype('<f8'),
+}
+
+def _byte_array(data, encoding):
+    return np.frombuffer(data, dtype=_DTYPES[encoding['type']])
+
+def _fixed_point(data, encoding):
+    return (data / encoding['factor']).astype(_DTYPES[encoding['srcType']])
+
+def _interval_quantization(data, encoding):
+    low, high, steps = encoding['min'], encoding['max'], encoding['numSteps']
+    return (low + (high - low) / (steps - 1) * data).astype(_DTYPES[encoding['srcType']])
+
+def _run_length(data, encoding):
+    return np.repeat(data[0::2], data[1::2]).astype(_DTYPES[encoding['srcType']])
+
+def _delta(data, encoding):
+    values = data.astype(_DTYPES[encoding['srcType']])
+    if len(values):
+        values[0] += encoding['origin']
+    return np.cumsum(values, dtype=values.dtype)
+
+def _integer_packing(data, encoding):
+    """Sum each run of saturated (limit-valued) 8/16-bit values into one 32-bit value"""
+    limits = np.iinfo(data.dtype)
+    continued = data == limits.max
+    if not encoding['isUnsigned']:
+        continued |= data == limits.min
+    totals = np.cumsum(data, dtype=np.int64)[np.flatnonzero(~continued)]
+    values = np.diff(totals, prepend=0)
+    return values.astype(np.uint32 if encoding['isUnsigned'] else np.int32)
+
+def _string_array(data, encoding):
+    """Byte strings; indices of -1 (masked values) decode to b''"""
+    offsets = _decode(encoding['offsets'], encoding['offsetEncoding'])
+    strings = encoding['stringData']
+    unique = [strings[start:stop].encode() for start, stop in zip(offsets[:-1], offsets[1:])]
+    indices = _decode(data, encoding['dataEncoding'])
+    return np.array(unique + [b''], dtype='S')[indices]
+
+_DECODERS = {
+    'ByteArray': _byte_array,
+    'FixedPoint': _fixed_point,
+    'IntervalQuantization': _interval_quantization,
+    'RunLength': _run_length,
+    'Delta': _delta,
+    'IntegerPacking': _integer_packing,
+    'StringArray': _string_array,
+}
+
+def _decode(data, encodings):
+    """Undo a BinaryCIF encoding chain (applied first to last, so undone last to first)"""
+    for encoding in reversed(encodings):
+        data = _DECODERS[encoding['kind']](data, encoding)
+    return data
+
+def _column_values(column):
+    values = _decode(column['data']['data'], column['data']['encoding'])
+    mask = column.get('mask')
+    if mask is not None:
+        missing = _decode(mask['data'], mask['encoding']) != 0
+        if missing.any():
+            values = values.copy()
+            values[missing] = b'' if values.dtype.kind == 'S' else 0
+    return values
+
+def read_bcif(data):
+    """_atom_site columns from BinaryCIF bytes (optionally gzipped), decoded column by column"""
+    msgpack = require("msgpack", "BinaryCIF parsing")
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    document = msgpack.unpackb(data, raw=False)
+    for block in document['dataBlocks']:
+        for category in block['categories']:
+            if category['name'] == '_atom_site':
+                raw = {column['name']: _column_values(column) for column in category['columns']}
+                return _normalize(raw, category['rowCount'])
+    raise ValueError("no _atom_site category in BinaryCIF data")
+
+# ----------------------
+# mmCIF Writer
+# ----------------------
+WRITTEN_ITEMS = ['group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_alt_id', 'label_comp_id', 'label_asym_id',
+                 'label_seq_id', 'pdbx_PDB_ins_code', 'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy',
+                 'B_iso_or_equiv', 'auth_seq_id', 'auth_comp_id', 'auth_asym_id', 'auth_atom_id',
+                 'pdbx_PDB_model_num']
+
+def _quoted(values):
+    """CIF tokens for byte strings: '.' when blank, double-quoted when they hold a quote"""
+    tokens = [value.decode() or '.' for value in values.tolist()]
+    return [f'"{token}"' if "'" in token else token for token in tokens]
+
+def write_mmcif(atoms, bfactors=None, name='model'):
+    """mmCIF text with one _atom_site row per atom of an AtomTable"""
+    bfactors = atoms.bfactors if bfactors is None else bfactors
+    groups = np.where(atoms.hetflags == b' ', 'ATOM', 'HETATM').tolist()
+    atom_names = _quoted(atoms.names)
+    resnames = _quoted(atoms.resnames)
+    chains = _quoted(atoms.chains)
+    elements = _quoted(atoms.elements)
+    icodes = [code.strip() or '?' for code in atoms.icodes.astype(str).tolist()]
+    resnums = atoms.resnums.tolist()
+    coords = np.round(atoms.coords.astype(np.float64), 3).tolist()
+    occupancies = np.round(atoms.occupancies.astype(np.float64), 2).tolist()
+    bfactors = np.round(np.asarray(bfactors, dtype=np.float64), 2).tolist()
+    models = (atoms.models + 1).tolist()
+    rows = [
+        f"{groups[i]} {i + 1} {elements[i]} {atom_names[i]} . {resnames[i]} {chains[i]} {resnums[i]} "
+        f"{icodes[i]} {coords[i][0]} {coords[i][1]} {coords[i][2]} {occupancies[i]} {bfactors[i]} "
+        f"{resnums[i]} {resnames[i]} {chains[i]} {atom_names[i]} {models[i]}"
+        for i in range(len(groups))
+    ]
+    header = [f"data_{name}", "#", "loop_"] + [f"_atom_site.{item}" for item in WRITTEN_ITEMS]
+    return '\n'.join(header + rows + ['#', ''])
@@ -0,0 +1,714 @@
+"""Asynchronous AutoDock Vina job queue.
+
+Each job runs in its own working directory on a bounded pool of threads that
+drive obabel (receptor preparation) and vina as subprocesses. Submission
+returns immediately; callers poll job.status, read job.log while Vina is
+still printing, and may cancel queued or running jobs.
+
+Receptor preparation and finished runs are memoized in a content-addressed
+store: the prepared receptor PDBQT is keyed by a hash of the receptor PDB,
+and docked poses by the hashes of both inputs plus the box, exhaustiveness
+and seed. A repeated run is restored at submit time without starting Vina,
+and obabel runs once per receptor. Runs without a fixed seed are not cached.
+
+Screening runs dock a whole ligand library (PDBQT/SDF files or zip/tar
+archives of them) against one receptor, splitting the cores between parallel
+Vina processes and Vina's --cpu threads, and rank hits as ligands finish.
+
+Every Vina process the queue starts, for single jobs and screens alike,
+first takes its --cpu threads from one CoreBudget the size of the usable
+cores, so concurrent jobs and screens never run more threads than that.
+
+Configuration (environment variables):
+    VINA_BIN                 Vina executable (default: vina)
+    OBABEL_BIN               Open Babel executable (default: obabel)
+    DOCKING_JOBS             concurrent docking jobs (default: number of usable cores); a job
+                             starting alone gets every core as --cpu threads, concurrent jobs
+                             an equal share
+    DOCKING_WORKDIR          parent directory of the per-job working directories
+    DOCKING_CACHE_DIR        artifact cache (default: ~/.cache/docking)
+    DOCKING_CACHE_MAX_BYTES  artifact cache size cap (default: 1 GiB)
+    DOCKING_CACHE_MAX_AGE    evict artifacts unused for this many seconds (default: 30 days)
+"""
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from batch import default_workers
+from cache import SingleFlight
+from pdb_store import ContentStore
+from structure import structure_format, structure_hash, structure_text
+from structure_files import StructureFile
+
+VINA_BIN = os.environ.get("VINA_BIN", "vina")
+OBABEL_BIN = os.environ.get("OBABEL_BIN", "obabel")
+
+QUEUED, PREPARING, RUNNING, DONE, FAILED, CANCELLED = (
+    "queued", "preparing", "running", "done", "failed", "cancelled")
+FINISHED = (DONE, FAILED, CANCELLED)
+
+def vina_available():
+    return shutil.which(VINA_BIN) is not None
+
+# ----------------------
+# Pose Parsing
+# ----------------------
+class DockedPoses:
+    """Scores, coordinates and byte ranges of every pose in a Vina output, read in one streaming pass
+
+    Only numeric arrays are kept in memory; block() re-reads a single pose from
+    disk when it is needed for display.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        affinities, rmsd_lb, rmsd_ub, offsets, coords = [], [], [], [], []
+        position = start = 0
+        model = None
+        with open(path, "rb") as f:
+            for line in f:
+                if line.startswith(b"MODEL"):
+                    start, model = position, []
+                    affinities.append(np.nan)
+                    rmsd_lb.append(np.nan)
+                    rmsd_ub.append(np.nan)
+                elif line.startswith(b"REMARK VINA RESULT:") and model is not None:
+                    fields = line.split()
+                    affinities[-1], rmsd_lb[-1], rmsd_ub[-1] = (float(x) for x in fields[3:6])
+                elif line.startswith((b"ATOM", b"HETATM")) and model is not None:
+                    model.append((line[30:38], line[38:46], line[46:54]))
+                elif line.startswith(b"ENDMDL") and model is not None:
+                    offsets.append((start, position + len(line)))
+                    coords.append(np.array(model, dtype=np.float32).reshape(-1, 3))
+                    model = None
+                position += len(line)
+        n = len(offsets)
+        self.affinities = np.array(affinities[:n], dtype=np.float64)
+        self.rmsd_lb = np.array(rmsd_lb[:n], dtype=np.float64)
+        self.rmsd_ub = np.array(rmsd_ub[:n], dtype=np.float64)
+        self.offsets = offsets
+        self.coords = coords
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def best(self):
+        """Best (lowest) affinity, or None without scored poses"""
+        scored = self.affinities[~np.isnan(self.affinities)]
+        return float(scored.min()) if len(scored) else None
+
+    def top(self, k):
+        """Indices of the k best-scoring poses"""
+        return [int(i) for i in np.argsort(self.affinities, kind='stable')[:k]]
+
+    def table(self):
+        """One row per pose: mode, affinity, RMSD bounds and atom count"""
+        return [
+            {'mode': i + 1, 'affinity': self.affinities[i], 'rmsd_lb': self.rmsd_lb[i],
+             'rmsd_ub': self.rmsd_ub[i], 'atoms': len(self.coords[i])}
+            for i in range(len(self))
+        ]
+
+    def block(self, *indices):
+        """PDBQT text of the selected poses only"""
+        parts = []
+        with open(self.path, "rb") as f:
+            for i in indices:
+                start, end = self.offsets[i]
+                f.seek(start)
+                parts.append(f.read(end - start))
+        return b"".join(parts).decode()
+
+# ----------------------
+# Artifact Cache
+# ----------------------
+ARTIFACTS = ContentStore(
+    root=os.environ.get("DOCKING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "docking")),
+    max_bytes=int(os.environ.get("DOCKING_CACHE_MAX_BYTES", 1 << 30)),
+    max_age=float(os.environ.get("DOCKING_CACHE_MAX_AGE", 30 * 24 * 3600)),
+)
+RECEPTOR, POSES, LOG = "receptor-pdbqt", "docked-pdbqt", "vina-log"
+
+_PREPARATIONS = SingleFlight()
+
+class CoreBudget:
+    """Counting pool of the cores that concurrent Vina processes may use"""
+
+    def __init__(self, cores):
+        self.cores = max(1, cores)
+        self.free = self.cores
+        self._condition = threading.Condition()
+
+    def acquire(self, n, cancelled=None):
+        """Wait until n cores (at most all of them) are free and take them; 0 if cancelled first"""
+        n = min(max(1, n), self.cores)
+        with self._condition:
+            while self.free < n:
+                if cancelled is not None and cancelled.is_set():
+                    return 0
+                self._condition.wait(0.5)
+            self.free -= n
+        return n
+
+    def release(self, n):
+        with self._condition:
+            self.free += n
+            self._condition.notify_all()
+
+class PreparationCancelled(RuntimeError):
+    """The job running a shared receptor preparation was cancelled before it finished"""
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()
+
+def result_key(receptor_hash, ligand_hash, center, size, exhaustiveness, seed, extra_args=()):
+    """Hash of every input that determines Vina's output"""
+    inputs = [receptor_hash, ligand_hash, [float(c) for c in center], [float(s) for s in size],
+              int(exhaustiveness), int(seed), list(extra_args)]
+    return content_hash(json.dumps(inputs))
+
+class DockingJob:
+    """One docking run: inputs, isolated working directory, status and live log"""
+
+    def __init__(self, receptor_pdb, ligand_pdbqt, center, size, workdir, extra_args=(),
+                 exhaustiveness=8, seed=None, artifacts=None, cpu=None, receptor_path=None, budget=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.receptor_pdb = receptor_pdb
+        self.ligand_pdbqt = ligand_pdbqt
+        self.center = tuple(center)
+        self.size = tuple(size)
+        self.extra_args = list(extra_args)
+        self.exhaustiveness = exhaustiveness
+        self.seed = seed
+        self.cpu = cpu
+        self.budget = budget
+        self.receptor_path = receptor_path
+        self.workdir = workdir
+        self.artifacts = artifacts or ARTIFACTS
+        self.receptor_hash = structure_hash(receptor_pdb)
+        self.cached = False
+        self.status = QUEUED
+        self.error = None
+        self.returncode = None
+        self.log = []
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._process = None
+        self._future = None
+        self._poses = None
+
+    @property
+    def output_path(self):
+        return os.path.join(self.workdir, "docked.pdbqt")
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def result_key(self):
+        """Cache key of this run's output, or None when Vina is not seeded"""
+        if self.seed is None:
+            return None
+        return result_key(self.receptor_hash, content_hash(self.ligand_pdbqt), self.center, self.size,
+                          self.exhaustiveness, self.seed, self.extra_args)
+
+    def stdout(self):
+        return "".join(self.log)
+
+    def read_output(self):
+        """Docked poses (PDBQT text), or None if Vina wrote nothing"""
+        if not os.path.exists(self.output_path):
+            return None
+        with open(self.output_path) as f:
+            return f.read()
+
+    def poses(self):
+        """Parsed DockedPoses of the output (parsed once), or None if Vina wrote nothing"""
+        if self._poses is None and self.status == DONE and os.path.exists(self.output_path):
+            self._poses = DockedPoses(self.output_path)
+        return self._poses
+
+    def vina_command(self):
+        (cx, cy, cz), (sx, sy, sz) = self.center, self.size
+        return [
+            VINA_BIN,
+            "--receptor", self.receptor_path or "protein.pdbqt",
+            "--ligand", "ligand.pdbqt",
+            "--center_x", str(cx),
+            "--center_y", str(cy),
+            "--center_z", str(cz),
+            "--size_x", str(sx),
+            "--size_y", str(sy),
+            "--size_z", str(sz),
+            "--exhaustiveness", str(self.exhaustiveness),
+        ] + (["--seed", str(self.seed)] if self.seed is not None else []) + (
+            ["--cpu", str(self.cpu)] if self.cpu else []) + [
+            "--out", "docked.pdbqt",
+        ] + self.extra_args
+
+    def _stream(self, command):
+        """Run command in the job directory, appending its output to the log as it arrives"""
+        self._process = subprocess.Popen(
+            command, cwd=self.workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1)
+        if self._cancelled.is_set():
+            self._process.terminate()
+        for line in self._process.stdout:
+            self.log.append(line)
+        return self._process.wait()
+
+    def restore(self):
+        """Finish immediately from a cached identical run; False on a cache miss"""
+        key = self.result_key
+        poses = self.artifacts.get(key, POSES) if key else None
+        if poses is None:
+            return False
+        with open(self.output_path, "wb") as f:
+            f.write(poses)
+        self.log = [(self.artifacts.get(key, LOG) or b"").decode()]
+        self.cached = True
+        self.returncode = 0
+        self.started = self.finished = time.time()
+        self.status = DONE
+        return True
+
+    def _prepare_receptor(self, receptor_file):
+        """protein.pdbqt bytes from obabel, run in this job's directory"""
+        path = os.path.join(self.workdir, "protein.pdbqt")
+        returncode = self._stream([OBABEL_BIN, receptor_file, "-O", "protein.pdbqt"])
+        if self._cancelled.is_set():
+            raise PreparationCancelled("receptor preparation cancelled")
+        if returncode != 0 or not os.path.exists(path):
+            raise RuntimeError(f"obabel exited with code {returncode}")
+        with open(path, "rb") as f:
+            receptor_pdbqt = f.read()
+        self.artifacts.put(self.receptor_hash, RECEPTOR, receptor_pdbqt)
+        return receptor_pdbqt
+
+    def _receptor_pdbqt(self, receptor_file):
+        """Cached prepared receptor; concurrent jobs on one receptor share a single obabel run
+
+        The run belongs to whichever job started it. If that job is cancelled,
+        the jobs waiting on it start over, and one of them runs obabel itself.
+        """
+        while True:
+            receptor_pdbqt = self.artifacts.get(self.receptor_hash, RECEPTOR)
+            if receptor_pdbqt is not None:
+                self.log.append("Using cached receptor PDBQT\n")
+                return receptor_pdbqt
+            try:
+                return _PREPARATIONS.do(self.receptor_hash, self._prepare_receptor, receptor_file)
+            except PreparationCancelled:
+                if self._cancelled.is_set():
+                    raise
+                self.log.append("Shared receptor preparation was cancelled; retrying\n")
+
+    def _store_result(self):
+        key = self.result_key
+        if key is None:
+            return
+        with open(self.output_path, "rb") as f:
+            self.artifacts.put(key, POSES, f.read())
+        self.artifacts.put(key, LOG, self.stdout().encode())
+
+    def prepare(self):
+        """Write protein.pdb (or .mmcif) and the (cached) prepared protein.pdbqt to the job directory"""
+        fmt = structure_format(self.receptor_pdb)
+        receptor_file = "protein.pdb" if fmt == 'pdb' else "protein.mmcif"
+        if isinstance(self.receptor_pdb, StructureFile) and fmt != 'bcif':
+            self.receptor_pdb.copy_to(os.path.join(self.workdir, receptor_file))
+        else:
+            text, _ = structure_text(self.receptor_pdb)
+            with open(os.path.join(self.workdir, receptor_file), "w") as f:
+                f.write(text)
+        receptor_pdbqt = self._receptor_pdbqt(receptor_file)
+        path = os.path.join(self.workdir, "protein.pdbqt")
+        with open(path, "wb") as f:
+            f.write(receptor_pdbqt)
+        return path
+
+    def run(self):
+        if self._cancelled.is_set():
+            return
+        self.started = time.time()
+        try:
+            self.status = PREPARING
+            with open(os.path.join(self.workdir, "ligand.pdbqt"), "wb") as f:
+                f.write(self.ligand_pdbqt)
+            if self.receptor_path is None:
+                self.prepare()
+            if self._cancelled.is_set():
+                return
+            held = self.budget.acquire(self.cpu or self.budget.cores, self._cancelled) if self.budget else 0
+            try:
+                if self._cancelled.is_set():
+                    return
+                self.status = RUNNING
+                self.returncode = self._stream(self.vina_command())
+            finally:
+                if held:
+                    self.budget.release(held)
+            if self._cancelled.is_set():
+                return
+            if self.returncode != 0 or not os.path.exists(self.output_path):
+                self.status = FAILED
+                self.error = f"vina exited with code {self.returncode}"
+            else:
+                self._store_result()
+                self.status = DONE
+        except Exception as e:
+            self.status = FAILED
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            if self._cancelled.is_set():
+                self.status = CANCELLED
+            self.finished = time.time()
+
+    def cancel(self):
+        """Cancel a queued job, or terminate the running obabel/vina process"""
+        if self.done:
+            return False
+        self._cancelled.set()
+        if self._future is not None and self._future.cancel():
+            self.status = CANCELLED
+            self.finished = time.time()
+        elif self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+        return True
+
+# ----------------------
+# Virtual Screening
+# ----------------------
+LIGAND_SUFFIXES = ('.pdbqt', '.sdf')
+
+def _split_sdf(text, stem):
+    """(name, 'sdf', record) per molecule of an SD file, named by its title line"""
+    records = [record.strip("\n") for record in text.split("$$$$")]
+    records = [record for record in records if record.strip()]
+    for i, record in enumerate(records, 1):
+        title = record.split("\n", 1)[0].strip()
+        yield title or f"{stem}_{i}", "sdf", (record + "\n$$$$\n").encode()
+
+def _split_pdbqt(text, stem):
+    """(name, 'pdbqt', block) per MODEL of a multi-ligand PDBQT, or the whole file"""
+    if "\nMODEL" not in "\n" + text:
+        yield stem, "pdbqt", text.encode()
+        return
+    blocks = [block for block in text.split("ENDMDL") if "ATOM" in block or "HETATM" in block]
+    for i, block in enumerate(blocks, 1):
+        name = f"{stem}_{i}"
+        for line in block.splitlines():
+            if line.startswith("REMARK  Name =") or line.startswith("REMARK Name ="):
+                name = line.split("=", 1)[1].strip() or name
+                break
+        body = "".join(line + "\n" for line in block.splitlines() if not line.startswith("MODEL"))
+        yield name, "pdbqt", body.encode()
+
+def _library_members(filename, data):
+    name = os.path.basename(filename)
+    lower = name.lower()
+    if lower.endswith(".gz") and not lower.endswith((".tar.gz", ".tgz")):
+        yield from _library_members(name[:-3], gzip.decompress(data))
+    elif lower.endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for member in archive.namelist():
+                if member.lower().endswith(LIGAND_SUFFIXES + ('.sdf.gz', '.pdbqt.gz')):
+                    yield from _library_members(member, archive.read(member))
+    elif lower.endswith((".tar", ".tar.gz", ".tgz")):
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(LIGAND_SUFFIXES + ('.sdf.gz', '.pdbqt.gz')):
+                    yield from _library_members(member.name, archive.extractfile(member).read())
+    else:
+        stem, suffix = os.path.splitext(name)
+        text = data.decode(errors="replace")
+        yield from (_split_sdf if suffix.lower() == ".sdf" else _split_pdbqt)(text, stem)
+
+def read_ligand_library(filename, data):
+    """[(name, fmt, bytes)] from a PDBQT/SDF file or a zip/tar archive of them (optionally gzipped)"""
+    return list(_library_members(filename, data))
+
+def split_cores(n_ligands, cores=None, exhaustiveness=8):
+    """(parallel Vina processes, --cpu per process) for a screen of n_ligands
+
+    Vina spreads its exhaustiveness Monte Carlo runs over --cpu threads, so no
+    process gets more threads than that; with more ligands than cores, one
+    single-threaded process per core gives the best throughput.
+    """
+    cores = max(1, cores or default_workers())
+    processes = max(1, min(n_ligands, cores))
+    return processes, max(1, min(exhaustiveness, cores // processes))
+
+def sdf_to_pdbqt(sdf, workdir):
+    """Convert one SD record to PDBQT with obabel in workdir"""
+    with open(os.path.join(workdir, "ligand.sdf"), "wb") as f:
+        f.write(sdf)
+    result = subprocess.run([OBABEL_BIN, "ligand.sdf", "-O", "ligand.pdbqt"], cwd=workdir,
+                            capture_output=True, text=True)
+    path = os.path.join(workdir, "ligand.pdbqt")
+    if result.returncode != 0 or not os.path.exists(path):
+        raise RuntimeError(f"obabel could not convert the ligand: {result.stderr.strip()[-200:]}")
+    with open(path, "rb") as f:
+        return f.read()
+
+SCREENING_COLUMNS = ['rank', 'ligand', 'affinity', 'poses', 'status', 'cached', 'seconds', 'error']
+
+class ScreeningRun:
+    """Dock a ligand library against one receptor, ranking hits as ligands finish"""
+
+    def __init__(self, receptor_pdb, ligands, center, size, workdir, exhaustiveness=8, seed=None,
+                 cores=None, artifacts=None, budget=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.receptor_pdb = receptor_pdb
+        self.ligands = ligands
+        self.center = tuple(center)
+        self.size = tuple(size)
+        self.exhaustiveness = exhaustiveness
+        self.seed = seed
+        self.workdir = workdir
+        self.artifacts = artifacts or ARTIFACTS
+        self.budget = budget
+        if budget is not None:
+            cores = min(cores or budget.cores, budget.cores)
+        self.processes, self.cpu = split_cores(len(ligands), cores, exhaustiveness)
+        self.status = QUEUED
+        self.error = None
+        self.rows = []
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._receptor_job = None
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def total(self):
+        return len(self.ligands)
+
+    def hits(self):
+        """Finished ligands ranked by best affinity (failures last)"""
+        rows = sorted(self.rows, key=lambda row: (row['affinity'] is None, row['affinity'] or 0.0))
+        return [dict(row, rank=rank) for rank, row in enumerate(rows, 1)]
+
+    def hits_csv(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=SCREENING_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(self.hits())
+        return out.getvalue()
+
+    def ligand_dir(self, index):
+        return os.path.join(self.workdir, f"{index:06d}")
+
+    def poses(self, index):
+        """DockedPoses of one screened ligand, or None if it has no output"""
+        path = os.path.join(self.ligand_dir(index), "docked.pdbqt")
+        return DockedPoses(path) if os.path.exists(path) else None
+
+    def _dock(self, index, name, fmt, data, receptor_path):
+        row = {'ligand': name, 'index': index, 'affinity': None, 'poses': 0, 'cached': False, 'error': None}
+        start = time.perf_counter()
+        if self._cancelled.is_set():
+            return dict(row, status=CANCELLED, seconds=0.0)
+        workdir = self.ligand_dir(index)
+        os.makedirs(workdir, exist_ok=True)
+        try:
+            ligand_pdbqt = sdf_to_pdbqt(data, workdir) if fmt == "sdf" else data
+            job = DockingJob(self.receptor_pdb, ligand_pdbqt, self.center, self.size, workdir,
+                             exhaustiveness=self.exhaustiveness, seed=self.seed, artifacts=self.artifacts,
+                             cpu=self.cpu, receptor_path=receptor_path, budget=self.budget)
+            if not job.restore():
+                with self._lock:
+                    self._running.add(job)
+                try:
+                    if not self._cancelled.is_set():
+                        job.run()
+                finally:
+                    with self._lock:
+                        self._running.discard(job)
+            row.update(status=job.status if job.started else CANCELLED, cached=job.cached, error=job.error)
+            if job.status == DONE:
+                poses = job.poses()
+                row.update(affinity=poses.best, poses=len(poses))
+        except Exception as e:
+            row.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+        row['seconds'] = round(time.perf_counter() - start, 2)
+        return row
+
+    def run(self):
+        self.started = time.time()
+        try:
+            self.status = PREPARING
+            receptor_dir = os.path.join(self.workdir, "receptor")
+            os.makedirs(receptor_dir, exist_ok=True)
+            self._receptor_job = DockingJob(self.receptor_pdb, b"", self.center, self.size, receptor_dir,
+                                            artifacts=self.artifacts)
+            receptor_path = self._receptor_job.prepare()
+            if self._cancelled.is_set():
+                return
+            self.status = RUNNING
+            pool = ThreadPoolExecutor(max_workers=self.processes, thread_name_prefix=f"screen-{self.id}")
+            try:
+                futures = [pool.submit(self._dock, index, name, fmt, data, receptor_path)
+                           for index, (name, fmt, data) in enumerate(self.ligands)]
+                for future in as_completed(futures):
+                    if not future.cancelled():
+                        self.rows.append(future.result())
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+            self.status = DONE
+        except Exception as e:
+            self.status = FAILED
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            if self._cancelled.is_set():
+                self.status = CANCELLED
+            self.finished = time.time()
+
+    def cancel(self):
+        """Stop queued ligands and terminate the Vina processes still running"""
+        if self.done:
+            return False
+        self._cancelled.set()
+        if self._receptor_job is not None:
+            self._receptor_job.cancel()
+        with self._lock:
+            running = list(self._running)
+        for job in running:
+            job.cancel()
+        return True
+
+# ----------------------
+# Job Queue
+# ----------------------
+class DockingQueue:
+    """Bounded pool of docking jobs shared by every session in the process"""
+
+    def __init__(self, max_concurrent=None, root=None, max_history=50):
+        self.cores = default_workers()
+        self.max_concurrent = max_concurrent or int(os.environ.get("DOCKING_JOBS", self.cores))
+        self.budget = CoreBudget(self.cores)
+        self._running = 0
+        self.root = root or os.environ.get("DOCKING_WORKDIR") or tempfile.mkdtemp(prefix="docking-")
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="docking")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, receptor_pdb, ligand_pdbqt, center, size, extra_args=(), exhaustiveness=8, seed=None):
+        """Queue a docking run and return its DockingJob without waiting
+
+        A run identical to a cached one comes back already finished.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        workdir = tempfile.mkdtemp(prefix="job-", dir=self.root)
+        job = DockingJob(receptor_pdb, ligand_pdbqt, center, size, workdir, extra_args,
+                         exhaustiveness=exhaustiveness, seed=seed, budget=self.budget)
+        restored = job.restore()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        if not restored:
+            job._future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        """Run job with an equal share of the cores among the jobs running now (all of them for a lone job)"""
+        with self._lock:
+            self._running += 1
+            job.cpu = max(1, self.cores // self._running)
+        try:
+            job.run()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def screen(self, receptor_pdb, ligands, center, size, exhaustiveness=8, seed=None, cores=None):
+        """Start screening ligands ([(name, fmt, bytes)]) in the background and return the ScreeningRun
+
+        The run splits at most the queue's cores between its Vina processes
+        (split_cores), and each process waits for its share of the queue's
+        CoreBudget, which queued jobs and other screens draw from too.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        workdir = tempfile.mkdtemp(prefix="screen-", dir=self.root)
+        run = ScreeningRun(receptor_pdb, ligands, center, size, workdir,
+                           exhaustiveness=exhaustiveness, seed=seed, cores=cores, budget=self.budget)
+        with self._lock:
+            self._jobs[run.id] = run
+            self._prune()
+        threading.Thread(target=run.run, name=f"screen-{run.id}", daemon=True).start()
+        return run
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        return job.cancel() if job else False
+
+    def _prune(self):
+        """Forget the oldest finished jobs (and their directories) beyond max_history"""
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job.id]
+            shutil.rmtree(job.workdir, ignore_errors=True)
+
+    def shutdown(self):
+        for job in self.jobs():
+            job.cancel()
+        self._executor.shutdown(wait=True)
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+def get_queue():
+    """Process-wide DockingQueue, created on first use"""
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = DockingQueue()
+        return _QUEUE
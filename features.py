@@ -0,0 +1,123 @@
+"""Protein-ligand descriptors for binding affinity prediction.
+
+Every hetero, non-water, non-ion residue of a structure (the mono- and
+polydentate ligands reported by extract_ligands) gets one feature row:
+
+    contact counts   ligand/protein heavy-atom pairs per element group pair,
+                     binned into the distance shells of CONTACT_SHELLS
+    buried_fraction  share of ligand heavy atoms with at least BURIED_NEIGHBORS
+                     protein heavy atoms within the outer shell
+    hbonds           ligand N/O to protein N/O pairs within HBOND_CUTOFF
+    heavy_atoms      ligand size
+
+All ligands of a structure are featurized together from one cell-list search
+and bincount reductions, and the result is cached per structure hash. Only
+the first model of multi-model files is used.
+"""
+import numpy as np
+
+from analysis import classify_ligand
+from cache import memoize
+from spatial import pairs_within
+from structure import get_structure, structure_key
+
+LIGAND_ELEMENTS = ['C', 'N', 'O', 'S', 'P', 'HAL', 'OTHER']
+PROTEIN_ELEMENTS = ['C', 'N', 'O', 'S']
+HALOGENS = [b'F', b'CL', b'BR', b'I']
+CONTACT_SHELLS = (0.0, 4.0, 6.0, 8.0)
+HBOND_CUTOFF = 3.5
+BURIED_NEIGHBORS = 30
+
+FEATURE_NAMES = [
+    f"{ligand}-{protein}_{lo:g}-{hi:g}"
+    for ligand in LIGAND_ELEMENTS
+    for protein in PROTEIN_ELEMENTS
+    for lo, hi in zip(CONTACT_SHELLS[:-1], CONTACT_SHELLS[1:])
+] + ['buried_fraction', 'hbonds', 'heavy_atoms']
+
+def atom_elements(atoms):
+    """Element symbols, falling back to the atom name for records without one"""
+    elements = atoms.elements.copy()
+    blank = elements == b''
+    if blank.any():
+        elements[blank] = np.char.lstrip(atoms.names[blank], b'0123456789').astype('S1')
+    return elements
+
+def _element_groups(elements, groups, other=None):
+    """Index into groups per element (halogens -> 'HAL', the rest -> other, or -1)"""
+    lookup = {group.encode(): i for i, group in enumerate(groups)}
+    default = groups.index(other) if other else -1
+    if 'HAL' in groups:
+        lookup.update({halogen: groups.index('HAL') for halogen in HALOGENS})
+    unique, inverse = np.unique(elements, return_inverse=True)
+    return np.array([lookup.get(element, default) for element in unique], dtype=np.int64)[inverse.ravel()]
+
+@memoize(key=structure_key, max_entries=16)
+def ligand_features(pdb_data):
+    """(ligands, matrix): ligand dicts as in extract_ligands and one FEATURE_NAMES row each"""
+    atoms = get_structure(pdb_data).atoms
+    if len(atoms) == 0:
+        return [], np.zeros((0, len(FEATURE_NAMES)))
+    elements = atom_elements(atoms)
+    usable = (atoms.models == atoms.models[0]) & ~np.isin(elements, [b'H', b'D'])
+
+    labels = classify_ligand(atoms)
+    ligand_residues = np.flatnonzero((atoms.residue_hetflags == b'H') & (labels != 'ion')
+                                     & np.isin(np.arange(atoms.n_residues), atoms.residue_index[usable]))
+    ligands = [{
+        'resname': atoms.residue_names[r].decode(),
+        'chain': atoms.residue_chains[r].decode(),
+        'resnum': int(atoms.residue_numbers[r]),
+        'type': labels[r],
+    } for r in ligand_residues]
+    n_ligands = len(ligand_residues)
+    if n_ligands == 0:
+        return ligands, np.zeros((0, len(FEATURE_NAMES)))
+
+    row_of_residue = np.full(atoms.n_residues, -1, dtype=np.int64)
+    row_of_residue[ligand_residues] = np.arange(n_ligands)
+    ligand_atoms = np.flatnonzero(usable & (row_of_residue[atoms.residue_index] >= 0))
+    protein_atoms = np.flatnonzero(usable & (atoms.hetflags == b' '))
+    ligand_rows = row_of_residue[atoms.residue_index[ligand_atoms]]
+
+    qi, pi, distances = pairs_within(atoms.coords[ligand_atoms], atoms.coords[protein_atoms], CONTACT_SHELLS[-1])
+    rows = ligand_rows[qi]
+
+    # element-pair contact counts per distance shell
+    ligand_groups = _element_groups(elements[ligand_atoms], LIGAND_ELEMENTS, other='OTHER')[qi]
+    protein_groups = _element_groups(elements[protein_atoms], PROTEIN_ELEMENTS)[pi]
+    shells = np.clip(np.searchsorted(CONTACT_SHELLS, distances, side='left') - 1, 0, len(CONTACT_SHELLS) - 2)
+    n_shells = len(CONTACT_SHELLS) - 1
+    keep = protein_groups >= 0
+    columns = (ligand_groups * len(PROTEIN_ELEMENTS) + protein_groups) * n_shells + shells
+    n_contacts = len(LIGAND_ELEMENTS) * len(PROTEIN_ELEMENTS) * n_shells
+    contacts = np.bincount(rows[keep] * n_contacts + columns[keep],
+                           minlength=n_ligands * n_contacts).reshape(n_ligands, n_contacts)
+
+    # burial: protein neighbors within the outer shell, per ligand atom
+    neighbors = np.bincount(qi, minlength=len(ligand_atoms))
+    heavy_atoms = np.bincount(ligand_rows, minlength=n_ligands)
+    buried = np.bincount(ligand_rows, weights=neighbors >= BURIED_NEIGHBORS, minlength=n_ligands) / heavy_atoms
+
+    # heavy-atom hydrogen bond criterion
+    polar = [b'N', b'O']
+    hbond = ((distances <= HBOND_CUTOFF) & np.isin(elements[ligand_atoms][qi], polar)
+             & np.isin(elements[protein_atoms][pi], polar))
+    hbonds = np.bincount(rows[hbond], minlength=n_ligands)
+
+    matrix = np.column_stack([contacts, buried, hbonds, heavy_atoms]).astype(np.float64)
+    return ligands, matrix
+
+def featurize_ligands(structures):
+    """(ligands, matrix) for every ligand of several structures ({name: PDB text}), stacked
+
+    Each ligand dict gains a 'structure' key naming the structure it came from.
+    """
+    all_ligands, matrices = [], []
+    for name, pdb_data in structures.items():
+        ligands, matrix = ligand_features(pdb_data)
+        all_ligands += [dict(ligand, structure=name) for ligand in ligands]
+        matrices.append(matrix)
+    if not matrices:
+        return [], np.zeros((0, len(FEATURE_NAMES)))
+    return all_ligands, np.vstack(matrices)
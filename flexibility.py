@@ -0,0 +1,146 @@
+"""Per-residue flexibility from B-factors and elastic network models.
+
+Residues are represented by their CA atoms (first model, standard residues).
+Contacts come from a cell-list search and the Kirchhoff (GNM) and Hessian
+(ANM) matrices are assembled directly in sparse form, so memory grows with
+the number of contacts rather than with the square of the residue count.
+Only the lowest non-trivial modes are computed, with a shift-invert sparse
+eigensolver, which keeps 20k+ residue assemblies tractable. Factorizing the
+3N x 3N ANM Hessian still grows quickly, so above ANM_MAX_NODES residues ANM
+runs at reduced resolution (every m-th CA, with the cutoff scaled by m^1/3 to
+keep the contact density) and each residue takes the value of its node.
+"""
+import numpy as np
+
+from cache import memoize
+from optional import require
+from spatial import self_pairs
+from structure import get_structure, structure_key
+
+GNM_CUTOFF = 7.3
+ANM_CUTOFF = 15.0
+N_MODES = 20
+ANM_MAX_NODES = 3000
+
+def ca_atoms(pdb_data):
+    """AtomTable of the CA atoms of standard residues in the first model"""
+    atoms = get_structure(pdb_data).atoms
+    if len(atoms) == 0:
+        return atoms
+    return atoms.take((atoms.models == atoms.models[0]) & (atoms.hetflags == b' ') & (atoms.names == b'CA'))
+
+def normalize(values):
+    """Zero-mean, unit-variance scores (all zeros for constant input)"""
+    values = np.asarray(values, dtype=np.float64)
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+
+def kirchhoff(coords, cutoff=GNM_CUTOFF):
+    """Sparse GNM Kirchhoff (connectivity) matrix of points within cutoff"""
+    sparse = require("scipy.sparse", "Elastic network models")
+    n = len(coords)
+    i, j, _ = self_pairs(coords, cutoff)
+    rows = np.concatenate([i, j])
+    cols = np.concatenate([j, i])
+    contacts = sparse.coo_matrix((-np.ones(len(rows)), (rows, cols)), shape=(n, n)).tocsr()
+    return (contacts - sparse.diags(np.asarray(contacts.sum(axis=1)).ravel())).tocsc()
+
+def hessian(coords, cutoff=ANM_CUTOFF, gamma=1.0):
+    """Sparse 3N x 3N ANM Hessian of points within cutoff"""
+    sparse = require("scipy.sparse", "Elastic network models")
+    n = len(coords)
+    i, j, distances = self_pairs(coords, cutoff)
+    r = (coords[j] - coords[i]).astype(np.float64)
+    blocks = -gamma * np.einsum('pa,pb->pab', r, r) / (distances ** 2)[:, None, None]
+    a, b = np.meshgrid(np.arange(3), np.arange(3), indexing='ij')
+    a, b = a.ravel(), b.ravel()
+    off_rows = np.concatenate([(3 * i[:, None] + a).ravel(), (3 * j[:, None] + a).ravel()])
+    off_cols = np.concatenate([(3 * j[:, None] + b).ravel(), (3 * i[:, None] + b).ravel()])
+    off_values = np.concatenate([blocks.reshape(-1, 9).ravel(), blocks.reshape(-1, 9).ravel()])
+    # diagonal super-elements balance the off-diagonal ones of each residue
+    flat = blocks.reshape(-1, 9)
+    diagonal = -np.column_stack([
+        np.bincount(i, weights=flat[:, e], minlength=n) + np.bincount(j, weights=flat[:, e], minlength=n)
+        for e in range(9)])
+    residues = np.arange(n)
+    diag_rows = (3 * residues[:, None] + a).ravel()
+    diag_cols = (3 * residues[:, None] + b).ravel()
+    return sparse.coo_matrix(
+        (np.concatenate([off_values, diagonal.ravel()]),
+         (np.concatenate([off_rows, diag_rows]), np.concatenate([off_cols, diag_cols]))),
+        shape=(3 * n, 3 * n)).tocsc()
+
+def lowest_modes(matrix, n_modes, n_trivial):
+    """(eigenvalues, eigenvectors) of the n_modes lowest non-trivial modes
+
+    Shift-invert just below zero converges on the smallest eigenvalues of the
+    positive semi-definite matrix; the n_trivial (near-)zero modes of rigid
+    motions are dropped.
+    """
+    eigsh = require("scipy.sparse.linalg", "Elastic network models").eigsh
+    size = matrix.shape[0]
+    k = min(n_modes + n_trivial, size - 1)
+    if k <= n_trivial:
+        return np.zeros(0), np.zeros((size, 0))
+    values, vectors = eigsh(matrix, k=k, sigma=-1e-6, which='LM')
+    order = np.argsort(values)
+    values, vectors = values[order], vectors[:, order]
+    keep = values > 1e-6 * max(values.max(), 1.0)
+    return values[keep][:n_modes], vectors[:, keep][:, :n_modes]
+
+def _components(matrix):
+    csgraph = require("scipy.sparse.csgraph", "Elastic network models")
+    return csgraph.connected_components(matrix != 0, directed=False)[0]
+
+@memoize(key=structure_key, max_entries=8)
+def gnm_fluctuations(pdb_data, cutoff=GNM_CUTOFF, n_modes=N_MODES):
+    """Per-residue mean-square fluctuations from the lowest GNM modes"""
+    coords = ca_atoms(pdb_data).coords
+    if len(coords) < 3:
+        return np.zeros(len(coords))
+    gamma = kirchhoff(coords, cutoff)
+    values, vectors = lowest_modes(gamma, n_modes, _components(gamma))
+    return (vectors ** 2 / values).sum(axis=1)
+
+@memoize(key=structure_key, max_entries=8)
+def anm_fluctuations(pdb_data, cutoff=ANM_CUTOFF, n_modes=N_MODES, max_nodes=ANM_MAX_NODES):
+    """Per-residue mean-square fluctuations from the lowest ANM modes"""
+    coords = ca_atoms(pdb_data).coords
+    n = len(coords)
+    if n < 3:
+        return np.zeros(n)
+    step = -(-n // max_nodes)
+    nodes = coords[::step]
+    cutoff = cutoff * step ** (1 / 3)
+    h = hessian(nodes, cutoff)
+    values, vectors = lowest_modes(h, n_modes, 6 * _components(kirchhoff(nodes, cutoff)))
+    fluctuations = (vectors ** 2 / values).reshape(len(nodes), 3, -1).sum(axis=(1, 2))
+    return fluctuations[np.minimum(np.round(np.arange(n) / step).astype(int), len(nodes) - 1)]
+
+@memoize(key=structure_key, max_entries=8)
+def flexibility_profile(pdb_data, model='GNM'):
+    """Per-residue labels, normalized B-factors and normalized network-model fluctuations"""
+    ca = ca_atoms(pdb_data)
+    fluctuations = (anm_fluctuations if model == 'ANM' else gnm_fluctuations)(pdb_data)
+    return {
+        'chain': ca.chains.astype(str),
+        'resnum': ca.resnums.astype(int),
+        'resname': ca.resnames.astype(str),
+        'bfactor': normalize(ca.bfactors),
+        'fluctuation': normalize(fluctuations),
+    }
+
+def flexibility_figure(profile, model='GNM'):
+    """Normalized B-factors and network-model fluctuations along the sequence"""
+    go = require("plotly.graph_objects", "The flexibility plot")
+    labels = np.char.add(np.char.add(profile['resname'], ' '),
+                         np.char.add(profile['chain'], profile['resnum'].astype(str)))
+    x = np.arange(len(labels))
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=x, y=profile['bfactor'], text=labels, mode='lines', name='B-factor'))
+    fig.add_trace(go.Scattergl(x=x, y=profile['fluctuation'], text=labels, mode='lines',
+                               name=f'{model} fluctuation'))
+    fig.update_traces(hovertemplate='%{text}<br>%{y:.2f}<extra>%{fullData.name}</extra>')
+    fig.update_layout(title='Residue Flexibility', xaxis_title='Residue (CA index)',
+                      yaxis_title='Normalized value (z-score)', legend=dict(orientation='h'))
+    return fig
@@ -0,0 +1,86 @@
+"""Shared HTTP client for every RCSB and PubChem request.
+
+One pooled requests.Session with bounded timeouts, exponential-backoff retries
+on connection errors and 429/5xx responses, ETag/Last-Modified revalidation of
+previously seen responses, and a cap on concurrent requests per host.
+"""
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache import TEXT, LRUCache
+
+DEFAULT_TIMEOUT = (5.0, 30.0)  # (connect, read) seconds
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class HTTPClient:
+    """Pooled, retrying, revalidating GET client safe to share across sessions"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=3, backoff_factor=0.5,
+                 pool_maxsize=16, max_per_host=4, revalidate_entries=64):
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._validated = LRUCache(max_entries=revalidate_entries, namespace=TEXT, name="http_client.validated",
+                                   sizeof=lambda response: len(response.content))
+        self._host_limits = {}
+        self._host_lock = threading.Lock()
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        """GET url, revalidating a previously seen response instead of re-downloading it"""
+        headers = dict(headers or {})
+        cached = self._validated.get(url)
+        if cached is not None:
+            if cached.headers.get("ETag"):
+                headers["If-None-Match"] = cached.headers["ETag"]
+            if cached.headers.get("Last-Modified"):
+                headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+        with self._host_limit(url):
+            response = self.session.get(url, headers=headers, timeout=timeout or self.timeout, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            return cached
+        if response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+            response.content  # read the body so the pooled connection is released
+            self._validated.put(url, response)
+        return response
+
+    def close(self):
+        self.session.close()
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+DEFAULT_CLIENT = HTTPClient(
+    timeout=(_env_float("HTTP_CONNECT_TIMEOUT", DEFAULT_TIMEOUT[0]),
+             _env_float("HTTP_READ_TIMEOUT", DEFAULT_TIMEOUT[1])),
+    retries=int(os.environ.get("HTTP_RETRIES", 3)),
+    max_per_host=int(os.environ.get("HTTP_MAX_PER_HOST", 4)),
+)
+
+def get(url, **kwargs):
+    """GET through the shared process-wide client"""
+    return DEFAULT_CLIENT.get(url, **kwargs)
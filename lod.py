@@ -0,0 +1,108 @@
+"""Level-of-detail models for the 3D viewer.
+
+Every atom passed to py3Dmol is embedded in the page, so structures above
+VIEWER_FULL_ATOMS atoms are shown as a reduced model by default:
+
+    trace    CA/P atoms of the polymer chains only
+    chains   every atom of the selected chains
+    ligands  ligands plus every residue within VIEWER_LIGAND_RADIUS of them
+
+Reduced models keep the original PDB records of the selected atoms (first
+model only; mmCIF and BinaryCIF sources are written out as mmCIF, PDB files
+are streamed) and are
+cached per structure hash and selection. surface_model
+gives the solvent-exposed atoms of a selection, with their server-side SASA in
+the B-factor column, so the browser colors a surface it does not compute.
+
+Configuration (environment variables):
+    VIEWER_FULL_ATOMS     largest structure shown in full detail by default (default: 50000)
+    VIEWER_LIGAND_RADIUS  ligand neighborhood radius in Å (default: 8.0)
+"""
+import os
+
+import numpy as np
+
+from cache import IMAGES, memoize
+from sasa import atom_sasa
+from spatial import pairs_within
+from cif import write_mmcif
+from structure import coordinate_records, get_structure, structure_format, structure_key
+
+FULL, TRACE, CHAINS, LIGANDS = 'full', 'trace', 'chains', 'ligands'
+LOD_LABELS = {
+    FULL: 'Full detail',
+    TRACE: 'CA/P trace',
+    CHAINS: 'Selected chains',
+    LIGANDS: 'Ligand neighborhoods',
+}
+VIEWER_FULL_ATOMS = int(os.environ.get("VIEWER_FULL_ATOMS", 50000))
+VIEWER_LIGAND_RADIUS = float(os.environ.get("VIEWER_LIGAND_RADIUS", 8.0))
+# atom SASA (Å²) at which the surface coloring saturates
+SURFACE_COLOR_MAX = 50.0
+
+def auto_mode(n_atoms, full_atoms=None):
+    """Full detail up to the atom threshold, CA/P trace above it"""
+    return FULL if n_atoms <= (full_atoms or VIEWER_FULL_ATOMS) else TRACE
+
+def chain_ids(pdb_data):
+    """Chain identifiers of the first model, in order of appearance"""
+    atoms = get_structure(pdb_data).atoms
+    if len(atoms) == 0:
+        return []
+    chains = atoms.residue_chains[atoms.models[atoms.residue_start] == atoms.models[0]]
+    _, first = np.unique(chains, return_index=True)
+    return [chain.decode() for chain in chains[np.sort(first)]]
+
+def _selection(atoms, mode, chains, radius):
+    """Boolean mask of the first-model atoms kept at this level of detail"""
+    first = atoms.models == atoms.models[0]
+    if mode == TRACE:
+        return first & (atoms.hetflags == b' ') & np.isin(atoms.names, [b'CA', b'P'])
+    if mode == CHAINS:
+        return first & np.isin(atoms.chains, [chain.encode() for chain in chains])
+    if mode == LIGANDS:
+        ligand_atoms = np.flatnonzero(first & (atoms.hetflags == b'H'))
+        candidates = np.flatnonzero(first)
+        _, near, _ = pairs_within(atoms.coords[ligand_atoms], atoms.coords[candidates], radius)
+        residues = np.zeros(atoms.n_residues, dtype=bool)
+        residues[atoms.residue_index[ligand_atoms]] = True
+        residues[atoms.residue_index[candidates[near]]] = True
+        return first & residues[atoms.residue_index]
+    raise ValueError(f"unknown level of detail: {mode}")
+
+def _model_text(pdb_data, atoms, keep, bfactors=None):
+    """(text, atom count) of the kept atoms: their PDB records, or mmCIF written from the table"""
+    if structure_format(pdb_data) != 'pdb':
+        kept = atoms.take(keep)
+        return write_mmcif(kept, None if bfactors is None else bfactors[keep]), len(kept)
+    area = dict(zip(atoms.record_index[keep].tolist(),
+                    (atoms.bfactors if bfactors is None else bfactors)[keep].tolist()))
+    records = coordinate_records(pdb_data if isinstance(pdb_data, str) else pdb_data.lines())
+    if bfactors is None:
+        lines = [line for i, (_, line) in enumerate(records) if i in area]
+    else:
+        lines = [f"{line.ljust(66)[:60]}{area[i]:6.2f}{line[66:]}"
+                 for i, (_, line) in enumerate(records) if i in area]
+    return '\n'.join(lines + ['END', '']), len(lines)
+
+def reduced_model(pdb_data, mode, chains=(), radius=VIEWER_LIGAND_RADIUS):
+    """(PDB or mmCIF text, atom count) for the viewer at this level of detail"""
+    if mode == FULL and isinstance(pdb_data, str):
+        # the text itself, already held by the text cache; memoizing it would charge it twice
+        return pdb_data, len(get_structure(pdb_data).atoms)
+    return _reduced_model(pdb_data, mode, chains, radius)
+
+@memoize(key=structure_key, max_entries=16, namespace=IMAGES)
+def _reduced_model(pdb_data, mode, chains=(), radius=VIEWER_LIGAND_RADIUS):
+    atoms = get_structure(pdb_data).atoms
+    keep = atoms.models == atoms.models[0] if mode == FULL else _selection(atoms, mode, chains, radius)
+    return _model_text(pdb_data, atoms, keep)
+
+@memoize(key=structure_key, max_entries=16, namespace=IMAGES)
+def surface_model(pdb_data, mode=FULL, chains=(), radius=VIEWER_LIGAND_RADIUS):
+    """(PDB or mmCIF text, atom count) of the exposed atoms at this level of detail, SASA (Å²) as B-factor"""
+    atoms = get_structure(pdb_data).atoms
+    surface, sasa = atom_sasa(pdb_data)
+    selected = atoms.record_index if mode == FULL else atoms.record_index[_selection(atoms, mode, chains, radius)]
+    exposed = (sasa > 0) & np.isin(surface.record_index, selected)
+    return _model_text(pdb_data, surface, exposed, bfactors=sasa)
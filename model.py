@@ -1,19 +1,12 @@
 import streamlit as st
-import requests
-import py3Dmol
-import stmol
-from Bio.PDB import PDBParser
-from io import StringIO
-import plotly.express as px
-import plotly.graph_objects as go
-import numpy as np
-import MDAnalysis as mda
-from MDAnalysis.analysis.hydrogenbonds.hbond_analysis import HydrogenBondAnalysis
-from ramachandraw.parser import get_phi_psi
-from ramachandraw.utils import fetch_pdb, plot
-import shutil
-import subprocess
-import os
+from analysis import predict_active_sites
+from batch import BATCH_COLUMNS, default_workers, parse_pdb_ids, run_batch
+from docking import (DONE as DOCKING_DONE, SCREENING_COLUMNS, ScreeningRun, get_queue as get_docking_queue,
+                     read_ligand_library, split_cores, vina_available)
+from optional import MissingDependency
+from panels import (active_sites_panel, cache_stats_panel, create_3d_view, flexibility_panel, hydrogen_bond_panel,
+                    lazy_panel, ligand_chart_panel, ligand_panel, ramachandran_panel, showmol,
+                    solvent_accessibility_panel, structure_source, structure_viewer)
 
 # ----------------------
 # App Configuration
@@ -24,147 +17,29 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# ----------------------
-# Helper Functions
-# ----------------------
-@st.cache_data
-def fetch_pdb_data(pdb_id):
-    """Fetch PDB data from RCSB with error handling"""
-    url = f"https://files.rcsb.org/download/{pdb_id}.pdb"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.text
-    except Exception as e:
-        st.error(f"Error fetching PDB data: {str(e)}")
-        return None
-
-def classify_ligand(residue):
-    """Enhanced ligand classification from VTK logic and research"""
-    resname = residue.get_resname().strip()
-    if len(resname) <= 2:
-        return 'ion'
-    elif has_polydentate_properties(residue):
-        return 'polydentate'
-    return 'monodentate'
-
-def has_polydentate_properties(residue):
-    """Simplified polydentate detection (customize as needed)"""
-    return any(atom.name in ['OXT', 'ND1', 'NE2'] for atom in residue)
-
-def extract_ligands(pdb_data):
-    """VTK-inspired ligand processing with classification"""
-    parser = PDBParser()
-    structure = parser.get_structure("temp", StringIO(pdb_data))
-    
-    ligands = {
-        'ion': [],
-        'monodentate': [],
-        'polydentate': []
-    }
-    
-    for residue in structure.get_residues():
-        if residue.id[0] != ' ':
-            ligand_type = classify_ligand(residue)
-            if ligand_type == 'ion':
-                ligands['ion'].append(residue.get_resname())
-            else:
-                ligands[ligand_type].append({
-                    'resname': residue.get_resname(),
-                    'chain': residue.parent.id,
-                    'resnum': residue.id[1],
-                    'type': ligand_type
-                })
-    return ligands
-
-def analyze_hydrogen_bonds(pdb_data):
-    """Analyze hydrogen bonds in the provided PDB data."""
-    with open("temp.pdb", "w") as f:
-        f.write(pdb_data)
-
-    u = mda.Universe("temp.pdb")
-    
-    hbonds = HydrogenBondAnalysis(
-        universe=u,
-        donors_sel="name N",  # Nitrogen atoms as donors
-        hydrogens_sel="name H",  # Hydrogen atoms for analysis
-        acceptors_sel="name O",  # Oxygen atoms as acceptors
-        d_a_cutoff=3.5,
-        d_h_a_angle_cutoff=150,
-    )
-    
-    hbonds.run()
-    
-    return hbonds.count_by_time()
-
-def predict_active_sites(pdb_data):
-    parser = PDBParser()
-    structure = parser.get_structure("temp", StringIO(pdb_data))
-    catalytic_residues = ['HIS', 'ASP', 'GLU', 'SER', 'CYS', 'LYS', 'TYR', 'ARG']
-    active_sites = []
-    for residue in structure.get_residues():
-        if residue.id[0] == ' ' and residue.get_resname() in catalytic_residues:
-            active_sites.append({
-                'resname': residue.get_resname(),
-                'chain': residue.parent.id,
-                'resnum': residue.id[1]
-            })
-    return active_sites
-
-def visualize_ligand_counts(ligands):
-    """Create a bar chart of ligand counts."""
-    labels = list(ligands.keys())
-    counts = [len(ligands[ligand_type]) for ligand_type in labels]
-    
-    fig = go.Figure(data=[
-        go.Bar(name='Ligand Counts', x=labels, y=counts)
-    ])
-    
-    fig.update_layout(title='Ligand Type Counts',
-                      xaxis_title='Ligand Type',
-                      yaxis_title='Count')
-    
-    return fig
-
-def create_3d_view(pdb_data, style='cartoon', highlight_ligands=True):
-    """Create py3Dmol view with multiple rendering options"""
-    view = py3Dmol.view(width=800, height=600)
-    view.addModel(pdb_data, 'pdb')
-    
-    if style == 'cartoon':
-        view.setStyle({'cartoon': {'color': 'spectrum'}})
-    elif style == 'surface':
-        view.setStyle({'cartoon': {'color':'white'}})
-        view.addSurface(py3Dmol.SAS, {'opacity':0.7})
-    elif style == 'sphere':
-        view.setStyle({'sphere': {'colorscheme':'Jmol'}})
-    
-    if highlight_ligands:
-        view.addStyle({'hetflag': True}, 
-                     {'stick': {'colorscheme':'greenCarbon', 'radius':0.3}})
-    
-    view.zoomTo()
-    return view
-
-def generate_ramachandran_plot(pdb_id):
-    """Generate and display the Ramachandran plot for a given PDB ID."""
-    pdb_data = fetch_pdb_data(pdb_id)
-    if pdb_data is not None:
-        ax = plot(fetch_pdb(pdb_id))  # Returns an Axes object
-        fig = ax.figure
-        return fig
-    return None
-
 # ----------------------
 # Docking UI Function
 # ----------------------
+def ligand_library(upload):
+    """[(name, fmt, bytes)] of an uploaded library, read once per uploaded file rather than on every rerun"""
+    saved = st.session_state.get("ligand-library")
+    if saved is None or saved[0] != upload.file_id:
+        saved = (upload.file_id, read_ligand_library(upload.name, upload.getvalue()))
+        st.session_state["ligand-library"] = saved
+    return saved[1]
+
 def docking_ui(pdb_data):
     st.subheader("Ligand Docking (AutoDock Vina)")
-    if shutil.which("vina") is None:
+    if not vina_available():
         st.error("AutoDock Vina is not installed or not in PATH. Please install and add to PATH.")
         return
 
-    ligand_file = st.file_uploader("Upload ligand (PDBQT)", type=["pdbqt"])
+    mode = st.radio("Docking mode", ["Single ligand", "Screening library"], horizontal=True)
+    if mode == "Single ligand":
+        ligand_file = st.file_uploader("Upload ligand (PDBQT)", type=["pdbqt"])
+    else:
+        ligand_file = st.file_uploader("Upload ligand library (SDF, multi-model PDBQT, or a zip/tar archive of them)",
+                                       type=["sdf", "pdbqt", "zip", "tar", "gz", "tgz"])
     st.markdown("#### Docking Box Parameters")
     center_x = st.number_input("Center X", value=0.0, format="%.2f")
     center_y = st.number_input("Center Y", value=0.0, format="%.2f")
@@ -172,32 +47,135 @@ def docking_ui(pdb_data):
     size_x = st.number_input("Size X (Å)", value=20.0, min_value=5.0, max_value=60.0, format="%.2f")
     size_y = st.number_input("Size Y (Å)", value=20.0, min_value=5.0, max_value=60.0, format="%.2f")
     size_z = st.number_input("Size Z (Å)", value=20.0, min_value=5.0, max_value=60.0, format="%.2f")
+    exhaustiveness = st.number_input("Exhaustiveness", value=8, min_value=1, max_value=64)
+    seed = st.number_input("Random seed", value=42, min_value=1,
+                           help="A fixed seed makes runs reproducible, so identical runs are served from cache")
+
+    if mode == "Screening library":
+        cores = st.number_input("CPU cores for screening", value=default_workers(), min_value=1,
+                                max_value=default_workers(),
+                                help="Shared with every other docking job and screen on this server")
+        if ligand_file and pdb_data:
+            ligands = ligand_library(ligand_file)
+            processes, cpu = split_cores(len(ligands), int(cores), int(exhaustiveness))
+            st.caption(f"{len(ligands)} ligands: {processes} parallel Vina processes with --cpu {cpu}")
+            if ligands and st.button("Run Screening"):
+                run = get_docking_queue().screen(
+                    pdb_data, ligands,
+                    center=(center_x, center_y, center_z),
+                    size=(size_x, size_y, size_z),
+                    exhaustiveness=int(exhaustiveness),
+                    seed=int(seed),
+                    cores=int(cores),
+                )
+                st.session_state.setdefault('docking_jobs', []).append(run.id)
+    elif ligand_file and pdb_data and st.button("Run Docking"):
+        job = get_docking_queue().submit(
+            pdb_data, ligand_file.getvalue(),
+            center=(center_x, center_y, center_z),
+            size=(size_x, size_y, size_z),
+            exhaustiveness=int(exhaustiveness),
+            seed=int(seed),
+        )
+        st.session_state.setdefault('docking_jobs', []).append(job.id)
+
+    session_jobs = [get_docking_queue().get(job_id) for job_id in st.session_state.get('docking_jobs', [])]
+    session_jobs = [job for job in session_jobs if job is not None]
+    if any(not job.done for job in session_jobs):
+        live_docking_jobs(session_jobs)
+    else:
+        docking_jobs(session_jobs)
+
+def docking_jobs(session_jobs):
+    """Status, live Vina output and results of this session's docking jobs"""
+    for job in reversed(session_jobs):
+        if isinstance(job, ScreeningRun):
+            screening_results(job)
+            continue
+        cached = " (cached result)" if job.cached else ""
+        st.markdown(f"**Job {job.id}**: {job.status}{cached} ({job.elapsed:.0f}s)")
+        if not job.done and st.button("Cancel", key=f"cancel-{job.id}"):
+            job.cancel()
+        if job.log and (not job.done or st.checkbox("Show Vina output", key=f"log-{job.id}")):
+            st.text(job.stdout())
+        if job.status == DOCKING_DONE:
+            docked_poses(job.id, job.poses())
+        elif job.error:
+            st.error(f"Docking failed: {job.error}")
+
+def docked_poses(key, poses):
+    """Scores table of every pose and a viewer loading only the selected poses"""
+    if poses is None or not len(poses):
+        st.error("Vina did not write any poses.")
+        return
+    st.success(f"Docking complete: {len(poses)} poses, best affinity {poses.best} kcal/mol.")
+    st.dataframe(poses.table(), hide_index=True)
+    show = st.radio("Show", ["Selected pose", "Top poses"], horizontal=True, key=f"show-{key}")
+    if show == "Selected pose":
+        mode = st.selectbox("Pose", range(1, len(poses) + 1), key=f"pose-{key}",
+                            format_func=lambda m: f"Mode {m} ({poses.affinities[m - 1]:.2f} kcal/mol)")
+        indices = [mode - 1]
+    else:
+        k = st.number_input("Top k", value=min(3, len(poses)), min_value=1, max_value=len(poses), key=f"top-{key}")
+        indices = poses.top(int(k))
+    try:
+        view = create_3d_view(poses.block(*indices), style='sphere', multimodel=len(indices) > 1)
+        showmol(view, height=400)
+    except MissingDependency as e:
+        st.warning(str(e))
+
+def screening_results(run):
+    """Progress and ranked hit table of a screening run"""
+    st.markdown(f"**Screen {run.id}**: {run.status}, {len(run.rows)}/{run.total} ligands ({run.elapsed:.0f}s)")
+    st.progress(len(run.rows) / max(run.total, 1))
+    if not run.done and st.button("Cancel", key=f"cancel-{run.id}"):
+        run.cancel()
+    hits = run.hits()
+    if hits:
+        st.dataframe(hits, column_order=SCREENING_COLUMNS, hide_index=True)
+        if run.done:
+            st.download_button("Download hits (CSV)", run.hits_csv(), file_name=f"screen_{run.id}.csv",
+                               key=f"download-{run.id}")
+            docked = [row for row in hits if row['poses']]
+            if docked:
+                hit = st.selectbox("View hit", docked, key=f"hit-{run.id}",
+                                   format_func=lambda row: f"#{row['rank']} {row['ligand']} ({row['affinity']} kcal/mol)")
+                docked_poses(f"{run.id}-{hit['index']}", run.poses(hit['index']))
+    if run.error:
+        st.error(f"Screening failed: {run.error}")
+
+@st.fragment(run_every=2)
+def live_docking_jobs(session_jobs):
+    """Poll running jobs without rerunning the rest of the page"""
+    docking_jobs(session_jobs)
+    if all(job.done for job in session_jobs):
+        st.rerun()
+
+# ----------------------
+# Batch Analysis UI
+# ----------------------
+def batch_ui():
+    st.header("Batch Analysis")
+    ids_text = st.text_area("PDB IDs (comma, space or newline separated):")
+    id_file = st.file_uploader("...or upload a list of PDB IDs", type=["txt", "csv"])
+    workers = st.number_input("Worker processes", min_value=1, value=default_workers(), step=1)
+
+    if id_file is not None:
+        ids_text += "\n" + id_file.getvalue().decode(errors="ignore")
+    pdb_ids, invalid = parse_pdb_ids(ids_text)
+    if invalid:
+        st.warning(f"Skipping invalid PDB IDs: {', '.join(invalid)}")
 
-    if ligand_file and pdb_data and st.button("Run Docking"):
-        with open("protein.pdb", "w") as f:
-            f.write(pdb_data)
-        os.system("obabel protein.pdb -O protein.pdbqt")
-        with open("ligand.pdbqt", "wb") as f:
-            f.write(ligand_file.read())
-        vina_cmd = [
-            "vina",
-            "--receptor", "protein.pdbqt",
-            "--ligand", "ligand.pdbqt",
-            "--center_x", str(center_x),
-            "--center_y", str(center_y),
-            "--center_z", str(center_z),
-            "--size_x", str(size_x),
-            "--size_y", str(size_y),
-            "--size_z", str(size_z),
-            "--out", "docked.pdbqt"
-        ]
-        st.write("Running docking...")
-        result = subprocess.run(vina_cmd, capture_output=True, text=True)
-        st.text(result.stdout)
-        if os.path.exists("docked.pdbqt"):
-            docked = open("docked.pdbqt").read()
-            stmol.showmol(create_3d_view(docked, style='sphere'), height=400)
-            st.success("Docking complete! Showing docked pose.")
+    if pdb_ids and st.button(f"Analyze {len(pdb_ids)} structures"):
+        progress = st.progress(0.0, text="Starting workers...")
+        table = st.empty()
+        rows = []
+        for row in run_batch(pdb_ids, max_workers=workers):
+            rows.append(row)
+            progress.progress(len(rows) / len(pdb_ids), text=f"{len(rows)}/{len(pdb_ids)} done")
+            table.dataframe(rows, column_order=BATCH_COLUMNS)
+        failed = sum(1 for row in rows if row['error'])
+        st.success(f"Analyzed {len(rows) - failed} structures" + (f", {failed} failed" if failed else ""))
 
 # ----------------------
 # UI Components
@@ -211,8 +189,8 @@ def sidebar_controls():
         
         analysis_type = st.radio(
             "Analysis Mode:",
-            ["Single Structure"],
-            help="Analyze single structure"
+            ["Single Structure", "Batch"],
+            help="Analyze a single structure, or a list of PDB IDs in parallel"
         )
         
         render_style = st.selectbox(
@@ -232,82 +210,63 @@ def sidebar_controls():
             'show_ligands': show_ligands,
         }
 
+# ----------------------
+# Analysis Panels
+# ----------------------
+def active_site_prediction_panel(pdb_data):
+    active_sites = predict_active_sites(pdb_data)
+    st.write(f"**Predicted Active Sites ({len(active_sites)} residues):**")
+    for site in active_sites:
+        st.write(f"{site['resname']} Chain {site['chain']} Residue {site['resnum']}")
+    st.info("Active sites are predicted based on common catalytic residues (HIS, ASP, GLU, SER, CYS, LYS, TYR, ARG).")
+
 # ----------------------
 # Main App Logic
 # ----------------------
 def main():
     controls = sidebar_controls()
+
+    if controls['analysis_type'] == "Batch":
+        batch_ui()
+        return
     
     col1, col2 = st.columns([3, 1])
     
     with col1:
         st.header("Protein Palette")
         
-        pdb_id = st.text_input("Enter PDB ID:").upper()
-        pdb_data = fetch_pdb_data(pdb_id) if pdb_id else None
+        pdb_id, pdb_data = structure_source()
         
         if pdb_data:
-            view = create_3d_view(
-                pdb_data, 
+            structure_viewer(
+                pdb_data,
                 style=controls['render_style'],
                 highlight_ligands=controls['show_ligands']
             )
-            stmol.showmol(view, height=600, width=800)
             
             # Generate and display Ramachandran plot
-            with st.expander("Ramachandran Plot"):
-                ramachandran_fig = generate_ramachandran_plot(pdb_id)
-                if ramachandran_fig is not None:
-                    st.pyplot(ramachandran_fig)
-                else:
-                    st.warning("Unable to generate Ramachandran plot. Please check the PDB ID.")
+            lazy_panel("Ramachandran Plot", ramachandran_panel, pdb_id, pdb_data)
 
             # Docking feature below Ramachandran plot
-            with st.expander("Ligand Docking (AutoDock Vina)"):
-                docking_ui(pdb_data)
+            docking = st.expander("Ligand Docking (AutoDock Vina)", key="panel-docking", on_change="rerun")
+            if docking.open:
+                with docking:
+                    docking_ui(pdb_data)
         else:
-            st.warning("Please provide a valid PDB ID to visualize the protein structure.")
+            st.warning("Please provide a valid PDB ID or structure file to visualize the protein structure.")
                 
     with col2:
         st.header("Protein Dynamics")  
         
         if pdb_data:
-            with st.expander("Ligand Information"):
-                ligands = extract_ligands(pdb_data)
-                st.write(f"**Ions:** {len(ligands['ion'])}")
-                st.write(f"**Ion Names:** {', '.join(ligands['ion'])}")
-                st.write(f"**Monodentate Ligands:** {len(ligands['monodentate'])}")
-                st.write(f"**Polydentate Ligands:** {len(ligands['polydentate'])}")
-            
-            with st.expander("Active Sites"):
-                active_sites = [res for res in PDBParser()
-                    .get_structure("temp", StringIO(pdb_data))
-                    .get_residues() if res.get_resname() in ['HIS', 'ASP', 'GLU']]
-                st.write(f"**Potential Active Sites:** {len(active_sites)}")
-                st.write("Common catalytic residues highlighted")
-            
-            with st.expander("Flexibility Report"):
-                st.plotly_chart(px.histogram(x=range(10), y=range(10), 
-                                  title="Residue Flexibility"))
-                st.caption("Simulated flexibility data - integrate MD analysis here")
-            
-            with st.expander("Hydrogen Bond Analysis"):
-                hbond_counts = analyze_hydrogen_bonds(pdb_data)
-                total_hbonds = np.sum(hbond_counts)
-                st.write(f"Total Hydrogen Bonds: {total_hbonds}")
-                if total_hbonds > 0:
-                    st.write(f"Counts per Frame: {hbond_counts}")
-            
-            with st.expander("Active Site Prediction"):
-                active_sites = predict_active_sites(pdb_data)
-                st.write(f"**Predicted Active Sites ({len(active_sites)} residues):**")
-                for site in active_sites:
-                    st.write(f"{site['resname']} Chain {site['chain']} Residue {site['resnum']}")
-                st.info("Active sites are predicted based on common catalytic residues (HIS, ASP, GLU, SER, CYS, LYS, TYR, ARG).")
-            
-            with st.expander("Ligand Type Visualization"):
-                fig = visualize_ligand_counts(ligands)
-                st.plotly_chart(fig)
+            lazy_panel("Ligand Information", ligand_panel, pdb_data)
+            lazy_panel("Active Sites", active_sites_panel, pdb_data)
+            lazy_panel("Flexibility Report", flexibility_panel, pdb_data)
+            lazy_panel("Solvent Accessibility", solvent_accessibility_panel, pdb_data)
+            lazy_panel("Hydrogen Bond Analysis", hydrogen_bond_panel, pdb_data)
+            lazy_panel("Active Site Prediction", active_site_prediction_panel, pdb_data)
+            lazy_panel("Ligand Type Visualization", ligand_chart_panel, pdb_data)
+        lazy_panel("Cache Statistics", cache_stats_panel)
 
 if __name__ == "__main__":
     main()
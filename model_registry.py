@@ -0,0 +1,108 @@
+"""Process-wide registry of pre-trained prediction models.
+
+Each model file is loaded once per process with joblib, memory-mapping large
+NumPy arrays (mmap_mode) so worker processes share their pages, and reloaded
+automatically when the file on disk changes. Predictions are batched: a whole
+feature matrix goes through one model.predict call. A file that cannot be
+unpickled (truncated, stale, or referring to classes that are not installed)
+raises ModelLoadError.
+
+Configuration (environment variables):
+    BINDING_MODEL_PATH  binding affinity model (default: model.pkl)
+    MODEL_MMAP_MODE     joblib mmap_mode for loaded arrays, or "none" (default: r)
+"""
+import io
+import os
+import threading
+
+import numpy as np
+
+from cache import SingleFlight
+from optional import require
+
+BINDING_MODEL_PATH = os.environ.get("BINDING_MODEL_PATH", "model.pkl")
+
+class ModelLoadError(RuntimeError):
+    """A model file exists but could not be unpickled into a usable model"""
+
+def _mmap_mode():
+    mode = os.environ.get("MODEL_MMAP_MODE", "r").strip()
+    return None if mode.lower() in ("", "none") else mode
+
+class ModelRegistry:
+    """Models keyed by path, loaded once and reloaded when the file's mtime or size changes"""
+
+    def __init__(self, mmap_mode='r'):
+        self.mmap_mode = mmap_mode
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path=BINDING_MODEL_PATH):
+        """Loaded model for path; concurrent first loads share one joblib.load"""
+        path = os.path.abspath(path)
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        return self._flight.do((path, signature), self._load, path, signature)
+
+    def _load(self, path, signature):
+        joblib = require("joblib", "Binding affinity models")
+        try:
+            model = joblib.load(path, mmap_mode=self.mmap_mode)
+        except OSError:
+            raise
+        except Exception as e:
+            # unpickling can fail in many ways: UnpicklingError, EOFError, struct.error,
+            # AttributeError/ModuleNotFoundError for estimator classes that are gone
+            raise ModelLoadError(f"{path} could not be loaded ({type(e).__name__}: {e})") from e
+        with self._lock:
+            self._entries[path] = (signature, model)
+        return model
+
+    def loaded(self):
+        """{path: (mtime_ns, size)} of the models currently in memory"""
+        with self._lock:
+            return {path: entry[0] for path, entry in self._entries.items()}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def predict_many(self, features, path=BINDING_MODEL_PATH):
+        """Predictions for a matrix of feature rows (a single row is accepted too)"""
+        X = np.asarray(features, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        model = self.get(path)
+        expected = getattr(model, "n_features_in_", None)
+        if expected is not None and X.shape[1] != expected:
+            raise ValueError(f"model expects {expected} features per row, got {X.shape[1]}")
+        return np.asarray(model.predict(X))
+
+REGISTRY = ModelRegistry(mmap_mode=_mmap_mode())
+
+def predict_many(features, path=BINDING_MODEL_PATH):
+    return REGISTRY.predict_many(features, path)
+
+def read_feature_rows(data):
+    """(header or None, float matrix) from CSV text or bytes, one feature row per line"""
+    if isinstance(data, bytes):
+        data = data.decode()
+    lines = [line for line in data.splitlines() if line.strip()]
+    header = None
+    if lines:
+        try:
+            [float(x) for x in lines[0].split(",")]
+        except ValueError:
+            header, lines = [x.strip() for x in lines[0].split(",")], lines[1:]
+    if not lines:
+        return header, np.zeros((0, len(header or [])))
+    return header, np.loadtxt(io.StringIO("\n".join(lines)), delimiter=",", ndmin=2)
@@ -0,0 +1,35 @@
+"""Heavy and optional dependencies, imported on first use.
+
+Modules that are slow to import (py3Dmol, stmol, SciPy, Bio.PDB,
+MDAnalysis, Plotly, joblib) are loaded through require() inside the functions
+that need them, so the Streamlit entry points render their first widgets
+without paying for them. A missing package raises MissingDependency, which
+the apps catch to disable only the feature that needs it.
+
+Usage:
+    go = require("plotly.graph_objects", "Ligand charts")
+"""
+import importlib
+
+# import name -> pip distribution name, where they differ
+PACKAGES = {
+    'Bio': 'biopython',
+    'sklearn': 'scikit-learn',
+}
+
+class MissingDependency(ImportError):
+    """An optional package needed by a feature is not installed"""
+
+def package_name(module):
+    root = module.split('.')[0]
+    return PACKAGES.get(root, root)
+
+def require(module, feature=None):
+    """Import module on first use, or raise MissingDependency naming the feature"""
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        package = package_name(module)
+        raise MissingDependency(
+            f"{feature or module} is unavailable: the optional package '{package}' is not installed "
+            f"(pip install {package})") from e
@@ -0,0 +1,265 @@
+"""Streamlit components shared by the Protein Molecule Mosaic apps.
+
+The structure source picker, the level-of-detail 3D viewer and the lazily
+rendered analysis panels live here, so model.py and modelling.py only lay
+them out. Every analysis behind a panel is memoized per structure in its own
+module; these functions render results and never compute them twice.
+"""
+import time
+
+import numpy as np
+import streamlit as st
+
+from analysis import (analyze_hydrogen_bonds, backbone_dihedrals, count_residues, extract_ligands,
+                      ramachandran_figure, visualize_ligand_counts)
+from cache import BUDGET, MB
+from flexibility import N_MODES, flexibility_figure, flexibility_profile
+from lod import (CHAINS, FULL, LOD_LABELS, SURFACE_COLOR_MAX, TRACE, VIEWER_FULL_ATOMS, auto_mode, chain_ids,
+                 reduced_model, surface_model)
+from optional import MissingDependency, require
+from pdb_store import fetch_best
+from sasa import EXPOSED_THRESHOLD, PROBE_RADIUS, residue_sasa
+from structure import get_structure, structure_format
+from structure_files import UPLOAD_TYPES, local_structure_dirs, open_local_structure, save_upload
+
+STRUCTURE_SOURCES = ["PDB ID", "Upload file", "Local path"]
+
+# ----------------------
+# Structure Source
+# ----------------------
+def fetch_pdb_data(pdb_id):
+    """Fetch the structure (legacy PDB, else BinaryCIF or mmCIF) from the text cache or local store, falling back to RCSB"""
+    try:
+        return fetch_best(pdb_id)
+    except ValueError as e:
+        st.error(f"Invalid PDB ID: {e}")
+        return None
+    except Exception as e:
+        st.error(f"Error fetching PDB data: {str(e)}")
+        return None
+
+def uploaded_structure(upload):
+    """StructureFile for an upload, spooled to disk once per uploaded file rather than on every rerun
+
+    A copy evicted from the upload directory is spooled again.
+    """
+    saved = st.session_state.get("structure-upload-file")
+    if saved is None or saved[0] != upload.file_id or not saved[1].exists():
+        saved = (upload.file_id, save_upload(upload, upload.name))
+        st.session_state["structure-upload-file"] = saved
+    return saved[1]
+
+def structure_source(default_id=""):
+    """(label, structure data) from a PDB ID, an uploaded file or a file under LOCAL_STRUCTURE_DIRS
+
+    Files are returned as StructureFile objects, parsed from disk by every panel.
+    """
+    source = st.radio("Structure source:", STRUCTURE_SOURCES, horizontal=True, key="structure-source")
+    if source == "Upload file":
+        upload = st.file_uploader("Structure file:", type=UPLOAD_TYPES, key="structure-upload",
+                                  help="PDB, mmCIF or BinaryCIF, optionally gzipped")
+        if upload is None:
+            return None, None
+        try:
+            return upload.name, uploaded_structure(upload)
+        except (OSError, ValueError) as e:
+            st.error(f"Error reading upload: {e}")
+            return None, None
+    if source == "Local path":
+        path = st.text_input("Structure file path:", key="structure-path",
+                             help=f"A file under {', '.join(local_structure_dirs())}")
+        if not path:
+            return None, None
+        try:
+            structure_file = open_local_structure(path)
+        except (OSError, ValueError) as e:
+            st.error(f"Error opening structure file: {e}")
+            return None, None
+        return structure_file.name, structure_file
+    pdb_id = st.text_input("Enter PDB ID:", value=default_id).upper()
+    return pdb_id, fetch_pdb_data(pdb_id) if pdb_id else None
+
+# ----------------------
+# 3D Viewer
+# ----------------------
+def create_3d_view(pdb_data, style='cartoon', highlight_ligands=True, multimodel=False, surface=None):
+    """Create py3Dmol view with multiple rendering options (multimodel: show every MODEL at once,
+    surface: precomputed surface_model text colored by SASA instead of a browser-computed surface)"""
+    py3Dmol = require("py3Dmol", "The 3D viewer")
+    view = py3Dmol.view(width=800, height=600)
+    if multimodel:
+        view.addModels(pdb_data, structure_format(pdb_data))
+    else:
+        view.addModel(pdb_data, structure_format(pdb_data))
+
+    if style == 'cartoon':
+        view.setStyle({'cartoon': {'color': 'spectrum'}})
+    elif style == 'trace':
+        view.setStyle({'cartoon': {'style': 'trace', 'color': 'spectrum'}})
+    elif style == 'surface':
+        view.setStyle({'cartoon': {'color':'white'}})
+        if surface is None:
+            view.addSurface(py3Dmol.SAS, {'opacity':0.7})
+    elif style == 'sphere':
+        view.setStyle({'sphere': {'colorscheme':'Jmol'}})
+
+    if highlight_ligands:
+        view.addStyle({'hetflag': True},
+                     {'stick': {'colorscheme':'greenCarbon', 'radius':0.3}})
+
+    if style == 'surface' and surface is not None:
+        view.addModel(surface, structure_format(surface))
+        view.setStyle({'model': -1}, {'sphere': {'colorscheme': {
+            'prop': 'b', 'gradient': 'rwb', 'min': SURFACE_COLOR_MAX, 'max': 0}}})
+
+    view.zoomTo()
+    return view
+
+def showmol(view, **kwargs):
+    require("stmol", "The 3D viewer").showmol(view, **kwargs)
+
+@st.fragment
+def structure_viewer(pdb_data, style='cartoon', highlight_ligands=True):
+    """3D viewer that sends a reduced model for large structures, with full detail on demand"""
+    n_atoms = len(get_structure(pdb_data).atoms)
+    modes = [None] + list(LOD_LABELS)
+    mode = st.selectbox(
+        "Detail level:", modes, key="viewer-detail",
+        format_func=lambda m: f"Auto ({LOD_LABELS[auto_mode(n_atoms)]})" if m is None else LOD_LABELS[m],
+        help=f"Structures above {VIEWER_FULL_ATOMS:,} atoms are shown as a CA/P trace unless full detail is requested"
+    ) or auto_mode(n_atoms)
+    chains = ()
+    if mode == CHAINS:
+        all_chains = chain_ids(pdb_data)
+        chains = tuple(st.multiselect("Chains:", all_chains, default=all_chains[:1], key="viewer-chains"))
+
+    start = time.perf_counter()
+    model_data, shown = reduced_model(pdb_data, mode, chains)
+    if not shown:
+        st.info(f"Nothing to show at this level of detail ({LOD_LABELS[mode]}).")
+        return
+    surface, exposed = None, 0
+    if style == 'surface' and mode != TRACE:
+        surface, exposed = surface_model(pdb_data, mode, chains)
+    try:
+        view = create_3d_view(
+            model_data,
+            style='trace' if mode == TRACE and style != 'sphere' else style,
+            highlight_ligands=highlight_ligands,
+            surface=surface
+        )
+        payload = len(model_data) + len(surface or "")
+        elapsed = time.perf_counter() - start
+        showmol(view, height=600, width=800)
+    except MissingDependency as e:
+        st.warning(str(e))
+        return
+
+    surface_note = f" (+{exposed:,} exposed atoms colored by SASA)" if surface is not None else ""
+    st.caption(f"{LOD_LABELS[mode]}: {shown:,} of {n_atoms:,} atoms{surface_note}, "
+               f"{payload / 1e6:.2f} MB sent to the browser, prepared in {elapsed * 1000:.0f} ms")
+    if mode != FULL:
+        st.button("Load full detail", key="viewer-full",
+                  on_click=lambda: st.session_state.update({"viewer-detail": FULL}))
+
+# ----------------------
+# Analysis Panels
+# ----------------------
+@st.fragment
+def lazy_panel(label, render, *args):
+    """Expander whose body runs only while it is open, rerunning on its own
+
+    Opening or using a panel reruns just this fragment, and the analyses behind
+    it are memoized per structure, so viewer changes never recompute them.
+    """
+    panel = st.expander(label, key=f"panel-{label}", on_change="rerun")
+    if panel.open:
+        with panel:
+            try:
+                render(*args)
+            except MissingDependency as e:
+                st.warning(str(e))
+
+def generate_ramachandran_plot(pdb_id, pdb_data):
+    """Ramachandran plot of the already-fetched structure (dihedrals cached per structure hash)"""
+    dihedrals = backbone_dihedrals(pdb_data)
+    if np.all(np.isnan(dihedrals['phi']) & np.isnan(dihedrals['psi'])):
+        return None
+    return ramachandran_figure(dihedrals, title=f"Ramachandran Plot ({pdb_id})")
+
+def ramachandran_panel(pdb_id, pdb_data):
+    ramachandran_fig = generate_ramachandran_plot(pdb_id, pdb_data)
+    if ramachandran_fig is not None:
+        st.plotly_chart(ramachandran_fig)
+    else:
+        st.warning("Unable to generate Ramachandran plot: no protein backbone found.")
+
+def ligand_panel(pdb_data):
+    ligands = extract_ligands(pdb_data)
+    st.write(f"**Ions:** {len(ligands['ion'])}")
+    st.write(f"**Ion Names:** {', '.join(ligands['ion'])}")
+    st.write(f"**Monodentate Ligands:** {len(ligands['monodentate'])}")
+    st.write(f"**Polydentate Ligands:** {len(ligands['polydentate'])}")
+
+def active_sites_panel(pdb_data):
+    n_active_sites = count_residues(pdb_data, ['HIS', 'ASP', 'GLU'])
+    st.write(f"**Potential Active Sites:** {n_active_sites}")
+    st.write("Common catalytic residues highlighted")
+
+def flexibility_panel(pdb_data):
+    network_model = st.radio("Network model", ["GNM", "ANM"], horizontal=True,
+                             help="Gaussian (isotropic) or anisotropic elastic network model")
+    profile = flexibility_profile(pdb_data, network_model)
+    if len(profile['resnum']):
+        st.plotly_chart(flexibility_figure(profile, network_model))
+        st.caption(f"Normalized CA B-factors and {network_model} fluctuations "
+                   f"from the {N_MODES} lowest modes")
+    else:
+        st.warning("No CA atoms found for a flexibility report.")
+
+def solvent_accessibility_panel(pdb_data):
+    profile = residue_sasa(pdb_data)
+    standard = ~np.isnan(profile['relative'])
+    n_exposed = int(profile['exposed'].sum())
+    st.write(f"**Total SASA:** {profile['sasa'].sum():,.0f} Å²")
+    st.write(f"**Exposed Residues:** {n_exposed} · **Buried Residues:** {int(standard.sum()) - n_exposed}")
+    show = st.radio("Show", ["All", "Exposed", "Buried"], horizontal=True, key="sasa-filter")
+    selected = {'All': standard, 'Exposed': profile['exposed'], 'Buried': standard & ~profile['exposed']}[show]
+    st.dataframe({
+        'chain': profile['chain'][selected],
+        'resnum': profile['resnum'][selected],
+        'resname': profile['resname'][selected],
+        'sasa': np.round(profile['sasa'][selected], 1),
+        'relative': np.round(profile['relative'][selected], 2),
+    }, hide_index=True)
+    st.caption(f"Shrake-Rupley SASA ({PROBE_RADIUS} Å probe); residues with relative SASA ≥ {EXPOSED_THRESHOLD:.0%} "
+               "of their theoretical maximum count as exposed")
+
+def hydrogen_bond_panel(pdb_data):
+    hbond_counts = analyze_hydrogen_bonds(pdb_data)
+    total_hbonds = np.sum(hbond_counts)
+    st.write(f"Total Hydrogen Bonds: {total_hbonds}")
+    if total_hbonds > 0:
+        st.write(f"Counts per Frame: {hbond_counts}")
+
+def ligand_chart_panel(pdb_data):
+    st.plotly_chart(visualize_ligand_counts(extract_ligands(pdb_data)))
+
+def cache_stats_panel():
+    namespaces = BUDGET.stats()
+    st.write(f"**Cache Memory:** {BUDGET.used() / MB:,.1f} of {BUDGET.max_bytes / MB:,.0f} MB")
+    st.dataframe({
+        'namespace': [row['namespace'] for row in namespaces],
+        'MB': [round(row['bytes'] / MB, 1) for row in namespaces],
+        'quota MB': [round(row['quota'] / MB) for row in namespaces],
+        'entries': [row['entries'] for row in namespaces],
+        'hit rate': [None if row['hit_rate'] is None else round(row['hit_rate'], 2) for row in namespaces],
+        'evictions': [row['evictions'] for row in namespaces],
+        'expirations': [row['expirations'] for row in namespaces],
+    }, hide_index=True)
+    caches = [row for row in BUDGET.cache_stats() if row['hits'] or row['misses'] or row['entries']]
+    st.dataframe({field: [row[field] for row in caches]
+                  for field in ('name', 'entries', 'bytes', 'hits', 'misses', 'evictions', 'expirations')},
+                 hide_index=True)
+    st.caption("Shared by every session of this server process; "
+               "least recently used entries are evicted past a namespace quota or the total budget")
@@ -0,0 +1,271 @@
+"""Persistent, content-addressed on-disk store for downloaded structures.
+
+Structures are kept gzip-compressed under objects/<sha256[:2]>/<sha256>.gz and
+looked up through small ref files at refs/<format>/<PDB ID>. Every file is
+written to a temporary name and renamed into place, so concurrent processes
+(replicas sharing a volume) never see partial writes.
+
+Configuration (environment variables):
+    PDB_STORE_DIR        store location (default: ~/.cache/protein_mosaic/pdb_store)
+    PDB_STORE_MAX_BYTES  size cap of the compressed objects (default: 2 GiB)
+    PDB_STORE_OFFLINE    set to 1 to never touch the network
+    RCSB_DOWNLOAD_URL    download base URL (default: https://files.rcsb.org/download)
+    RCSB_MODELS_URL      BinaryCIF base URL (default: https://models.rcsb.org)
+    PDB_FORMATS          formats fetch_best tries, in order (default: pdb,bcif,cif)
+    PDB_FETCH_TIMEOUT    seconds fetch_best waits across all formats and retries (default: 60)
+
+Usage:
+    python pdb_store.py import fixtures/1ABC.pdb fixtures/2XYZ.cif fixtures/3ABC.bcif
+    python pdb_store.py evict
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import requests
+
+import http_client
+from batch import PDB_ID_PATTERN
+from cache import TEXT, memoize
+
+RCSB_URL = os.environ.get("RCSB_DOWNLOAD_URL", "https://files.rcsb.org/download") + "/{pdb_id}.{fmt}"
+BCIF_URL = os.environ.get("RCSB_MODELS_URL", "https://models.rcsb.org") + "/{pdb_id}.bcif"
+TEXT_FORMATS = ('pdb', 'cif')
+STORE_FORMATS = TEXT_FORMATS + ('bcif',)
+# entries too large for the legacy format only exist as mmCIF/BinaryCIF
+STRUCTURE_FORMATS = tuple(fmt.strip() for fmt in os.environ.get("PDB_FORMATS", "pdb,bcif,cif").split(",") if fmt.strip())
+FETCH_TIMEOUT = float(os.environ.get("PDB_FETCH_TIMEOUT", 60))
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "protein_mosaic", "pdb_store")
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+class OfflineError(LookupError):
+    """Structure is not in the local store and network access is disabled"""
+
+def _atomic_write(path, data):
+    """Write bytes to path via a temporary file and an atomic rename"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _check_entry(pdb_id, fmt):
+    """Upper-cased pdb_id, or ValueError for an ID or format that could name a path outside the store"""
+    if not isinstance(pdb_id, str) or not PDB_ID_PATTERN.match(pdb_id.upper()):
+        raise ValueError(f"{pdb_id!r} is not a PDB ID (four characters, starting with a digit)")
+    if fmt not in STORE_FORMATS:
+        raise ValueError(f"{fmt!r} is not a structure format ({', '.join(STORE_FORMATS)})")
+    return pdb_id.upper()
+
+def _env_flag(name):
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+# ----------------------
+# Content-addressed Store
+# ----------------------
+class ContentStore:
+    """gzip-compressed blobs addressed by content hash and named by (name, kind) refs
+
+    Objects are evicted least recently used first once the store exceeds
+    max_bytes, and (when max_age is set) once unused for max_age seconds.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, max_age=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.gz")
+
+    def _ref_path(self, name, kind):
+        return os.path.join(self.root, "refs", kind, name.upper())
+
+    def get(self, name, kind):
+        """Stored bytes for (name, kind), or None on a miss"""
+        try:
+            with open(self._ref_path(name, kind)) as f:
+                digest = f.read().strip()
+            path = self._object_path(digest)
+            with open(path, "rb") as f:
+                data = gzip.decompress(f.read())
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile):
+            return None
+        if hashlib.sha256(data).hexdigest() != digest:
+            return None
+        try:
+            os.utime(path)  # mark as recently used for LRU eviction
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, name, kind, data):
+        """Store bytes under (name, kind) and return their content hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            _atomic_write(path, gzip.compress(data))
+        _atomic_write(self._ref_path(name, kind), digest.encode())
+        self.evict()
+        return digest
+
+    def _objects(self):
+        objects_dir = os.path.join(self.root, "objects")
+        for dirpath, _, filenames in os.walk(objects_dir):
+            for filename in filenames:
+                if filename.endswith(".gz"):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def size(self):
+        return sum(size for _, size, _ in self._objects())
+
+    def evict(self):
+        """Delete stale objects, then least recently used ones until the store fits in max_bytes"""
+        objects = sorted(self._objects(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in objects)
+        stale_before = time.time() - self.max_age if self.max_age else None
+        for path, size, last_used in objects:
+            if total <= self.max_bytes and (stale_before is None or last_used >= stale_before):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size  # refs to evicted objects read as misses
+
+# ----------------------
+# Structure Store
+# ----------------------
+class PDBStore(ContentStore):
+    """Structure files keyed by PDB ID and format, with an LRU size cap and offline mode"""
+
+    def __init__(self, root=None, max_bytes=None, offline=None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("PDB_STORE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        super().__init__(root or os.environ.get("PDB_STORE_DIR", DEFAULT_ROOT), max_bytes)
+        self.offline = _env_flag("PDB_STORE_OFFLINE") if offline is None else offline
+
+    def fetch(self, pdb_id, fmt='pdb', download=None):
+        """Stored bytes, downloading and storing them on a miss unless offline (ValueError for a bad ID)"""
+        pdb_id = _check_entry(pdb_id, fmt)
+        data = self.get(pdb_id, fmt)
+        if data is not None:
+            return data
+        if self.offline:
+            raise OfflineError(f"{pdb_id}.{fmt} is not in the local store ({self.root}) and offline mode is on")
+        data = (download or download_structure)(pdb_id, fmt)
+        self.put(pdb_id, fmt, data)
+        return data
+
+    def import_file(self, path, pdb_id=None, fmt=None):
+        """Seed the store from a local file such as 1ABC.pdb or 1ABC.cif.gz"""
+        name = os.path.basename(path)
+        if name.endswith(".gz"):
+            name = name[:-3]
+        stem, _, ext = name.partition(".")
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            data = f.read()
+        fmt = fmt or ext
+        return self.put(_check_entry(pdb_id or stem, fmt), fmt, data)
+
+def download_structure(pdb_id, fmt='pdb'):
+    """Download a structure file from RCSB"""
+    url = BCIF_URL if fmt == 'bcif' else RCSB_URL
+    response = http_client.get(url.format(pdb_id=pdb_id.upper(), fmt=fmt))
+    response.raise_for_status()
+    return response.content
+
+PDB_STORE = PDBStore()
+
+def _fetch_key(pdb_id, fmt='pdb', store=None):
+    return ((store or PDB_STORE).root, pdb_id.upper(), fmt)
+
+@memoize(key=_fetch_key, max_entries=256, namespace=TEXT)
+def fetch_structure(pdb_id, fmt='pdb', store=None):
+    """Structure from the on-disk store (downloading on a miss); text formats are decoded
+
+    Results stay in the in-memory text cache, and concurrent requests for the
+    same structure share a single download. An invalid PDB ID raises ValueError.
+    """
+    pdb_id = _check_entry(pdb_id, fmt)
+    store = store or PDB_STORE
+    data = store.fetch(pdb_id, fmt)
+    return data.decode() if fmt in TEXT_FORMATS else data
+
+def _before_deadline(deadline, fn, *args):
+    """fn(*args) run on a daemon thread, or requests.Timeout once time.monotonic() reaches deadline
+
+    A call still running at the deadline finishes in the background, so a slow
+    download still lands in the store and the text cache for the next caller.
+    """
+    future = Future()
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, name="pdb-fetch", daemon=True).start()
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise requests.Timeout("deadline passed") from None
+
+def fetch_best(pdb_id, formats=None, store=None, timeout=None):
+    """First structure available among formats (STRUCTURE_FORMATS by default): text, or BinaryCIF bytes
+
+    A format missing from RCSB (HTTP error), unreachable (BinaryCIF comes from
+    another host, so a connection error or timeout there is not final) or
+    missing from an offline store falls through to the next one; if none is
+    available the first error is raised. Every format and retry together get
+    timeout seconds (FETCH_TIMEOUT by default), after which requests.Timeout
+    is raised.
+    """
+    timeout = FETCH_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    errors = []
+    for fmt in formats or STRUCTURE_FORMATS:
+        try:
+            return _before_deadline(deadline, fetch_structure, pdb_id, fmt, store)
+        except requests.Timeout as e:
+            if time.monotonic() >= deadline:
+                raise requests.Timeout(f"no structure for {pdb_id} within {timeout:g} s") from e
+            errors.append(e)
+        except (OfflineError, requests.RequestException) as e:
+            errors.append(e)
+    raise errors[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Seed the store from local files")
+    import_parser.add_argument("paths", nargs="+")
+    subparsers.add_parser("evict", help="Apply the size cap now")
+    args = parser.parse_args()
+    if args.command == "import":
+        for path in args.paths:
+            print(f"{path} -> {PDB_STORE.import_file(path)}")
+    else:
+        PDB_STORE.evict()
+        print(f"{PDB_STORE.size()} bytes in {PDB_STORE.root}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Headless entry point running the model.py analyses without Streamlit.
+
+Analyzes PDB IDs (fetched through the shared structure store) and/or local
+structure files (PDB, mmCIF or BinaryCIF, optionally gzipped, read as streams)
+with a pool of worker processes, and writes one row per structure to JSONL or
+Parquet. Rows are checkpointed to JSONL as they finish, keyed by their source
+(the PDB ID or the file path), so an interrupted run picks up where it stopped
+with --resume.
+
+Usage:
+    python pipeline.py --ids 1HSG 3IAR -o results.jsonl
+    python pipeline.py --id-file ids.txt --workers 8 -o results.parquet --resume
+    python pipeline.py --dir structures/ -o results.jsonl --charts charts/
+"""
+import argparse
+import json
+import os
+import sys
+
+from batch import BATCH_COLUMNS, analyze_pdb_id, analyze_structure, default_workers, parse_pdb_ids, run_batch
+from structure_files import FORMATS, StructureFile
+
+STRUCTURE_SUFFIXES = tuple(f'.{ext}{gz}' for gz in ('.gz', '') for ext in FORMATS)
+
+def structure_id(path):
+    name = os.path.basename(path)
+    for suffix in STRUCTURE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)].upper()
+    return name.upper()
+
+def analyze_file(path):
+    """Worker for local structure files"""
+    row = analyze_structure(structure_id(path), lambda: StructureFile(path))
+    row['source'] = path
+    return row
+
+def analyze_item(item):
+    """Worker dispatching ('id', PDB ID) and ('file', path) items"""
+    kind, value = item
+    if kind == 'file':
+        return analyze_file(value)
+    row = analyze_pdb_id(value)
+    row['source'] = value
+    return row
+
+# ----------------------
+# Inputs & Checkpoints
+# ----------------------
+def collect_items(args):
+    items, invalid = [], []
+    id_text = ' '.join(args.ids or [])
+    if args.id_file:
+        with open(args.id_file) as f:
+            id_text += '\n' + f.read()
+    if id_text.strip():
+        valid, invalid = parse_pdb_ids(id_text)
+        items += [('id', pdb_id) for pdb_id in valid]
+    if args.dir:
+        for name in sorted(os.listdir(args.dir)):
+            if name.lower().endswith(STRUCTURE_SUFFIXES):
+                items.append(('file', os.path.join(args.dir, name)))
+    return items, invalid
+
+def item_key(item):
+    """Checkpoint key of an item: its PDB ID or file path, as stored in the row's source"""
+    return item[1]
+
+def row_key(row):
+    return row.get('source') or row['pdb_id']
+
+def checkpoint_path(output):
+    return output if output.endswith('.jsonl') else output + '.checkpoint.jsonl'
+
+def load_checkpoint(path):
+    """Rows already written to a checkpoint, keyed by source (later rows win)"""
+    rows = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    row = json.loads(line)
+                    rows[row_key(row)] = row
+    return rows
+
+def write_parquet(rows, path):
+    try:
+        import pandas as pd
+        pd.DataFrame(rows).to_parquet(path, index=False)
+    except ImportError as e:
+        raise SystemExit(f"Parquet output needs pandas and pyarrow: {e}")
+
+def write_charts(rows, directory):
+    """One ligand-count bar chart (HTML) per analyzed structure, named after its PDB ID or file"""
+    from analysis import visualize_ligand_counts
+
+    os.makedirs(directory, exist_ok=True)
+    for row in rows:
+        if row.get('error'):
+            continue
+        counts = {'ion': row['ions'], 'monodentate': row['monodentate'], 'polydentate': row['polydentate']}
+        fig = visualize_ligand_counts({ligand_type: range(n) for ligand_type, n in counts.items()})
+        fig.update_layout(title=f"{row['pdb_id']} Ligand Type Counts")
+        name = os.path.basename(row_key(row))
+        fig.write_html(os.path.join(directory, f"{name}_ligands.html"))
+
+# ----------------------
+# Command Line
+# ----------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ids', nargs='*', help="PDB IDs to fetch and analyze")
+    parser.add_argument('--id-file', help="File with PDB IDs (comma, space or newline separated)")
+    parser.add_argument('--dir', help="Directory of .pdb/.ent/.cif/.bcif files (optionally gzipped)")
+    parser.add_argument('-o', '--output', required=True, help="Output file (.jsonl or .parquet)")
+    parser.add_argument('-w', '--workers', type=int, default=default_workers(), help="Worker processes")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip structures already analyzed successfully in the checkpoint")
+    parser.add_argument('--charts', help="Also write ligand-count charts (HTML) to this directory")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    items, invalid = collect_items(args)
+    for pdb_id in invalid:
+        print(f"skipping invalid PDB ID: {pdb_id}", file=sys.stderr)
+    if not items:
+        print("nothing to analyze: pass --ids, --id-file or --dir", file=sys.stderr)
+        return 2
+
+    checkpoint = checkpoint_path(args.output)
+    if args.resume:
+        done = {key for key, row in load_checkpoint(checkpoint).items() if not row.get('error')}
+        items = [item for item in items if item_key(item) not in done]
+        print(f"resuming: {len(done)} done, {len(items)} to go", file=sys.stderr)
+    elif os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    with open(checkpoint, 'a') as f:
+        for n, row in enumerate(run_batch(items, max_workers=args.workers, worker=analyze_item), 1):
+            f.write(json.dumps(row) + '\n')
+            f.flush()
+            status = row['error'] or 'ok'
+            print(f"[{n}/{len(items)}] {row_key(row)} {status} ({row['seconds']}s)", file=sys.stderr)
+
+    rows = list(load_checkpoint(checkpoint).values())
+    if args.output.endswith('.jsonl'):
+        # drop rows superseded by retries of previously failed structures
+        with open(checkpoint + '.tmp', 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+        os.replace(checkpoint + '.tmp', checkpoint)
+    else:
+        write_parquet([{column: row.get(column) for column in BATCH_COLUMNS + ['source']} for row in rows],
+                      args.output)
+        os.remove(checkpoint)
+    if args.charts:
+        write_charts(rows, args.charts)
+    failed = sum(1 for row in rows if row.get('error'))
+    print(f"wrote {len(rows)} rows to {args.output} ({failed} failed)", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
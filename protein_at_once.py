@@ -1,7 +1,13 @@
+import math
+
 import streamlit as st
-import requests
-import py3Dmol
-import stmol  
+import numpy as np
+from lod import auto_mode, reduced_model
+from optional import MissingDependency
+from panels import create_3d_view, fetch_pdb_data, showmol, uploaded_structure
+from records import RAW_PAGE_LINES, record_index
+from structure import get_structure
+from structure_files import UPLOAD_TYPES, local_structure_dirs, open_local_structure
 
 
 st.set_page_config(
@@ -42,46 +48,102 @@ with st.sidebar:
 
 st.title('Protein Structure Viewer')
 
-
-protein_input = st.text_input('Enter Protein PDB ID:')
+source = st.radio('Structure source:', ['PDB ID', 'Upload file', 'Local path'], horizontal=True)
+if source == 'Upload file':
+    protein_input = st.file_uploader('Structure file:', type=UPLOAD_TYPES,
+                                     help='PDB, mmCIF or BinaryCIF, optionally gzipped')
+elif source == 'Local path':
+    protein_input = st.text_input('Structure file path:', help=f"A file under {', '.join(local_structure_dirs())}")
+else:
+    protein_input = st.text_input('Enter Protein PDB ID:')
 
 
-@st.cache_data
-def fetch_pdb_data(pdb_id):
-    """Fetch PDB data from RCSB PDB."""
-    url = f"https://files.rcsb.org/download/{pdb_id}.pdb"
+def load_structure(protein_input):
+    """Structure data for the chosen source: fetched text, or a StructureFile parsed from disk"""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching PDB data: {e}")
+        if source == 'Upload file':
+            return uploaded_structure(protein_input)
+        if source == 'Local path':
+            return open_local_structure(protein_input)
+    except (OSError, ValueError) as e:
+        st.error(f"Error reading structure file: {e}")
         return None
+    return fetch_pdb_data(protein_input)
+
+
+def jump_to_residue(index, selected, page_size, chain, residue):
+    """Show the page holding a residue's first atom record (or the next selected line after it)"""
+    line = index.find_residue(chain, residue)
+    st.session_state['raw-target'] = line
+    st.session_state['raw-missing'] = None if line is not None else f"residue {residue} of chain {chain}"
+    if line is not None:
+        position = min(int(np.searchsorted(selected, line)), max(len(selected) - 1, 0))
+        st.session_state['raw-page'] = position // page_size + 1
+
+
+@st.fragment
+def raw_records_browser(pdb_data):
+    """Raw records a page at a time from a line index; filters, jumps and paging rerun only this fragment"""
+    try:
+        index = record_index(pdb_data)
+    except ValueError as e:
+        st.info(str(e))
+        return
+    counts = index.type_counts()
+    record_types = st.multiselect(
+        'Record types:', list(counts), key='raw-types', placeholder='All records',
+        format_func=lambda record_type: f"{record_type} ({counts[record_type]:,})",
+        on_change=lambda: st.session_state.update({'raw-page': 1}))
+    selected = index.select(record_types or None)
+    sizes = sorted({100, 200, 500, 1000, RAW_PAGE_LINES})
+    page_size = st.selectbox('Lines per page:', sizes, index=sizes.index(RAW_PAGE_LINES), key='raw-page-size')
+    n_pages = max(1, math.ceil(len(selected) / page_size))
+    st.session_state['raw-page'] = min(st.session_state.get('raw-page', 1), n_pages)
+
+    chain_col, residue_col, jump_col = st.columns([1, 1, 1], vertical_alignment='bottom')
+    chains = index.chain_ids()
+    if chains:
+        chain = chain_col.selectbox('Chain:', chains, key='raw-chain')
+        residue = residue_col.text_input('Residue:', key='raw-residue', placeholder='e.g. 42 or 42A')
+        jump_col.button('Go to residue', key='raw-jump', disabled=not residue, on_click=jump_to_residue,
+                        args=(index, selected, page_size, chain, residue))
+        if st.session_state.get('raw-missing'):
+            st.warning(f"No atom records for {st.session_state['raw-missing']}.")
+
+    page = st.number_input(f'Page (of {n_pages:,}):', min_value=1, max_value=n_pages, step=1, key='raw-page')
+    shown = selected[(page - 1) * page_size:page * page_size]
+    target = st.session_state.get('raw-target')
+    width = len(str(len(index)))
+    st.code('\n'.join(f"{'>' if i == target else ' '}{i + 1:>{width}}  {line}"
+                       for i, line in zip(shown.tolist(), index.lines(shown))), language=None)
+    first = (page - 1) * page_size + 1 if len(shown) else 0
+    st.caption(f"Lines {first:,}-{first + len(shown) - 1 if len(shown) else 0:,} of {len(selected):,} selected "
+               f"({len(index):,} in the file)")
 
 
 if st.button('Visualize Protein', key='visualize_button'):
     if protein_input:
-        with st.spinner(f"Fetching data for {protein_input}..."):
-            pdb_data = fetch_pdb_data(protein_input)
+        with st.spinner(f"Loading {getattr(protein_input, 'name', protein_input)}..."):
+            pdb_data = load_structure(protein_input)
             if pdb_data:
                 # Display the 3D structure using py3Dmol and stmol
                 st.markdown("### Protein Structure Visualization")
                 
-                # Create py3Dmol viewer
-                view = py3Dmol.view(width=800, height=400)
-                view.addModel(pdb_data, "pdb")  # it will load the protein
-                view.setStyle({'cartoon': {'color': 'spectrum'}})  # cartoon and rainbow colour
-                view.setBackgroundColor('white')  # bg white
-                view.zoomTo()  # we can zoom
-                
-                # Render the viewer in Streamlit using stmol.showmol()
-                stmol.showmol(view, height=500, width=800)
+                # large structures are sent as a CA/P trace
+                model_data, _ = reduced_model(pdb_data, auto_mode(len(get_structure(pdb_data).atoms)))
+                try:
+                    # cartoon and rainbow colour, py3Dmol and stmol imported on first use
+                    view = create_3d_view(model_data, highlight_ligands=False)
+                    view.setBackgroundColor('white')  # bg white
+                    showmol(view, height=500, width=800)
+                except MissingDependency as e:
+                    st.warning(str(e))
                 
                 # Optionally display raw PDB data in an expandable section
                 with st.expander("View Raw PDB Data"):
-                    st.text(pdb_data)
+                    raw_records_browser(pdb_data)
             else:
                 st.error("Protein not found or invalid PDB ID.")
     else:
-        st.warning("Please enter a valid Protein PDB ID.")
+        st.warning("Please enter a valid Protein PDB ID or structure file.")
 
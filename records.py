@@ -0,0 +1,136 @@
+"""Line index of a structure's raw text, for browsing it a page at a time.
+
+Printing a whole entry ships every byte to the browser, so the raw view is
+backed by a RecordIndex built once per structure hash instead:
+
+    line offsets    found by scanning the text (or a memory map of the file) in
+                    SCAN_BYTES chunks, so any line is sliced out directly
+    record types    PDB record names (ATOM, HETATM, REMARK, ...); for mmCIF,
+                    ATOM/HETATM for _atom_site rows and OTHER for every other line
+    chain, residue  of every atom record, for jumping to a residue
+
+Only the lines of the page being shown are ever decoded.
+
+Configuration (environment variables):
+    RAW_PAGE_LINES  default number of lines per page (default: 200)
+"""
+import os
+
+import numpy as np
+
+from cache import TEXT, memoize
+from cif import read_mmcif
+from structure import structure_format, structure_key
+from structure_files import StructureFile
+
+RAW_PAGE_LINES = int(os.environ.get("RAW_PAGE_LINES", 200))
+SCAN_BYTES = 1 << 24
+GATHER_LINES = 1 << 18
+ATOM_RECORDS = (b'ATOM', b'HETATM')
+OTHER = b'OTHER'
+
+def _line_starts(data):
+    """Offset of every line start plus a final end offset, scanning data chunk by chunk"""
+    starts = [np.zeros(1, dtype=np.int64)]
+    for offset in range(0, len(data), SCAN_BYTES):
+        chunk = np.frombuffer(data, dtype=np.uint8, count=min(SCAN_BYTES, len(data) - offset), offset=offset)
+        starts.append(np.flatnonzero(chunk == 10).astype(np.int64) + offset + 1)
+    starts = np.concatenate(starts)
+    if starts[-1] != len(data):
+        starts = np.append(starts, len(data))
+    return starts
+
+def _gather(data, starts, ends, start_column, width):
+    """Fixed columns [start_column, start_column + width) of the given lines, space-padded past line ends"""
+    if len(starts) == 0:
+        return np.zeros(0, dtype=f'S{width}')
+    view = np.frombuffer(data, dtype=np.uint8)
+    columns = np.arange(start_column, start_column + width)
+    blocks = []
+    for block in range(0, len(starts), GATHER_LINES):
+        positions = starts[block:block + GATHER_LINES, None] + columns
+        inside = positions < ends[block:block + GATHER_LINES, None]
+        values = np.where(inside, view[np.minimum(positions, len(view) - 1)], 32).astype(np.uint8)
+        blocks.append(np.char.strip(values.view(f'S{width}').ravel()))
+    return np.concatenate(blocks)
+
+class RecordIndex:
+    """Line offsets, record types and atom chain/residue ids of a structure's text"""
+
+    def __init__(self, data, fmt, atom_site=None):
+        self.data = data
+        self.format = fmt
+        self.starts = _line_starts(data)
+        starts, ends = self.starts[:-1], self.starts[1:].copy()
+        if len(ends):
+            ends -= np.frombuffer(data, dtype=np.uint8)[ends - 1] == 10
+        record_types = _gather(data, starts, ends, 0, 6)
+        if fmt == 'cif':
+            first_words = np.char.partition(record_types, b' ')[:, 0]
+            record_types = np.where(np.isin(first_words, ATOM_RECORDS), first_words, OTHER)
+        self.record_types = record_types.astype('S6')
+        self.atom_lines = np.flatnonzero(np.isin(self.record_types, ATOM_RECORDS))
+        if fmt == 'pdb':
+            self.chains = _gather(data, starts[self.atom_lines], ends[self.atom_lines], 21, 1)
+            self.residues = _gather(data, starts[self.atom_lines], ends[self.atom_lines], 22, 5)
+        elif atom_site is not None and len(atom_site['chain']) == len(self.atom_lines):
+            # one _atom_site row per line, so rows map onto atom lines in order
+            self.chains = atom_site['chain']
+            self.residues = np.char.add(atom_site['resnum'].astype('S'), np.char.strip(atom_site['icode']))
+        else:
+            self.chains = self.residues = np.zeros(0, dtype='S1')
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    @property
+    def nbytes(self):
+        arrays = (self.starts, self.record_types, self.atom_lines, self.chains, self.residues)
+        return sum(array.nbytes for array in arrays) + (len(self.data) if isinstance(self.data, bytes) else 0)
+
+    def type_counts(self):
+        """{record type: line count}, in order of first appearance"""
+        types, first, counts = np.unique(self.record_types, return_index=True, return_counts=True)
+        order = np.argsort(first)
+        return {types[i].decode(): int(counts[i]) for i in order}
+
+    def select(self, record_types=None):
+        """Indices of the lines whose record type is in record_types (all lines if None)"""
+        if record_types is None:
+            return np.arange(len(self))
+        wanted = [record_type.encode() for record_type in record_types]
+        return np.flatnonzero(np.isin(self.record_types, wanted))
+
+    def chain_ids(self):
+        """Chains of the atom records, in order of appearance"""
+        _, first = np.unique(self.chains, return_index=True)
+        return [chain.decode() for chain in self.chains[np.sort(first)]]
+
+    def find_residue(self, chain, residue):
+        """Line of the first atom record of a residue (number plus optional insertion code), or None"""
+        hits = np.flatnonzero((self.chains == chain.encode()) & (self.residues == str(residue).strip().encode()))
+        return int(self.atom_lines[hits[0]]) if len(hits) else None
+
+    def lines(self, indices):
+        """Text of the given lines (without newlines)"""
+        return [self.data[self.starts[i]:self.starts[i + 1]].decode('latin-1').rstrip('\r\n')
+                for i in np.asarray(indices).tolist()]
+
+@memoize(key=structure_key, max_entries=4, namespace=TEXT)
+def record_index(pdb_data):
+    """RecordIndex of PDB or mmCIF text or a StructureFile (BinaryCIF has no text records)"""
+    fmt = structure_format(pdb_data)
+    if fmt == 'bcif':
+        raise ValueError("BinaryCIF is a binary format with no text records to browse")
+    if isinstance(pdb_data, StructureFile):
+        data = pdb_data.buffer()
+    else:
+        data = pdb_data.encode('latin-1', errors='replace')
+    atom_site = None
+    if fmt == 'cif':
+        if isinstance(pdb_data, StructureFile):
+            with pdb_data.open() as handle:
+                atom_site = read_mmcif(handle)
+        else:
+            atom_site = read_mmcif(data)
+    return RecordIndex(data, fmt, atom_site)
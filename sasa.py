@@ -0,0 +1,114 @@
+"""Solvent accessible surface area (Shrake-Rupley) computed on the server.
+
+Every atom gets a sphere of N_POINTS test points at its van der Waals radius
+plus PROBE_RADIUS; a point is accessible unless it lies inside the probe-
+inflated sphere of a neighboring atom. Neighbors come from a cell-list search
+and the point tests are vectorized per atom pair: with v = c_i - c_j and
+R = r_i + probe, point s is buried by atom j when
+
+    R^2 + |v|^2 + 2R (s . v) < (r_j + probe)^2
+
+so each chunk of pairs is a single (pairs x 3) @ (3 x points) product. Pairs
+are generated and consumed one chunk of atoms at a time, so memory stays flat
+as structures grow, and results are cached per structure hash. Only the first
+model is used and waters are left out; on the same atoms the areas match
+Bio.PDB.SASA.ShrakeRupley.
+"""
+import numpy as np
+
+from cache import memoize
+from features import atom_elements
+from spatial import CellList
+from structure import get_structure, structure_key
+
+PROBE_RADIUS = 1.4
+N_POINTS = 100
+CHUNK_ATOMS = 512
+
+# van der Waals radii (Å) as used by Bio.PDB.SASA
+ATOMIC_RADII = {
+    b'H': 1.2, b'D': 1.2, b'HE': 1.4, b'C': 1.7, b'N': 1.55, b'O': 1.52, b'F': 1.47,
+    b'NA': 2.27, b'MG': 1.73, b'P': 1.8, b'S': 1.8, b'CL': 1.75, b'K': 2.75, b'CA': 2.31,
+    b'NI': 1.63, b'CU': 1.4, b'ZN': 1.39, b'SE': 1.9, b'BR': 1.85, b'I': 1.98,
+}
+DEFAULT_RADIUS = 1.8
+
+# theoretical maximum residue SASA (Å², Tien et al. 2013)
+MAX_RESIDUE_SASA = {
+    'ALA': 129.0, 'ARG': 274.0, 'ASN': 195.0, 'ASP': 193.0, 'CYS': 167.0,
+    'GLN': 225.0, 'GLU': 223.0, 'GLY': 104.0, 'HIS': 224.0, 'ILE': 197.0,
+    'LEU': 201.0, 'LYS': 236.0, 'MET': 224.0, 'PHE': 240.0, 'PRO': 159.0,
+    'SER': 155.0, 'THR': 172.0, 'TRP': 285.0, 'TYR': 263.0, 'VAL': 174.0,
+}
+EXPOSED_THRESHOLD = 0.25
+
+def sphere_points(n_points=N_POINTS):
+    """Unit vectors spread evenly over a sphere (golden-section spiral)"""
+    k = np.arange(n_points)
+    z = 1 - (2 * k + 1) / n_points
+    longitude = k * np.pi * (3 - np.sqrt(5))
+    r = np.sqrt(1 - z * z)
+    return np.column_stack([np.cos(longitude) * r, np.sin(longitude) * r, z])
+
+def atom_radii(atoms):
+    """van der Waals radius per atom, from its element"""
+    unique, inverse = np.unique(atom_elements(atoms), return_inverse=True)
+    return np.array([ATOMIC_RADII.get(element, DEFAULT_RADIUS) for element in unique])[inverse.ravel()]
+
+def shrake_rupley(coords, radii, probe=PROBE_RADIUS, n_points=N_POINTS, chunk_atoms=CHUNK_ATOMS):
+    """Accessible surface area (Å²) per atom of spheres at coords with the given radii"""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    n = len(coords)
+    if n == 0:
+        return np.zeros(0)
+    inflated = np.asarray(radii, dtype=np.float64) + probe
+    cells = CellList(coords, 2 * inflated.max())
+    sphere = sphere_points(n_points).T
+    exposed = np.full(n, n_points)
+    # neighbor pairs are found and consumed one chunk of atoms at a time
+    for start in range(0, n, chunk_atoms):
+        i, j, distances = cells.query(coords[start:start + chunk_atoms], cells.cell_size)
+        i += start
+        keep = (i != j) & (distances < inflated[i] + inflated[j])
+        if not keep.any():
+            continue
+        order = np.argsort(i[keep], kind='stable')
+        i, j, distances = i[keep][order], j[keep][order], distances[keep][order]
+        threshold = (inflated[j] ** 2 - inflated[i] ** 2 - distances ** 2) / (2 * inflated[i])
+        hit = (coords[i] - coords[j]) @ sphere < threshold[:, None]
+        atoms, first = np.unique(i, return_index=True)
+        exposed[atoms] -= np.logical_or.reduceat(hit, first, axis=0).sum(axis=1)
+    return 4 * np.pi * inflated ** 2 * exposed / n_points
+
+@memoize(key=structure_key, max_entries=8)
+def atom_sasa(pdb_data, probe=PROBE_RADIUS, n_points=N_POINTS):
+    """(atoms, sasa): first-model, non-water AtomTable and the SASA (Å²) of each atom"""
+    atoms = get_structure(pdb_data).atoms
+    if len(atoms) == 0:
+        return atoms, np.zeros(0)
+    atoms = atoms.take((atoms.models == atoms.models[0]) & (atoms.hetflags != b'W'))
+    return atoms, shrake_rupley(atoms.coords, atom_radii(atoms), probe, n_points)
+
+@memoize(key=structure_key, max_entries=8)
+def residue_sasa(pdb_data, threshold=EXPOSED_THRESHOLD):
+    """Per-residue labels, SASA (Å²), relative SASA and exposed flag
+
+    Relative SASA is the residue SASA over its theoretical maximum; it is NaN
+    for hetero residues, which are never flagged exposed.
+    """
+    atoms, sasa = atom_sasa(pdb_data)
+    totals = np.bincount(atoms.residue_index, weights=sasa, minlength=atoms.n_residues)
+    resnames = atoms.residue_names.astype(str)
+    maximum = np.array([MAX_RESIDUE_SASA.get(name, np.nan) for name in resnames])
+    maximum[atoms.residue_hetflags != b' '] = np.nan
+    with np.errstate(invalid='ignore'):
+        relative = totals / maximum
+        exposed = relative >= threshold
+    return {
+        'chain': atoms.residue_chains.astype(str),
+        'resnum': atoms.residue_numbers.astype(int),
+        'resname': resnames,
+        'sasa': totals,
+        'relative': relative,
+        'exposed': exposed,
+    }
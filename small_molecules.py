@@ -1,5 +1,9 @@
+import os
 import streamlit as st
 import requests
+import http_client
+
+PUBCHEM_URL = os.environ.get("PUBCHEM_URL", "https://pubchem.ncbi.nlm.nih.gov/rest/pug")
 
 # Title of the app
 st.title("Ligand Information Viewer")
@@ -8,8 +12,12 @@ st.title("Ligand Information Viewer")
 ligand_id = st.text_input("Enter Ligand Name or PubChem ID:")
 
 def fetch_ligand_data(ligand_id):
-    url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/{ligand_id}/JSON"
-    response = requests.get(url)
+    url = f"{PUBCHEM_URL}/compound/{ligand_id}/JSON"
+    try:
+        response = http_client.get(url)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching ligand data: {e}")
+        return None
     if response.status_code == 200:
         return response.json()
     else:
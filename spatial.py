@@ -0,0 +1,85 @@
+"""Cell-list neighbor search shared by the structure analyses.
+
+Points are binned into a uniform grid whose cells are at least as large as the
+search radius, so each query only looks at the 27 surrounding cells instead of
+every point. All work is vectorized with NumPy and processed in chunks of
+queries to keep peak memory bounded on very large assemblies.
+"""
+from itertools import product
+
+import numpy as np
+
+class CellList:
+    """Uniform grid over a point set for fixed-radius neighbor queries"""
+
+    def __init__(self, points, cell_size):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.cell_size = float(cell_size)
+        if len(self.points):
+            self.origin = self.points.min(axis=0)
+            cells = self._cells(self.points)
+            self.shape = cells.max(axis=0) + 1
+        else:
+            self.origin = np.zeros(3)
+            self.shape = np.ones(3, dtype=np.int64)
+            cells = np.zeros((0, 3), dtype=np.int64)
+        keys = self._keys(cells)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def _cells(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def _candidates(self, queries):
+        """All (query, point) index pairs sharing or neighboring a cell"""
+        cells = self._cells(queries)
+        query_parts, point_parts = [], []
+        for offset in product((-1, 0, 1), repeat=3):
+            neighbor = cells + offset
+            inside = np.all((neighbor >= 0) & (neighbor < self.shape), axis=1)
+            query_index = np.flatnonzero(inside)
+            keys = self._keys(neighbor[inside])
+            lo = np.searchsorted(self.sorted_keys, keys, side='left')
+            hi = np.searchsorted(self.sorted_keys, keys, side='right')
+            counts = hi - lo
+            total = counts.sum()
+            if total == 0:
+                continue
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            query_parts.append(np.repeat(query_index, counts))
+            point_parts.append(self.order[starts + np.arange(total)])
+        if not query_parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(query_parts), np.concatenate(point_parts)
+
+    def query(self, queries, cutoff, min_cutoff=None, chunk_size=65536):
+        """(query_index, point_index, distance) for every pair with min_cutoff < d <= cutoff"""
+        if cutoff > self.cell_size:
+            raise ValueError(f"cutoff {cutoff} exceeds the cell size {self.cell_size}")
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            qi, pi = self._candidates(chunk)
+            distances = np.linalg.norm(chunk[qi] - self.points[pi], axis=1)
+            keep = distances <= cutoff
+            if min_cutoff is not None:
+                keep &= distances > min_cutoff
+            results.append((qi[keep] + start, pi[keep], distances[keep]))
+        if not results:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+def pairs_within(queries, points, cutoff, min_cutoff=None):
+    """(query_index, point_index, distance) for query/point pairs closer than cutoff"""
+    return CellList(points, cutoff).query(queries, cutoff, min_cutoff=min_cutoff)
+
+def self_pairs(points, cutoff):
+    """(i, j, distance) with i < j for every pair of points closer than cutoff"""
+    i, j, distances = pairs_within(points, points, cutoff)
+    keep = i < j
+    return i[keep], j[keep], distances[keep]
@@ -0,0 +1,468 @@
+import bisect
+import hashlib
+import re
+import threading
+from io import StringIO, TextIOWrapper
+
+import numpy as np
+
+from cache import STRUCTURES, LRUCache, sizeof
+from cif import read_bcif, read_mmcif, write_mmcif
+from optional import require
+from structure_files import StructureFile
+
+# ----------------------
+# Columnar Atom Table
+# ----------------------
+# PDB fixed columns (start, end) for the fields kept in the table
+PDB_COLUMNS = {
+    'name': (12, 16),
+    'altloc': (16, 17),
+    'resname': (17, 20),
+    'chain': (21, 22),
+    'resnum': (22, 26),
+    'icode': (26, 27),
+    'x': (30, 38),
+    'y': (38, 46),
+    'z': (46, 54),
+    'occupancy': (54, 60),
+    'bfactor': (60, 66),
+    'element': (76, 78),
+}
+
+def iter_lines(source):
+    """Stream lines (without newlines) from PDB text or an open text file"""
+    if not isinstance(source, str):
+        for line in source:
+            yield line.rstrip('\r\n')
+        return
+    start, end = 0, len(source)
+    while start < end:
+        stop = source.find('\n', start)
+        if stop < 0:
+            stop = end
+        yield source[start:stop].rstrip('\r')
+        start = stop + 1
+
+def coordinate_records(source):
+    """Yield (model, line) for every ATOM/HETATM record, following Bio.PDB's model rules"""
+    model = -1
+    model_open = False
+    for line in iter_lines(source):
+        record = line[:6]
+        if record == 'ATOM  ' or record == 'HETATM':
+            if not model_open:
+                model += 1
+                model_open = True
+            yield model, line
+        elif record == 'MODEL ':
+            model += 1
+            model_open = True
+        elif record == 'ENDMDL':
+            model_open = False
+        elif record == 'END   ' or record == 'CONECT':
+            return
+
+def _record_offsets(pdb_data, record, end):
+    """Offsets of every line starting with record, found without visiting other lines"""
+    offsets = [0] if pdb_data.startswith(record) else []
+    needle = '\n' + record
+    pos = pdb_data.find(needle, 0, end)
+    while pos >= 0:
+        offsets.append(pos + 1)
+        pos = pdb_data.find(needle, pos + 1, end)
+    return offsets
+
+def _coordinate_end(pdb_data):
+    """Offset where Bio.PDB stops reading coordinates (first END or CONECT record)"""
+    ends = [pdb_data.find(needle) for needle in ('\nEND   ', '\nCONECT')]
+    ends = [pos + 1 for pos in ends if pos >= 0]
+    return min(ends) if ends else len(pdb_data)
+
+def hetero_records(pdb_data):
+    """Yield (model, chain_rank, line) for HETATM records only
+
+    Jumps from one HETATM line to the next with str.find, so ATOM records are never
+    materialized. A chain's rank is its first appearance among all coordinate records
+    of its model, looked up once per chain, which lets callers order residues exactly
+    as Bio.PDB does.
+    """
+    end = _coordinate_end(pdb_data)
+    model_starts = _record_offsets(pdb_data, 'MODEL ', end)
+    first_coordinate = min((pos for pos in (pdb_data.find('ATOM  '), pdb_data.find('HETATM'))
+                            if pos >= 0), default=end)
+    implicit_model = not model_starts or first_coordinate < model_starts[0]
+    chain_ranks = {}
+    for offset in _record_offsets(pdb_data, 'HETATM', end):
+        stop = pdb_data.find('\n', offset)
+        line = pdb_data[offset:stop if stop >= 0 else len(pdb_data)].rstrip('\r')
+        slot = bisect.bisect(model_starts, offset)
+        model = slot - 1 + implicit_model
+        chain = line[21:22]
+        rank = chain_ranks.get((model, chain))
+        if rank is None:
+            model_start = model_starts[slot - 1] if slot else 0
+            pattern = re.compile(r'\n(?:ATOM  |HETATM)[^\n]{15}' + re.escape(chain or ' '))
+            first = pattern.search(pdb_data, max(model_start - 1, 0), offset)
+            rank = first.start() if first else offset
+            chain_ranks[(model, chain)] = rank
+        yield model, rank, line
+
+def _fixed_columns(lines, width=80):
+    """View a list of fixed-width records as an (n, width) byte matrix"""
+    buf = ''.join(line[:width].ljust(width) for line in lines).encode('latin-1')
+    return np.frombuffer(buf, dtype='S1').reshape(len(lines), width)
+
+def _column(matrix, field):
+    start, end = PDB_COLUMNS[field]
+    return np.ascontiguousarray(matrix[:, start:end]).view(f'S{end - start}').ravel()
+
+def _float_column(matrix, field, default=b'0'):
+    values = _column(matrix, field).copy()
+    values[np.char.strip(values) == b''] = default
+    return values.astype(np.float32)
+
+RECORD_CHUNK = 20000
+
+def _record_columns(lines, models):
+    """AtomTable columns (plus the record type's first letter) of a list of PDB records"""
+    matrix = _fixed_columns(lines)
+    return {
+        'coords': np.column_stack([_float_column(matrix, axis) for axis in 'xyz']).reshape(-1, 3),
+        'names': np.char.strip(_column(matrix, 'name')),
+        'resnames': np.char.strip(_column(matrix, 'resname')),
+        'chains': _column(matrix, 'chain').copy(),
+        'resnums': _column(matrix, 'resnum').astype(np.int32),
+        'icodes': _column(matrix, 'icode').copy(),
+        'record': matrix[:, 0].copy(),
+        'elements': np.char.upper(np.char.strip(_column(matrix, 'element'))),
+        'bfactors': _float_column(matrix, 'bfactor'),
+        'occupancies': _float_column(matrix, 'occupancy'),
+        'models': np.asarray(models, dtype=np.int32),
+    }
+
+class AtomTable:
+    """Parallel NumPy arrays describing every atom of a structure
+
+    String columns are fixed-width bytes (names S4, resnames S3, chains S1, ...
+    from PDB records; as wide as the longest value from mmCIF) to keep large
+    assemblies compact. Atoms are grouped into residues exactly as
+    Bio.PDB does: by (model, chain, hetero flag, resnum, icode), ordered by first
+    appearance, with alternate locations collapsed onto the first occurrence.
+    record_index maps each atom back to its position among the source records.
+    """
+
+    def __init__(self, coords, names, resnames, chains, resnums, icodes, hetflags,
+                 elements, bfactors, occupancies, models, record_index=None):
+        self.coords = coords
+        self.names = names
+        self.resnames = resnames
+        self.chains = chains
+        self.resnums = resnums
+        self.icodes = icodes
+        self.hetflags = hetflags
+        self.elements = elements
+        self.bfactors = bfactors
+        self.occupancies = occupancies
+        self.models = models
+        if record_index is None:
+            record_index = np.arange(len(names), dtype=np.int64)
+        self.record_index = record_index
+        self._index_residues()
+
+    @classmethod
+    def from_records(cls, records, chunk_size=RECORD_CHUNK):
+        """Build a table from (model, line) pairs as yielded by coordinate_records
+
+        Records are turned into columns chunk_size lines at a time, so only the
+        compact columns, not the record text, of a streamed file stay in memory.
+        """
+        chunks, models, lines = [], [], []
+        for model, line in records:
+            models.append(model)
+            lines.append(line)
+            if len(lines) == chunk_size:
+                chunks.append(_record_columns(lines, models))
+                models, lines = [], []
+        if lines or not chunks:
+            chunks.append(_record_columns(lines, models))
+        # field by field, releasing each chunk's part, so the columns are never held twice
+        columns = {field: np.concatenate([chunk.pop(field) for chunk in chunks]) for field in list(chunks[0])}
+        hetflags = np.where(columns.pop('record') == b'H', b'H', b' ').astype('S1')
+        hetflags[(hetflags == b'H') & np.isin(columns['resnames'], [b'HOH', b'WAT'])] = b'W'
+        return cls(hetflags=hetflags, **columns).drop_altloc_duplicates()
+
+    @classmethod
+    def from_pdb(cls, pdb_data):
+        return cls.from_records(coordinate_records(pdb_data))
+
+    @classmethod
+    def from_atom_site(cls, site):
+        """Build a table from mmCIF/BinaryCIF _atom_site columns as read by the cif module"""
+        resnames = site['resname']
+        hetflags = np.where(site['group'] == b'HETATM', b'H', b' ').astype('S1')
+        hetflags[(hetflags == b'H') & np.isin(resnames, [b'HOH', b'WAT'])] = b'W'
+        table = cls(
+            coords=site['coords'],
+            names=site['name'],
+            resnames=resnames,
+            chains=site['chain'],
+            resnums=site['resnum'].astype(np.int32),
+            icodes=site['icode'],
+            hetflags=hetflags,
+            elements=site['element'],
+            bfactors=site['bfactor'].astype(np.float32),
+            occupancies=site['occupancy'].astype(np.float32),
+            models=site['model'],
+        )
+        return table.drop_altloc_duplicates()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _index_residues(self):
+        """Assign residue_index per atom and build the per-residue columns"""
+        n = len(self.names)
+        if n == 0:
+            self.residue_index = np.zeros(0, dtype=np.int32)
+            self.residue_start = np.zeros(0, dtype=np.int64)
+            return
+        chain_keys = np.rec.fromarrays([self.models, self.chains])
+        _, chain_first, chain_inverse = np.unique(chain_keys, return_index=True, return_inverse=True)
+        residue_keys = np.rec.fromarrays(
+            [self.models, self.chains, self.hetflags, self.resnums, self.icodes])
+        _, residue_first, residue_inverse = np.unique(residue_keys, return_index=True, return_inverse=True)
+        # Bio.PDB order: model, then chain by first appearance, then residue by first appearance
+        residue_chain_first = chain_first[chain_inverse.ravel()[residue_first]]
+        order = np.lexsort((residue_first, residue_chain_first, self.models[residue_first]))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.residue_index = rank[residue_inverse.ravel()].astype(np.int32)
+        self.residue_start = residue_first[order]
+
+    def drop_altloc_duplicates(self):
+        """Keep the first occurrence of each atom name within a residue"""
+        keys = np.rec.fromarrays([self.residue_index, self.names])
+        _, first = np.unique(keys, return_index=True)
+        if len(first) == len(self):
+            return self
+        return self.take(np.sort(first))
+
+    def take(self, indices):
+        """New table holding only the given atom indices (or boolean mask)"""
+        return AtomTable(
+            coords=self.coords[indices],
+            names=self.names[indices],
+            resnames=self.resnames[indices],
+            chains=self.chains[indices],
+            resnums=self.resnums[indices],
+            icodes=self.icodes[indices],
+            hetflags=self.hetflags[indices],
+            elements=self.elements[indices],
+            bfactors=self.bfactors[indices],
+            occupancies=self.occupancies[indices],
+            models=self.models[indices],
+            record_index=self.record_index[indices],
+        )
+
+    # Per-residue columns, taken from each residue's first atom
+    @property
+    def n_residues(self):
+        return len(self.residue_start)
+
+    @property
+    def residue_names(self):
+        return self.resnames[self.residue_start]
+
+    @property
+    def residue_chains(self):
+        return self.chains[self.residue_start]
+
+    @property
+    def residue_numbers(self):
+        return self.resnums[self.residue_start]
+
+    @property
+    def residue_hetflags(self):
+        return self.hetflags[self.residue_start]
+
+    def residue_has_atom(self, names):
+        """Boolean per residue: does it contain any atom with one of these names"""
+        mask = np.zeros(self.n_residues, dtype=bool)
+        mask[self.residue_index[np.isin(self.names, _as_bytes(names))]] = True
+        return mask
+
+    def residue_mask(self, resnames, hetero=None):
+        """Boolean per residue selecting residue names, optionally by hetero flag"""
+        mask = np.isin(self.residue_names, _as_bytes(resnames))
+        if hetero is True:
+            mask &= self.residue_hetflags != b' '
+        elif hetero is False:
+            mask &= self.residue_hetflags == b' '
+        return mask
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in (
+            'coords', 'names', 'resnames', 'chains', 'resnums', 'icodes', 'hetflags',
+            'elements', 'bfactors', 'occupancies', 'models', 'record_index', 'residue_index',
+            'residue_start'))
+
+def _as_bytes(values):
+    return [v.encode() if isinstance(v, str) else v for v in values]
+
+# ----------------------
+# Shared Parsed Structures
+# ----------------------
+STRUCTURE_CACHE = LRUCache(max_entries=16, namespace=STRUCTURES, name="structure.STRUCTURE_CACHE")
+# approximate memory per atom of a Bio.PDB hierarchy and of an MDAnalysis Universe
+BIO_ATOM_BYTES = 1100
+UNIVERSE_ATOM_BYTES = 320
+
+_MMCIF_START = re.compile(r'\s*(?:#[^\n]*\s*)*data_')
+
+def structure_format(pdb_data):
+    """'bcif' for BinaryCIF bytes, 'cif' for mmCIF text, 'pdb' for PDB text (a StructureFile knows its own)"""
+    if isinstance(pdb_data, StructureFile):
+        return pdb_data.format
+    if isinstance(pdb_data, bytes):
+        return 'bcif'
+    return 'cif' if _MMCIF_START.match(pdb_data) else 'pdb'
+
+def structure_text(pdb_data):
+    """(text, format) a viewer or external tool can read: PDB or mmCIF text as is, BinaryCIF as mmCIF"""
+    fmt = structure_format(pdb_data)
+    if fmt == 'bcif':
+        return write_mmcif(get_structure(pdb_data).atoms), 'cif'
+    if isinstance(pdb_data, StructureFile):
+        return pdb_data.read(), fmt
+    return pdb_data, fmt
+
+def structure_hash(pdb_data):
+    """Content hash used to key every structure-derived result (path, size and mtime for a StructureFile)"""
+    if isinstance(pdb_data, StructureFile):
+        return pdb_data.digest
+    return hashlib.sha256(pdb_data if isinstance(pdb_data, bytes) else pdb_data.encode()).hexdigest()
+
+def structure_key(pdb_data, *args, **kwargs):
+    """Cache/coalescing key for functions whose first argument is structure data"""
+    return (structure_hash(pdb_data), args, tuple(sorted(kwargs.items())))
+
+class ParsedStructure:
+    """Structure data (PDB or mmCIF text, BinaryCIF bytes, a StructureFile) parsed once and shared by all analysis panels
+
+    Files are parsed from streams (or a memory map) rather than read into one string.
+    """
+
+    def __init__(self, pdb_data, key=None):
+        self.pdb_data = pdb_data
+        self.format = structure_format(pdb_data)
+        self.key = key or structure_hash(pdb_data)
+        self._structure = None
+        self._atoms = None
+        self._universe = None
+        self._frames = None
+        self._built_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def structure(self):
+        """Bio.PDB SMCRA hierarchy, built on first use"""
+        # Bio.PDB reads BinaryCIF from paths only, so it gets the table written as mmCIF
+        text = write_mmcif(self.atoms) if self.format == 'bcif' and self._structure is None else self.pdb_data
+        with self._lock:
+            if self._structure is None:
+                PDB = require("Bio.PDB", "Bio.PDB structure parsing")
+                parser = PDB.PDBParser() if self.format == 'pdb' else PDB.MMCIFParser(QUIET=True)
+                if isinstance(text, StructureFile):
+                    with TextIOWrapper(text.open(), encoding='latin-1') as handle:
+                        self._structure = parser.get_structure(self.key[:8], handle)
+                else:
+                    self._structure = parser.get_structure(self.key[:8], StringIO(text))
+                self._built_bytes += BIO_ATOM_BYTES * sum(1 for _ in self._structure.get_atoms())
+            return self._structure
+
+    @property
+    def atoms(self):
+        """Columnar AtomTable, built on first use"""
+        with self._lock:
+            if self._atoms is None:
+                source = self.pdb_data
+                if not isinstance(source, StructureFile):
+                    self._atoms = self._parse(source)
+                elif self.format == 'bcif':
+                    self._atoms = AtomTable.from_atom_site(read_bcif(source.buffer()))
+                elif self.format == 'cif':
+                    with source.open() as handle:
+                        self._atoms = AtomTable.from_atom_site(read_mmcif(handle))
+                else:
+                    self._atoms = AtomTable.from_records(coordinate_records(source.lines()))
+            return self._atoms
+
+    def _parse(self, data):
+        if self.format == 'bcif':
+            return AtomTable.from_atom_site(read_bcif(data))
+        if self.format == 'cif':
+            return AtomTable.from_atom_site(read_mmcif(data))
+        return AtomTable.from_pdb(data)
+
+    @property
+    def universe(self):
+        """MDAnalysis Universe read from memory (no temp file), built on first use
+
+        mmCIF, BinaryCIF and file structures are built from the AtomTable: one
+        frame per model with the same atoms as the first.
+        """
+        from_text = self.format == 'pdb' and isinstance(self.pdb_data, str)
+        atoms = None if from_text else self.atoms
+        with self._lock:
+            if self._universe is None:
+                mda = require("MDAnalysis", "MDAnalysis-based analyses")
+                if atoms is None:
+                    from MDAnalysis.lib.util import NamedStream
+                    self._universe = mda.Universe(NamedStream(StringIO(self.pdb_data), "structure.pdb"))
+                else:
+                    self._universe = _universe_from_atoms(mda, atoms)
+                self._built_bytes += UNIVERSE_ATOM_BYTES * self._universe.atoms.n_atoms
+            return self._universe
+
+    @property
+    def frames(self):
+        """Coordinates of every model as a list of (n_atoms, 3) arrays, read once"""
+        universe = self.universe
+        with self._lock:
+            if self._frames is None:
+                self._frames = [ts.positions.copy() for ts in universe.trajectory]
+                self._built_bytes += sum(frame.nbytes for frame in self._frames)
+            return self._frames
+
+    @property
+    def nbytes(self):
+        """Approximate memory held: the source data plus the parts built so far"""
+        atoms = self._atoms
+        return sizeof(self.pdb_data) + (atoms.nbytes if atoms is not None else 0) + self._built_bytes
+
+    def get_residues(self):
+        return self.structure.get_residues()
+
+def _universe_from_atoms(mda, atoms):
+    """In-memory Universe with names, residues and chains from an AtomTable"""
+    from MDAnalysis.coordinates.memory import MemoryReader
+    first = atoms.take(atoms.models == atoms.models[0]) if len(atoms) else atoms
+    universe = mda.Universe.empty(len(first), n_residues=first.n_residues,
+                                  atom_resindex=first.residue_index, trajectory=True)
+    universe.add_TopologyAttr('name', first.names.astype(str))
+    universe.add_TopologyAttr('elements', first.elements.astype(str))
+    universe.add_TopologyAttr('chainIDs', first.chains.astype(str))
+    universe.add_TopologyAttr('resname', first.residue_names.astype(str))
+    universe.add_TopologyAttr('resid', first.residue_numbers.astype(int))
+    frames = [atoms.coords[atoms.models == model] for model in np.unique(atoms.models)]
+    frames = [coords for coords in frames if len(coords) == len(first)]
+    universe.load_new(np.stack(frames) if frames else np.zeros((1, 0, 3), dtype=np.float32),
+                      format=MemoryReader)
+    return universe
+
+def get_structure(pdb_data):
+    """Return the process-wide ParsedStructure for this structure data"""
+    key = structure_hash(pdb_data)
+    return STRUCTURE_CACHE.get_or_create(key, lambda: ParsedStructure(pdb_data, key))
@@ -0,0 +1,213 @@
+"""Structures read from local disk or uploads instead of RCSB.
+
+A StructureFile stands in for structure text everywhere the apps pass
+pdb_data. It is keyed by path, size and modification time rather than by
+hashing its contents, and the parsers read it incrementally: gzip files
+through streamed decompression, plain PDB/mmCIF line by line, and
+BinaryCIF through a memory map. So a file of hundreds of MB never becomes
+one Python string; only the compact atom columns stay in memory.
+
+Uploads are spooled to UPLOAD_DIR in chunks and then opened like any local
+file. Like the structure store, the directory is capped: after each upload,
+files not uploaded again for UPLOAD_MAX_AGE seconds are deleted, then the
+least recently uploaded ones until it fits in UPLOAD_MAX_BYTES. An upload is
+keyed by its content hash, so a session whose file was evicted spools it
+again and keeps every cached result. Local paths must lie under one of
+LOCAL_STRUCTURE_DIRS.
+
+Configuration (environment variables):
+    UPLOAD_DIR             where uploaded structures are written (default: ~/.cache/protein_mosaic/uploads)
+    UPLOAD_MAX_BYTES       size cap of the upload directory (default: 2 GiB)
+    UPLOAD_MAX_AGE         delete uploads not seen for this many seconds (default: 1 day)
+    LOCAL_STRUCTURE_DIRS   directories local paths may be read from, os.pathsep-separated
+                           (default: the working directory)
+"""
+import gzip
+import hashlib
+import io
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+
+# file extension (without .gz) -> structure format
+FORMATS = {
+    'pdb': 'pdb',
+    'ent': 'pdb',
+    'cif': 'cif',
+    'mmcif': 'cif',
+    'bcif': 'bcif',
+}
+UPLOAD_TYPES = sorted(FORMATS) + ['gz']
+UPLOAD_DIR = os.environ.get(
+    "UPLOAD_DIR", os.path.join(os.path.expanduser("~"), ".cache", "protein_mosaic", "uploads"))
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 2 * 1024**3))
+UPLOAD_MAX_AGE = float(os.environ.get("UPLOAD_MAX_AGE", 24 * 3600))
+UPLOAD_TMP_PREFIX = ".upload-"
+COPY_CHUNK = 1 << 20
+
+def local_structure_dirs():
+    dirs = os.environ.get("LOCAL_STRUCTURE_DIRS", "")
+    return [os.path.realpath(d) for d in dirs.split(os.pathsep) if d] or [os.path.realpath(os.getcwd())]
+
+def file_format(name):
+    """Structure format of a file name such as 1abc.pdb.gz or model.cif"""
+    name = name.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    fmt = FORMATS.get(name.rsplit('.', 1)[-1])
+    if fmt is None:
+        raise ValueError(f"{name}: not a structure file (expected one of "
+                         f"{', '.join('.' + ext for ext in FORMATS)}, optionally gzipped)")
+    return fmt
+
+def _map(f):
+    """Read-only memory map of an open file (b'' when it is empty)"""
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class StructureFile:
+    """A structure file on local disk, read incrementally and keyed by path, size and mtime
+
+    digest overrides that key, e.g. with the content hash of an upload.
+    """
+
+    def __init__(self, path, name=None, digest=None):
+        self.path = os.path.realpath(path)
+        self.name = name or os.path.basename(path)
+        self.format = file_format(self.path)
+        self.compressed = self.path.lower().endswith('.gz')
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.digest = digest or hashlib.sha256(f"{self.path}\0{self.size}\0{self.mtime_ns}".encode()).hexdigest()
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def open(self):
+        """Binary stream of the (decompressed) contents"""
+        return gzip.open(self.path, 'rb') if self.compressed else open(self.path, 'rb')
+
+    def lines(self):
+        """Text lines of the (decompressed) contents, read as they are consumed"""
+        with io.TextIOWrapper(self.open(), encoding='latin-1', newline=None) as f:
+            yield from f
+
+    def buffer(self):
+        """Whole (decompressed) contents, memory-mapped
+
+        Compressed files are first decompressed in chunks to an anonymous
+        temporary file, which lives as long as the map.
+        """
+        if self.compressed:
+            with tempfile.TemporaryFile() as f:
+                with self.open() as src:
+                    shutil.copyfileobj(src, f, COPY_CHUNK)
+                f.flush()
+                return _map(f)
+        with open(self.path, 'rb') as f:
+            return _map(f)
+
+    def copy_to(self, path):
+        """Write the (decompressed) contents to path in chunks"""
+        with self.open() as src, open(path, 'wb') as out:
+            shutil.copyfileobj(src, out, COPY_CHUNK)
+
+    def read(self):
+        """Whole contents, text for PDB/mmCIF and bytes for BinaryCIF (for tools that need a file's text)"""
+        with self.open() as f:
+            data = f.read()
+        return data if self.format == 'bcif' else data.decode('latin-1')
+
+    def __eq__(self, other):
+        return isinstance(other, StructureFile) and other.digest == self.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return f"StructureFile({self.path!r})"
+
+def open_local_structure(path, roots=None):
+    """StructureFile for a path under one of the allowed directories"""
+    real = os.path.realpath(os.path.expanduser(path))
+    roots = roots or local_structure_dirs()
+    if not any(os.path.commonpath([real, root]) == root for root in roots):
+        raise PermissionError(f"{path} is outside the allowed directories ({os.pathsep.join(roots)})")
+    if not os.path.isfile(real):
+        raise FileNotFoundError(f"{path} does not exist")
+    return StructureFile(real)
+
+def evict_uploads(directory=None, max_bytes=None, max_age=None, keep=()):
+    """Delete stale uploads, then least recently uploaded ones until the directory fits in max_bytes
+
+    Paths in keep are never deleted, nor are uploads still being spooled
+    unless they are stale (left behind by an interrupted upload).
+    """
+    directory = directory or UPLOAD_DIR
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    max_age = UPLOAD_MAX_AGE if max_age is None else max_age
+    entries = []
+    try:
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        entries.append((entry.path, entry.name, stat.st_size, stat.st_mtime))
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry[3])
+    total = sum(size for _, _, size, _ in entries)
+    stale_before = time.time() - max_age if max_age else None
+    for path, name, size, last_used in entries:
+        stale = stale_before is not None and last_used < stale_before
+        if total <= max_bytes and not stale:
+            break
+        if path in keep or (name.startswith(UPLOAD_TMP_PREFIX) and not stale):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def save_upload(fileobj, name, directory=None):
+    """Copy an uploaded file to the upload directory in chunks and open it
+
+    Files are named and keyed by content hash, so uploading the same file
+    twice reuses one copy (and every cached result computed from it). Each
+    upload then applies the directory's size cap and age limit.
+    """
+    directory = directory or UPLOAD_DIR
+    file_format(name)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=UPLOAD_TMP_PREFIX)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            fileobj.seek(0)
+            for chunk in iter(lambda: fileobj.read(COPY_CHUNK), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        safe_name = re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(name))
+        path = os.path.join(directory, f"{digest.hexdigest()[:16]}-{safe_name}")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)  # mark as recently uploaded for eviction
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    evict_uploads(directory, keep=(path,))
+    # the same bytes uploaded as another format parse differently
+    key = hashlib.sha256(f"{digest.hexdigest()}\0{file_format(name)}".encode()).hexdigest()
+    return StructureFile(path, name=name, digest=key)
@@ -0,0 +1,68 @@
+import time
+
+from cache import ANALYSIS, IMAGES, TEXT, LRUCache, MemoryBudget
+
+def make_cache(budget, namespace, ttl=None, name=None):
+    """LRUCache on budget whose entries cost exactly their length in bytes"""
+    return LRUCache(max_entries=100, namespace=namespace, ttl=ttl, name=name, sizeof=len, budget=budget)
+
+def test_namespace_quota_evicts_its_own_least_recently_used_entries():
+    budget = MemoryBudget(max_bytes=1000, quotas={TEXT: 30})
+    text = make_cache(budget, TEXT)
+    analysis = make_cache(budget, ANALYSIS)
+    analysis.put("kept", b"x" * 100)
+    text.put("a", b"x" * 10)
+    text.put("b", b"x" * 10)
+    text.put("c", b"x" * 10)
+    text.get("a")
+    text.put("d", b"x" * 10)
+
+    assert [key for key in "abcd" if key in text] == ["a", "c", "d"]
+    assert "kept" in analysis
+    assert budget.used(TEXT) == 30
+    assert text.stats()['evictions'] == 1
+
+def test_global_budget_evicts_least_recently_used_entry_of_any_namespace():
+    budget = MemoryBudget(max_bytes=100, quotas={})
+    text = make_cache(budget, TEXT)
+    images = make_cache(budget, IMAGES)
+    text.put("old", b"x" * 40)
+    images.put("older", b"x" * 40)
+    text.get("old")
+    images.put("new", b"x" * 40)
+
+    assert "older" not in images and "new" in images
+    assert "old" in text
+    assert budget.used() == 80
+
+def test_oversized_entry_is_not_stored():
+    budget = MemoryBudget(max_bytes=100, quotas={TEXT: 10})
+    text = make_cache(budget, TEXT)
+    text.put("big", b"x" * 11)
+
+    assert "big" not in text
+    assert budget.used() == 0
+
+def test_entries_expire_after_ttl():
+    budget = MemoryBudget(max_bytes=1000, quotas={})
+    text = make_cache(budget, TEXT, ttl=0.05)
+    text.put("a", b"x" * 10)
+    assert text.get("a") == b"x" * 10
+    time.sleep(0.1)
+
+    assert text.get("a") is None
+    assert text.stats()['expirations'] == 1
+    assert budget.used() == 0
+
+def test_stats_sum_caches_per_namespace():
+    budget = MemoryBudget(max_bytes=1000, quotas={TEXT: 500})
+    first = make_cache(budget, TEXT, name="first")
+    second = make_cache(budget, TEXT, name="second")
+    first.put("a", b"x" * 10)
+    second.put("b", b"x" * 20)
+    first.get("a")
+    second.get("missing")
+
+    row = next(row for row in budget.stats() if row['namespace'] == TEXT)
+    assert (row['entries'], row['bytes'], row['quota']) == (2, 30, 500)
+    assert (row['hits'], row['misses'], row['hit_rate']) == (1, 1, 0.5)
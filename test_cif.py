@@ -0,0 +1,141 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from cif import read_bcif, read_mmcif
+
+msgpack = pytest.importorskip("msgpack")
+
+MMCIF_TEXT = """data_1ABC
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_comp_id
+_atom_site.label_asym_id
+_atom_site.label_seq_id
+_atom_site.pdbx_PDB_ins_code
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.occupancy
+_atom_site.B_iso_or_equiv
+_atom_site.auth_seq_id
+_atom_site.auth_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_atom_id
+_atom_site.pdbx_PDB_model_num
+ATOM 1 N N ALA B 1 ? 11.104 6.134 -6.504 1.00 21.50 10 ALA A N 1
+ATOM 2 C CA ALA B 1 ? 11.639 6.071 -5.147 1.00 20.25 10 ALA A CA 1
+ATOM 3 C C ALA B 1 ? 13.134 5.756 -5.091 0.50 19.75 10 ALA A C 1
+HETATM 4 O O HOH C . ? 9.000 -1.250 12.000 1.00 35.00 101 HOH A O 1
+#
+"""
+
+# the same _atom_site rows, column by column
+ROWS = [line.split() for line in MMCIF_TEXT.splitlines() if line.startswith(("ATOM", "HETATM"))]
+ITEMS = [line.strip()[len("_atom_site."):] for line in MMCIF_TEXT.splitlines() if line.startswith("_atom_site.")]
+COLUMNS = {item: [row[k] for row in ROWS] for k, item in enumerate(ITEMS)}
+
+# BinaryCIF type codes
+INT8, INT16, INT32, UINT8, FLOAT64 = 1, 2, 3, 4, 33
+
+def byte_array(values, type_code, dtype):
+    return np.asarray(values, dtype=dtype).tobytes(), [{'kind': 'ByteArray', 'type': type_code}]
+
+def string_array(values):
+    """StringArray column; '?' and '.' become masked entries"""
+    unique = sorted({value for value in values if value not in ("?", ".")})
+    offsets = np.cumsum([0] + [len(value) for value in unique])
+    indices = [unique.index(value) if value in unique else -1 for value in values]
+    data, data_encoding = byte_array(indices, INT32, '<i4')
+    offset_data, offset_encoding = byte_array(offsets, INT32, '<i4')
+    return data, [{'kind': 'StringArray', 'dataEncoding': data_encoding, 'stringData': "".join(unique),
+                   'offsetEncoding': offset_encoding, 'offsets': offset_data}]
+
+def run_length_ints(values):
+    """RunLength, then ByteArray of the (value, count) pairs"""
+    pairs = []
+    for value in values:
+        if pairs and pairs[-2] == value:
+            pairs[-1] += 1
+        else:
+            pairs += [value, 1]
+    data, encoding = byte_array(pairs, INT32, '<i4')
+    return data, [{'kind': 'RunLength', 'srcType': INT32, 'srcSize': len(values)}] + encoding
+
+def fixed_point_coordinates(values, factor=1000):
+    """FixedPoint, Delta, IntegerPacking into 16 bits, then ByteArray, as RCSB encodes Cartn_*"""
+    ints = np.round(np.asarray(values, dtype=float) * factor).astype(np.int32)
+    deltas = np.diff(ints, prepend=ints[0])
+    data, encoding = byte_array(deltas, INT16, '<i2')
+    return data, [
+        {'kind': 'FixedPoint', 'factor': factor, 'srcType': FLOAT64},
+        {'kind': 'Delta', 'origin': int(ints[0]), 'srcType': INT32},
+        {'kind': 'IntegerPacking', 'byteCount': 2, 'isUnsigned': False, 'srcSize': len(ints)},
+    ] + encoding
+
+def interval_occupancy(values):
+    """IntervalQuantization of occupancy into 0..1 in 101 steps, then ByteArray"""
+    steps = np.round(np.asarray(values, dtype=float) * 100).astype(np.uint8)
+    data, encoding = byte_array(steps, UINT8, '<u1')
+    return data, [{'kind': 'IntervalQuantization', 'min': 0.0, 'max': 1.0, 'numSteps': 101,
+                   'srcType': FLOAT64}] + encoding
+
+def column(name, encoded):
+    values = COLUMNS[name]
+    masked = [{"?": 2, ".": 1}.get(value, 0) for value in values]
+    mask = None
+    if any(masked):
+        data, encoding = byte_array(masked, UINT8, '<u1')
+        mask = {'data': data, 'encoding': encoding}
+    data, encoding = encoded
+    return {'name': name, 'data': {'data': data, 'encoding': encoding}, 'mask': mask}
+
+def binary_cif():
+    numeric_ids = ('id', 'label_seq_id', 'auth_seq_id', 'pdbx_PDB_model_num')
+    columns = []
+    for name in ITEMS:
+        values = COLUMNS[name]
+        if name in numeric_ids:
+            encoded = run_length_ints([int(value) if value not in ("?", ".") else 0 for value in values])
+        elif name.startswith("Cartn_"):
+            encoded = fixed_point_coordinates(values)
+        elif name == "occupancy":
+            encoded = interval_occupancy(values)
+        elif name == "B_iso_or_equiv":
+            encoded = byte_array([float(value) for value in values], FLOAT64, '<f8')
+        else:
+            encoded = string_array(values)
+        columns.append(column(name, encoded))
+    document = {'version': '0.3.0', 'encoder': 'test', 'dataBlocks': [{'header': '1ABC', 'categories': [
+        {'name': '_atom_site', 'rowCount': len(ROWS), 'columns': columns}]}]}
+    return msgpack.packb(document, use_bin_type=True)
+
+def assert_same_columns(actual, expected):
+    assert actual.keys() == expected.keys()
+    for name in expected:
+        if expected[name].dtype.kind == 'S':
+            assert actual[name].tolist() == expected[name].tolist(), name
+        else:
+            np.testing.assert_allclose(actual[name], expected[name], atol=1e-3, err_msg=name)
+
+def test_binary_cif_decodes_to_the_same_columns_as_mmcif():
+    expected = read_mmcif(MMCIF_TEXT)
+    actual = read_bcif(binary_cif())
+
+    assert_same_columns(actual, expected)
+    assert actual['chain'].tolist() == [b'A'] * 4  # author chain, not label_asym_id
+    assert actual['resnum'].tolist() == [10, 10, 10, 101]
+    assert actual['icode'].tolist() == [b' '] * 4
+
+def test_gzipped_binary_cif_is_decompressed():
+    assert_same_columns(read_bcif(gzip.compress(binary_cif())), read_mmcif(MMCIF_TEXT))
+
+def test_binary_cif_without_atom_site_is_rejected():
+    document = {'dataBlocks': [{'header': '1ABC', 'categories': [{'name': '_entity', 'rowCount': 0, 'columns': []}]}]}
+    with pytest.raises(ValueError):
+        read_bcif(msgpack.packb(document, use_bin_type=True))
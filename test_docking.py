@@ -0,0 +1,63 @@
+import importlib
+import os
+
+import pytest
+
+from test_pdb_store import PDB_TEXT
+
+LIGAND_PDBQT = b"ROOT\nATOM      1  C   LIG A   1       0.000   0.000   0.000  0.00  0.00     0.000 C\nENDROOT\n"
+
+def write_stub(path, body):
+    path.write_text("#!/bin/sh\n" + body)
+    path.chmod(0o755)
+    return str(path)
+
+@pytest.fixture
+def docking(tmp_path, monkeypatch):
+    """docking reloaded against stub vina/obabel executables and an empty artifact cache
+
+    The vina stub prints its arguments to the job log and writes an empty pose file.
+    """
+    monkeypatch.setenv("VINA_BIN", write_stub(tmp_path / "vina", 'echo "$@"\necho ENDMDL > docked.pdbqt\n'))
+    monkeypatch.setenv("OBABEL_BIN", write_stub(tmp_path / "obabel", 'echo REMARK > "$3"\n'))
+    monkeypatch.setenv("DOCKING_CACHE_DIR", str(tmp_path / "cache"))
+    import docking
+    reloaded = importlib.reload(docking)
+    monkeypatch.setattr(reloaded, "default_workers", lambda: 4)
+    yield reloaded
+    monkeypatch.undo()
+    importlib.reload(docking)
+
+def vina_cpu(job):
+    args = job.stdout().split()
+    return int(args[args.index("--cpu") + 1])
+
+@pytest.mark.skipif(os.name != "posix", reason="stub executables are shell scripts")
+def test_lone_job_runs_vina_on_every_core(docking, tmp_path):
+    queue = docking.DockingQueue(root=str(tmp_path / "jobs"))
+    try:
+        job = queue.submit(PDB_TEXT, LIGAND_PDBQT, (0, 0, 0), (20, 20, 20))
+        job._future.result(timeout=30)
+    finally:
+        queue.shutdown()
+
+    assert job.status == docking.DONE, job.error
+    assert vina_cpu(job) == queue.cores == 4
+    assert queue.budget.free == queue.cores
+
+@pytest.mark.skipif(os.name != "posix", reason="stub executables are shell scripts")
+def test_repeated_seeded_run_is_restored_without_vina(docking, tmp_path):
+    queue = docking.DockingQueue(root=str(tmp_path / "jobs"))
+    try:
+        first = queue.submit(PDB_TEXT, LIGAND_PDBQT, (0, 0, 0), (20, 20, 20), seed=42)
+        first._future.result(timeout=30)
+        again = queue.submit(PDB_TEXT, LIGAND_PDBQT, (0, 0, 0), (20, 20, 20), seed=42)
+        other_box = queue.submit(PDB_TEXT, LIGAND_PDBQT, (1, 0, 0), (20, 20, 20), seed=42)
+        other_box._future.result(timeout=30)
+    finally:
+        queue.shutdown()
+
+    assert first.status == again.status == other_box.status == docking.DONE
+    assert not first.cached and again.cached and not other_box.cached
+    assert again._future is None and again.stdout() == first.stdout()
+    assert "Using cached receptor PDBQT" in other_box.stdout()
@@ -0,0 +1,78 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import HTTPClient
+
+BODY = b"HEADER    TEST ENTRY\nEND\n"
+ETAG = '"v1"'
+
+class RevalidatingHandler(BaseHTTPRequestHandler):
+    """/etag answers If-None-Match with 304; /flaky fails with 503 before succeeding"""
+    requests = []
+    failures = 2
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/flaky" and type(self).failures > 0:
+            type(self).failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/etag" and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.path == "/etag":
+            self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    RevalidatingHandler.requests = []
+    RevalidatingHandler.failures = 2
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RevalidatingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client():
+    client = HTTPClient(timeout=(2, 2), retries=3, backoff_factor=0)
+    yield client
+    client.close()
+
+def test_seen_response_is_revalidated_with_its_etag(server, client):
+    first = client.get(f"{server}/etag")
+    second = client.get(f"{server}/etag")
+
+    assert first.status_code == 200 and first.content == BODY
+    assert second is first
+    assert RevalidatingHandler.requests == [("/etag", None), ("/etag", ETAG)]
+
+def test_server_errors_are_retried(server, client):
+    response = client.get(f"{server}/flaky")
+
+    assert response.status_code == 200 and response.content == BODY
+    assert [path for path, _ in RevalidatingHandler.requests] == ["/flaky"] * 3
+
+def test_retries_give_up_with_the_last_error(server):
+    client = HTTPClient(timeout=(2, 2), retries=1, backoff_factor=0)
+    try:
+        response = client.get(f"{server}/flaky")
+    finally:
+        client.close()
+
+    assert response.status_code == 503
+    assert len(RevalidatingHandler.requests) == 2
@@ -0,0 +1,81 @@
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+PDB_TEXT = "ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00  0.00           N\nEND\n"
+
+class SlowPDBHandler(BaseHTTPRequestHandler):
+    """Serves one small PDB file after a delay, counting the requests it receives"""
+    hits = []
+    delay = 0.5
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        time.sleep(self.delay)
+        body = PDB_TEXT.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def slow_server():
+    SlowPDBHandler.hits = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowPDBHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def pdb_store(slow_server, tmp_path, monkeypatch):
+    """pdb_store reloaded against the slow server and an empty temporary store"""
+    monkeypatch.setenv("RCSB_DOWNLOAD_URL", f"http://127.0.0.1:{slow_server.server_port}")
+    monkeypatch.setenv("PDB_STORE_DIR", str(tmp_path / "pdb_store"))
+    monkeypatch.delenv("PDB_STORE_OFFLINE", raising=False)
+    import pdb_store
+    yield importlib.reload(pdb_store)
+    monkeypatch.undo()
+    importlib.reload(pdb_store)
+
+def test_concurrent_fetches_share_one_download(pdb_store):
+    callers = 12
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        results = list(pool.map(lambda _: pdb_store.fetch_structure("1abc"), range(callers)))
+
+    assert results == [PDB_TEXT] * callers
+    assert SlowPDBHandler.hits == ["/1ABC.pdb"]
+
+def test_stored_structure_is_not_downloaded_again(pdb_store):
+    pdb_store.fetch_structure("1abc")
+    fresh = pdb_store.PDBStore()
+
+    assert fresh.fetch("1abc").decode() == PDB_TEXT
+    assert SlowPDBHandler.hits == ["/1ABC.pdb"]
+
+@pytest.mark.parametrize("pdb_id", ["../../x", "1AB", "1abc/../../2ABC", "ABCD"])
+def test_invalid_pdb_id_is_rejected_before_touching_the_store(pdb_store, pdb_id):
+    with pytest.raises(ValueError):
+        pdb_store.fetch_best(pdb_id)
+
+    assert SlowPDBHandler.hits == []
+    assert not os.path.exists(pdb_store.PDB_STORE.root)
+
+def test_fetch_best_gives_up_at_its_deadline(pdb_store):
+    start = time.monotonic()
+    with pytest.raises(pdb_store.requests.Timeout):
+        pdb_store.fetch_best("1abc", timeout=0.1)
+
+    assert time.monotonic() - start < SlowPDBHandler.delay
+    assert pdb_store.fetch_best("1abc") == PDB_TEXT
+    assert SlowPDBHandler.hits == ["/1ABC.pdb"]
@@ -0,0 +1,69 @@
+import io
+import os
+import time
+
+import pytest
+
+import structure_files
+from test_pdb_store import PDB_TEXT
+
+def upload(tag):
+    """A PDB upload of UPLOAD_SIZE bytes, distinct per single-character tag"""
+    return io.BytesIO(f"REMARK {tag}\n{PDB_TEXT}".encode())
+
+UPLOAD_SIZE = len(upload("a").getvalue())
+
+def age(path, seconds):
+    """Pretend path was last uploaded seconds ago"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """Upload directory capped at two uploads"""
+    monkeypatch.setattr(structure_files, "UPLOAD_MAX_BYTES", 2 * UPLOAD_SIZE)
+    monkeypatch.setattr(structure_files, "UPLOAD_MAX_AGE", 3600)
+    return str(tmp_path / "uploads")
+
+def test_least_recently_uploaded_file_is_evicted_past_the_cap(upload_dir):
+    first = structure_files.save_upload(upload("a"), "a.pdb", upload_dir)
+    age(first.path, 30)
+    second = structure_files.save_upload(upload("b"), "b.pdb", upload_dir)
+    age(second.path, 20)
+    third = structure_files.save_upload(upload("c"), "c.pdb", upload_dir)
+
+    assert not first.exists()
+    assert second.exists() and third.exists()
+    assert sorted(os.listdir(upload_dir)) == sorted(os.path.basename(f.path) for f in (second, third))
+
+def test_uploading_again_refreshes_a_file(upload_dir):
+    first = structure_files.save_upload(upload("a"), "a.pdb", upload_dir)
+    age(first.path, 30)
+    second = structure_files.save_upload(upload("b"), "b.pdb", upload_dir)
+    age(second.path, 20)
+    again = structure_files.save_upload(upload("a"), "a.pdb", upload_dir)
+    structure_files.save_upload(upload("c"), "c.pdb", upload_dir)
+
+    assert again.path == first.path and again.digest == first.digest
+    assert first.exists() and not second.exists()
+
+def test_evicted_upload_is_spooled_again_under_the_same_key(upload_dir):
+    first = structure_files.save_upload(upload("a"), "a.pdb", upload_dir)
+    os.remove(first.path)
+    again = structure_files.save_upload(upload("a"), "a.pdb", upload_dir)
+
+    assert again.exists() and again.digest == first.digest
+
+def test_stale_uploads_and_interrupted_spools_are_deleted(upload_dir):
+    stale = structure_files.save_upload(upload("a"), "a.pdb", upload_dir)
+    age(stale.path, 7200)
+    spooling = os.path.join(upload_dir, structure_files.UPLOAD_TMP_PREFIX + "live")
+    interrupted = os.path.join(upload_dir, structure_files.UPLOAD_TMP_PREFIX + "dead")
+    for path in (spooling, interrupted):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+    age(interrupted, 7200)
+    fresh = structure_files.save_upload(upload("b"), "b.pdb", upload_dir)
+
+    assert not stale.exists() and not os.path.exists(interrupted)
+    assert fresh.exists() and os.path.exists(spooling)